@@ -4,8 +4,11 @@ CREATE TABLE IF NOT EXISTS customers (
   user_id              TEXT,
   first_name           TEXT,
   last_name            TEXT,
-  email_address        TEXT
+  email_address        TEXT,
+  row_hash             BIGINT
 );
+-- Columns added since the table was first released; no-ops on a new database.
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS row_hash BIGINT;
 
 CREATE TABLE IF NOT EXISTS addresses (
   address_id           BIGINT PRIMARY KEY,
@@ -16,8 +19,10 @@ CREATE TABLE IF NOT EXISTS addresses (
   city                 TEXT,
   state                TEXT,
   postal_code          TEXT,
-  country_code         TEXT
+  country_code         TEXT,
+  row_hash             BIGINT
 );
+ALTER TABLE addresses ADD COLUMN IF NOT EXISTS row_hash BIGINT;
 
 -- ─────────── Orders ───────────
 CREATE TABLE IF NOT EXISTS orders (
@@ -39,16 +44,29 @@ CREATE TABLE IF NOT EXISTS orders (
   currency_code        TEXT,
   channel              TEXT,
   comments             TEXT,
-  raw                  JSONB
+  raw_digest           BYTEA,   -- RAW_MODE=archive: key of the document in order_raw_archive
+  raw                  JSONB,
+  row_hash             BIGINT
 );
+ALTER TABLE orders
+  ADD COLUMN IF NOT EXISTS billing_address_id  BIGINT REFERENCES addresses(address_id),
+  ADD COLUMN IF NOT EXISTS shipping_address_id BIGINT REFERENCES addresses(address_id),
+  ADD COLUMN IF NOT EXISTS raw_digest          BYTEA,
+  ADD COLUMN IF NOT EXISTS row_hash            BIGINT;
 
 CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date_utc);
 CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(order_status, shipment_status);
+-- Incremental Parquet exports (etl/export.py) read the orders updated since their last run.
+CREATE INDEX IF NOT EXISTS idx_orders_last_updated ON orders(last_updated_utc);
+-- Joins from addresses (per-country / per-region revenue) find their orders through these.
+CREATE INDEX IF NOT EXISTS idx_orders_billing_address ON orders(billing_address_id);
+CREATE INDEX IF NOT EXISTS idx_orders_shipping_address ON orders(shipping_address_id);
 
 -- ─────────── Order line items ───────────
 CREATE TABLE IF NOT EXISTS order_line_items (
   internal_line_item_id BIGINT PRIMARY KEY,
   internal_order_id     BIGINT NOT NULL REFERENCES orders(internal_order_id) ON DELETE CASCADE,
+  order_date_utc        TIMESTAMPTZ NOT NULL,   -- the order's; the partition key with PARTITIONS=month
   sku                   TEXT,
   product_name          TEXT,
   item_name             TEXT,
@@ -63,20 +81,166 @@ CREATE TABLE IF NOT EXISTS order_line_items (
   subtotal              NUMERIC(12,2),
   total_tax             NUMERIC(12,2),
   total                 NUMERIC(12,2),
-  is_preorder           BOOLEAN
+  is_preorder           BOOLEAN,
+  row_hash              BIGINT
 );
+ALTER TABLE order_line_items
+  ADD COLUMN IF NOT EXISTS order_date_utc TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS row_hash       BIGINT;
+UPDATE order_line_items li SET order_date_utc = o.order_date_utc FROM orders o
+WHERE li.order_date_utc IS NULL AND o.internal_order_id = li.internal_order_id;
+ALTER TABLE order_line_items ALTER COLUMN order_date_utc SET NOT NULL;
 
 CREATE INDEX IF NOT EXISTS idx_line_items_order ON order_line_items(internal_order_id);
 CREATE INDEX IF NOT EXISTS idx_line_items_sku ON order_line_items(sku);
 
 -- ─────────── Order-level taxes ───────────
 CREATE TABLE IF NOT EXISTS order_taxes (
-  internal_order_id     BIGINT NOT NULL REFERENCES orders(internal_order_id) ON DELETE CASCADE,
+  internal_order_id     BIGINT NOT NULL,
+  internal_tax_rate_id  BIGINT NOT NULL,
+  tax_amount            NUMERIC(12,2),
+  tax_rate              NUMERIC(7,4),
+  tax_type              TEXT,
+  backend_name          TEXT,
+  public_tax_name       TEXT,
+  row_hash              BIGINT,
+  PRIMARY KEY (internal_order_id, internal_tax_rate_id)
+);
+ALTER TABLE order_taxes ADD COLUMN IF NOT EXISTS row_hash BIGINT;
+CREATE INDEX IF NOT EXISTS idx_order_taxes_rate ON order_taxes(internal_tax_rate_id);
+
+-- ─────────── Line-item taxes ───────────
+-- internal_order_id is carried along so VAT per order/day is one indexed join away.
+CREATE TABLE IF NOT EXISTS order_line_item_taxes (
+  internal_line_item_id BIGINT NOT NULL,
   internal_tax_rate_id  BIGINT NOT NULL,
+  internal_order_id     BIGINT NOT NULL,
   tax_amount            NUMERIC(12,2),
   tax_rate              NUMERIC(7,4),
   tax_type              TEXT,
   backend_name          TEXT,
   public_tax_name       TEXT,
+  row_hash              BIGINT,
+  PRIMARY KEY (internal_line_item_id, internal_tax_rate_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_line_item_taxes_order ON order_line_item_taxes(internal_order_id);
+CREATE INDEX IF NOT EXISTS idx_line_item_taxes_rate ON order_line_item_taxes(internal_tax_rate_id);
+
+-- ─────────── Shipping taxes ───────────
+CREATE TABLE IF NOT EXISTS order_shipping_taxes (
+  internal_order_id     BIGINT NOT NULL,
+  internal_tax_rate_id  BIGINT NOT NULL,
+  tax_amount            NUMERIC(12,2),
+  tax_rate              NUMERIC(7,4),
+  tax_type              TEXT,
+  backend_name          TEXT,
+  public_tax_name       TEXT,
+  row_hash              BIGINT,
   PRIMARY KEY (internal_order_id, internal_tax_rate_id)
-);
\ No newline at end of file
+);
+
+-- ─────────── Order payments ───────────
+CREATE TABLE IF NOT EXISTS order_payments (
+  internal_order_payment_id BIGINT PRIMARY KEY,
+  internal_order_id         BIGINT NOT NULL,
+  external_order_payment_id TEXT,
+  payment_type              TEXT,
+  payment_type_description  TEXT,
+  payment_id                BIGINT,
+  amount                    NUMERIC(12,2),
+  amount_authorized         NUMERIC(12,2),
+  amount_captured           NUMERIC(12,2),
+  status                    TEXT,
+  row_hash                  BIGINT
+);
+
+CREATE INDEX IF NOT EXISTS idx_payments_order ON order_payments(internal_order_id);
+CREATE INDEX IF NOT EXISTS idx_payments_type ON order_payments(payment_type, status);
+
+-- Foreign keys of the tax and payment tables on orders and line items, under the names
+-- Postgres gives inline REFERENCES. Partitioned orders (PARTITIONS=month) only have
+-- (id, order_date_utc) keys, which these tables can't reference, so they are left out then.
+DO $$
+DECLARE fk text[];
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'orders'::regclass) THEN
+    RETURN;
+  END IF;
+  FOREACH fk SLICE 1 IN ARRAY ARRAY[
+    ['order_taxes',           'internal_order_id',     'orders'],
+    ['order_line_item_taxes', 'internal_line_item_id', 'order_line_items'],
+    ['order_line_item_taxes', 'internal_order_id',     'orders'],
+    ['order_shipping_taxes',  'internal_order_id',     'orders'],
+    ['order_payments',        'internal_order_id',     'orders']
+  ] LOOP
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = fk[1]::regclass AND conname = fk[1] || '_' || fk[2] || '_fkey') THEN
+      EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I FOREIGN KEY (%I) REFERENCES %I (%I) ON DELETE CASCADE',
+                     fk[1], fk[1] || '_' || fk[2] || '_fkey', fk[2], fk[3], fk[2]);
+    END IF;
+  END LOOP;
+END $$;
+
+-- ─────────── Raw order archive (RAW_MODE=archive) ───────────
+-- Content-addressed: one row per distinct source document, never rewritten.
+CREATE TABLE IF NOT EXISTS order_raw_archive (
+  digest               BYTEA PRIMARY KEY,   -- blake2b-128 of the order JSON
+  body                 BYTEA NOT NULL,      -- zlib-compressed order JSON
+  archived_at          TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- ─────────── Rollups (ROLLUPS) ───────────
+-- Maintained by the loaders from each batch's writes; `python -m etl.rollups verify` checks them.
+CREATE TABLE IF NOT EXISTS daily_revenue (
+  day                  DATE PRIMARY KEY,    -- UTC day of order_date_utc
+  orders               BIGINT NOT NULL DEFAULT 0,
+  revenue              NUMERIC(16,2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS sku_quantities (
+  sku                  TEXT PRIMARY KEY,
+  line_items           BIGINT NOT NULL DEFAULT 0,
+  quantity             NUMERIC(16,3) NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_sku_quantities_quantity ON sku_quantities(quantity DESC);
+
+-- ─────────── ETL bookkeeping ───────────
+CREATE TABLE IF NOT EXISTS etl_state (
+  source               TEXT PRIMARY KEY,
+  high_water_mark      TIMESTAMPTZ,
+  updated_at           TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Orders rejected by validation, with the reason and the record as read.
+CREATE TABLE IF NOT EXISTS etl_dead_letters (
+  id                   BIGSERIAL PRIMARY KEY,
+  source               TEXT NOT NULL,
+  path                 TEXT,
+  error_class          TEXT NOT NULL,
+  reason               TEXT NOT NULL,
+  raw                  TEXT,
+  created_at           TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Indexes, foreign keys and rollups a running (or interrupted) BACKFILL dropped, to be rebuilt.
+CREATE TABLE IF NOT EXISTS etl_backfill_ddl (
+  kind                 TEXT NOT NULL,       -- 'index', 'foreign key' or 'rollup'
+  table_name           TEXT NOT NULL,
+  name                 TEXT NOT NULL,
+  definition           TEXT NOT NULL,
+  dropped_at           TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (kind, table_name, name)
+);
+
+-- Progress of an interrupted chunked run (COMMIT_EVERY); cleared when the run completes.
+CREATE TABLE IF NOT EXISTS etl_checkpoints (
+  source               TEXT NOT NULL,
+  path                 TEXT NOT NULL,
+  file_size            BIGINT NOT NULL,
+  records              BIGINT NOT NULL,
+  finished             BOOLEAN NOT NULL DEFAULT FALSE,
+  updated_at           TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (source, path)
+);
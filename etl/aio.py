@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import shlex
+from collections import Counter
+
+from etl import config, rollups
+from etl.cache import dimension_caches, cache_stats
+from etl.db import get_conn
+from etl.deadletter import COLUMNS as LETTER_COLUMNS, counts as letter_counts, letters, write_file
+from etl.metrics import METRICS
+from etl.partitions import ensure as ensure_partitions, pin as pin_partitions
+from etl.pipeline import batch_months, parsed_batches, tally, written
+from etl.transform import decompose
+from etl.loaders import (
+    customers, addresses, orders, line_items, order_taxes, line_item_taxes, shipping_taxes, payments, raw_archive,
+)
+from etl.loaders.engine import counted_statement, with_fingerprint
+
+logger = logging.getLogger("etl")
+
+# batch attribute -> (table, columns, ON CONFLICT clause), as used by the psycopg2 loaders
+TARGETS = {
+    "customers": ("customers", customers.COLUMNS, customers.ON_CONFLICT),
+    "addresses": ("addresses", addresses.COLUMNS, addresses.ON_CONFLICT),
+    "orders": ("orders", orders.COLUMNS, orders.ON_CONFLICT),
+    "line_items": ("order_line_items", line_items.COLUMNS, line_items.ON_CONFLICT),
+    "order_taxes": ("order_taxes", order_taxes.COLUMNS, order_taxes.ON_CONFLICT),
+    "line_item_taxes": ("order_line_item_taxes", line_item_taxes.COLUMNS, line_item_taxes.ON_CONFLICT),
+    "shipping_taxes": ("order_shipping_taxes", shipping_taxes.COLUMNS, shipping_taxes.ON_CONFLICT),
+    "payments": ("order_payments", payments.COLUMNS, payments.ON_CONFLICT),
+    "raw_archive": ("order_raw_archive", raw_archive.COLUMNS, raw_archive.ON_CONFLICT),
+}
+# PARTITIONS=month: attr -> (ON CONFLICT clause, key)
+PARTITIONED = {
+    "orders": (orders.PARTITIONED_ON_CONFLICT, orders.PARTITIONED_KEY),
+    "line_items": (line_items.PARTITIONED_ON_CONFLICT, line_items.PARTITIONED_KEY),
+}
+DIMENSIONS = ("customers", "addresses")
+FACTS = ("raw_archive", "orders", "line_items", "order_taxes", "line_item_taxes", "shipping_taxes", "payments")
+
+_TYPES = """
+SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+WHERE attrelid = $1::regclass AND attnum > 0 AND NOT attisdropped
+"""
+
+
+def _text(v):
+    if v is None or isinstance(v, str):
+        return v
+    if isinstance(v, bytes):
+        return "\\x" + v.hex()
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    return str(v)
+
+def _server_settings():
+    """libpq's PGOPTIONS ("-c name=value ...") as asyncpg server settings."""
+    args = shlex.split(os.getenv("PGOPTIONS", ""))
+    return dict(a.split("=", 1) for a in args if "=" in a and a != "-c")
+
+
+class AsyncLoader:
+    """Writes RowBatches over an asyncpg connection pool; reusable across many batches.
+
+    Every batch commits on its own: customers and addresses are upserted
+    concurrently on separate pooled connections, then the facts (and dead
+    letters) go in one transaction in FK order. Rows travel by binary COPY
+    into a per-connection temp table and are merged with the same
+    ON CONFLICT statements as the psycopg2 engines, prepared once per
+    connection.
+    """
+
+    def __init__(self, caches=None):
+        self.caches = caches or {}
+        self.pool = None
+        self._statements = {}
+
+    async def start(self):
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("asyncpg is required for LOAD_ENGINE=asyncpg")
+        c = config.DB_CONN
+        self.pool = await asyncpg.create_pool(
+            database=c["dbname"], user=c["user"], password=c["password"], host=c["host"], port=int(c["port"]),
+            min_size=len(DIMENSIONS), max_size=max(config.POOL_SIZE, len(DIMENSIONS)),
+            server_settings=_server_settings(), init=self._init_connection,
+        )
+        async with self.pool.acquire() as conn:
+            for attr, (table, columns, on_conflict) in TARGETS.items():
+                key = None
+                if config.PARTITIONS == "month" and attr in PARTITIONED:
+                    on_conflict, key = PARTITIONED[attr]
+                types = dict(await conn.fetch(_TYPES, table))
+                casts = ", ".join(f"{c}::{types[c]}" for c in columns)
+                self._statements[attr] = counted_statement(
+                    table, columns, on_conflict, f"SELECT {casts} FROM _astg_{table}", key, rollups.for_table(table),
+                )
+        return self
+
+    @staticmethod
+    async def _init_connection(conn):
+        for table, columns, _ in TARGETS.values():
+            await conn.execute(
+                f"CREATE TEMP TABLE _astg_{table} ({', '.join(f'{c} text' for c in columns)}) ON COMMIT DELETE ROWS"
+            )
+        if config.ROLLUPS:
+            await conn.execute(rollups.temp_tables())
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _upsert(self, conn, attr, rows):
+        """Upsert in the connection's open transaction; returns an outcome Counter."""
+        table, columns, _ = TARGETS[attr]
+        if not rows:
+            return Counter(inserted=0, updated=0, unchanged=0)
+        if columns[-1] == "row_hash":
+            rows = with_fingerprint(rows)
+        await conn.copy_records_to_table(
+            f"_astg_{table}", records=[tuple(map(_text, r)) for r in rows], columns=columns,
+        )
+        inserted, written = await conn.fetchrow(self._statements[attr])
+        return Counter(inserted=inserted, updated=written - inserted, unchanged=len(rows) - written)
+
+    async def _dimension(self, attr, rows):
+        cache = self.caches.get(attr)
+        fresh = cache.filter(rows) if cache is not None else rows
+        with METRICS.stage(f"load.{attr}", rows=len(fresh)):
+            async with self.pool.acquire() as conn, conn.transaction():
+                counts = tally(attr, await self._upsert(conn, attr, fresh))
+        counts[f"{attr}.unchanged"] += len(rows) - len(fresh)
+        if cache is not None:
+            cache.remember(fresh)
+        return counts
+
+    async def load(self, rows, path=None, rejects=()):
+        """Write one RowBatch (plus its rejects) and return the per-table outcome counts."""
+        counts = Counter()
+        for c in await asyncio.gather(*(self._dimension(a, getattr(rows, a)) for a in DIMENSIONS)):
+            counts.update(c)
+        async with self.pool.acquire() as conn, conn.transaction():
+            for attr in FACTS:
+                if attr == "raw_archive" and not rows.raw_archive:
+                    continue
+                with METRICS.stage(f"load.{attr}", rows=len(getattr(rows, attr))):
+                    counts.update(tally(attr, await self._upsert(conn, attr, getattr(rows, attr))))
+            if config.ROLLUPS and written(counts, ("orders", "line_items")):
+                with METRICS.stage("rollups"):
+                    await conn.execute(rollups.flush_statement())
+            if rejects:
+                with METRICS.stage("quarantine", rows=len(rejects)):
+                    dead = letters(path, rejects)
+                    if config.DEAD_LETTER_PATH:
+                        write_file(dead)
+                    else:
+                        await conn.copy_records_to_table("etl_dead_letters", records=dead, columns=LETTER_COLUMNS)
+                counts.update(letter_counts(rejects))
+        return counts
+
+
+async def _load_paths(paths, changes, cur, caches):
+    totals = Counter()
+    loader = await AsyncLoader(caches).start()
+    try:
+        for path in paths:
+            for _, batch, rejects, rows in parsed_batches(path, 0, changes is None):
+                if config.PARTITIONS == "month":
+                    ensure_partitions(cur, batch_months(batch, rows))
+                if rows is None:
+                    with METRICS.stage("filter", rows=len(batch)):
+                        batch = changes(cur, batch)
+                    with METRICS.stage("transform", rows=len(batch)):
+                        rows = decompose(batch)
+                if config.PARTITIONS == "month":
+                    pin_partitions(cur, rows)
+                    # New partitions lock orders until this connection commits.
+                    cur.connection.commit()
+                totals.update(await loader.load(rows, path, rejects))
+    finally:
+        await loader.close()
+    return totals
+
+def load_async(paths, changes=None):
+    """Load `paths` with the asyncpg engine, committing batch by batch.
+
+    A psycopg2 connection is still used for the incremental lookups, the
+    dimension cache warm-up and the run's bookkeeping.
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        caches = dimension_caches(cur)
+        conn.commit()
+        totals = asyncio.run(_load_paths(paths, changes, cur, caches))
+        totals.update(cache_stats(caches))
+    return totals
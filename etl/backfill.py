@@ -0,0 +1,216 @@
+"""Bulk mode for cold backfills (BACKFILL=auto|on).
+
+    python -m etl.backfill restore     # put back what an interrupted backfill dropped
+
+Before the load, the secondary indexes and foreign keys of the loaded tables
+are dropped; primary keys and unique constraints stay, because the upserts'
+ON CONFLICT needs them. Their definitions are saved in etl_backfill_ddl first,
+in a committed transaction of their own. After the load, whether it succeeded
+or not, the indexes are rebuilt in parallel over BACKFILL_JOBS connections,
+the foreign keys are re-added (which validates them) and the tables are
+analyzed. If the process dies before that, the next run, whatever its
+BACKFILL, or `restore`, rebuilds what etl_backfill_ddl still lists.
+
+During a backfill the values engine is swapped for copy, and the rollups
+are recomputed once at the end instead of being maintained batch by batch.
+"""
+import argparse
+import logging
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from etl import config, rollups
+from etl.metrics import METRICS
+
+logger = logging.getLogger("etl")
+
+MODES = ("off", "auto", "on")
+TABLES = (
+    "customers", "addresses", "orders", "order_line_items", "order_taxes",
+    "order_line_item_taxes", "order_shipping_taxes", "order_payments", "order_raw_archive",
+)
+# Session-level pg_advisory_lock key, held for the whole backfill.
+_LOCK = 6_540_214_810
+
+_OURS = "SELECT oid FROM pg_class WHERE relname = ANY(%(tables)s) AND relnamespace = current_schema()::regnamespace"
+_INDEXES = f"""
+SELECT t.relname, c.relname, pg_get_indexdef(c.oid) FROM pg_index x
+JOIN pg_class c ON c.oid = x.indexrelid JOIN pg_class t ON t.oid = x.indrelid
+WHERE x.indrelid IN ({_OURS}) AND NOT x.indisunique
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = c.oid)
+ORDER BY 1, 2
+"""
+_FOREIGN_KEYS = f"""
+SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint
+WHERE contype = 'f' AND conparentid = 0 AND (conrelid IN ({_OURS}) OR confrelid IN ({_OURS}))
+ORDER BY 1, 2
+"""
+_SAVE = "INSERT INTO etl_backfill_ddl (kind, table_name, name, definition) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING"
+
+
+def _index_definition(definition):
+    # Parent indexes of partitioned tables come back as "ON ONLY", which would skip the partitions.
+    return definition.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1).replace(" ON ONLY ", " ON ", 1)
+
+def _pending(cur):
+    cur.execute("SELECT kind, table_name, name, definition FROM etl_backfill_ddl ORDER BY kind, table_name, name")
+    return cur.fetchall()
+
+def drop(cur):
+    """Save, then drop, the secondary indexes and foreign keys of TABLES; returns how many of each."""
+    tables = {"tables": list(TABLES)}
+    cur.execute(_INDEXES, tables)
+    indexes = cur.fetchall()
+    cur.execute(_FOREIGN_KEYS, tables)
+    foreign_keys = cur.fetchall()
+    for table, name, definition in indexes:
+        cur.execute(_SAVE, ("index", table, name, _index_definition(definition)))
+    for table, name, definition in foreign_keys:
+        cur.execute(_SAVE, ("foreign key", table, name, definition))
+    if config.ROLLUPS:
+        for r in rollups.ROLLUPS:
+            cur.execute(_SAVE, ("rollup", r.name, r.name, r.recompute()))
+    cur.connection.commit()
+
+    with METRICS.stage("backfill.drop"):
+        for table, name, _ in foreign_keys:
+            cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+        if indexes:
+            cur.execute("DROP INDEX " + ", ".join(f'"{n}"' for _, n, _ in indexes))
+    cur.connection.commit()
+    return len(indexes), len(foreign_keys)
+
+def _build(definition):
+    from etl.db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(definition)
+
+def restore(conn, jobs=None):
+    """Rebuild everything etl_backfill_ddl lists, then analyze TABLES; returns how many entries."""
+    with conn.cursor() as cur:
+        pending = _pending(cur)
+        if not pending:
+            return 0
+        by_kind = {}
+        for kind, table, name, definition in pending:
+            by_kind.setdefault(kind, []).append((table, name, definition))
+
+        with METRICS.stage("backfill.indexes", rows=len(by_kind.get("index", ()))):
+            with ThreadPoolExecutor(jobs or config.BACKFILL_JOBS) as pool:
+                list(pool.map(_build, (d for _, _, d in by_kind.get("index", ()))))
+        with METRICS.stage("backfill.foreign_keys", rows=len(by_kind.get("foreign key", ()))):
+            for table, name, definition in by_kind.get("foreign key", ()):
+                cur.execute("SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s", (table, name))
+                if cur.fetchone() is None:
+                    cur.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+        with METRICS.stage("rollups"):
+            for r in rollups.ROLLUPS:
+                if any(name == r.name for _, name, _ in by_kind.get("rollup", ())):
+                    r.rebuild(cur)
+        cur.execute("DELETE FROM etl_backfill_ddl")
+        conn.commit()
+
+    with METRICS.stage("backfill.analyze"):
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_OURS.replace("SELECT oid", "SELECT relname"), {"tables": list(TABLES)})
+                names = [n for (n,) in cur.fetchall()]
+                cur.execute(f"ANALYZE {', '.join(names)}")
+        finally:
+            conn.autocommit = False
+    return len(pending)
+
+def restore_interrupted():
+    """Finish the restore of a backfill whose process died; a no-op unless one did.
+
+    Every run calls this, so the usual case costs one query.
+    """
+    from psycopg2 import errors
+    from etl.db import connect
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SELECT 1 FROM etl_backfill_ddl LIMIT 1")
+            except errors.UndefinedTable:  # a schema from before BACKFILL
+                return 0
+            if cur.fetchone() is None:
+                return 0
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_LOCK,))
+            if not cur.fetchone()[0]:
+                logger.warning("A backfill is running; its indexes and foreign keys are not rebuilt yet")
+                return 0
+        logger.warning("Restoring the indexes and foreign keys of an interrupted backfill")
+        return restore(conn)
+    finally:
+        conn.close()
+
+
+def _terminate(signum, frame):
+    raise SystemExit(128 + signum)
+
+@contextmanager
+def backfill(mode):
+    """Run the body as a backfill (see the module docstring); yields whether it is one.
+
+    `auto` backfills only into an empty orders table.
+    """
+    from etl.db import connect
+    if mode not in MODES:
+        raise ValueError(f"Unknown BACKFILL {mode!r}; expected one of {MODES}")
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('etl_backfill_ddl') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                raise ValueError("BACKFILL needs the etl_backfill_ddl table; apply docs/data_model.sql")
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_LOCK,))
+            if not cur.fetchone()[0]:
+                raise RuntimeError("Another backfill is running")
+            if restore(conn):
+                logger.warning("Restored the indexes and foreign keys of an interrupted backfill")
+            cur.execute("SELECT EXISTS (SELECT 1 FROM orders)")
+            if mode == "auto" and cur.fetchone()[0]:
+                logger.info("orders is not empty; loading without BACKFILL")
+                conn.commit()
+                yield False
+                return
+            indexes, foreign_keys = drop(cur)
+        logger.info("Backfill: dropped %s indexes and %s foreign keys until the load ends", indexes, foreign_keys)
+
+        engine, maintain = config.LOAD_ENGINE, config.ROLLUPS
+        if engine == "values":
+            config.LOAD_ENGINE = "copy"
+        config.ROLLUPS = False
+        previous = signal.signal(signal.SIGTERM, _terminate)
+        try:
+            yield True
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            config.LOAD_ENGINE, config.ROLLUPS = engine, maintain
+            conn.rollback()
+            logger.info("Backfill: rebuilding indexes and foreign keys")
+            try:
+                restore(conn)
+            except Exception:
+                logger.exception("Backfill: the rebuild failed; fix the cause and run `python -m etl.backfill restore`")
+                raise
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("restore", help="rebuild the indexes and foreign keys an interrupted backfill dropped")
+    ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    restored = restore_interrupted()
+    logger.info("Restored %s indexes, foreign keys and rollups", restored)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""End-to-end ETL benchmark on synthetic orders.
+
+    python -m etl.bench --sizes 10000,100000,1000000 --save bench.json
+    python -m etl.bench --sizes 10000 --baseline bench.json
+
+Every size runs `etl.main.run` in a fresh process against a scratch schema
+(BENCH_SCHEMA, default etl_bench) of the configured database, so peak RSS is
+per run and existing tables are left alone. Stage times come from the run's
+metrics (etl.metrics). Cold-start time of the CLI is measured too and checked
+against --startup-budget. With --codecs, reading and writing each size's
+orders is also timed with every installed JSON codec (etl.codec); with
+--queries, revenue per country and per city, read out of orders.raw and
+joined through the orders' address links.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+
+from etl import synth
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SCHEMA_PATH = REPO_ROOT / "docs" / "data_model.sql"
+# Higher is better for these; lower is better for everything else compared.
+THROUGHPUT = ("rows_per_sec", "orders_per_sec")
+COMPARED = THROUGHPUT + ("peak_rss_mb", "bytes_per_order")
+# Address queries (--queries), each as read out of orders.raw and as a join through the address
+# links; the raw form needs RAW_MODE=full.
+ADDRESS_QUERIES = {
+    "country_revenue": (
+        "SELECT raw->'ShippingAddress'->>'CountryCode', sum(order_total) FROM orders GROUP BY 1",
+        "SELECT a.country_code, sum(o.order_total) FROM orders o "
+        "JOIN addresses a ON a.address_id = o.shipping_address_id GROUP BY 1",
+    ),
+    "city_revenue": (
+        "SELECT sum(order_total) FROM orders WHERE raw->'ShippingAddress'->>'City' = 'Odense'",
+        "SELECT sum(o.order_total) FROM orders o "
+        "JOIN addresses a ON a.address_id = o.shipping_address_id WHERE a.city = 'Odense'",
+    ),
+}
+
+
+def _peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+def _etl_child(env):
+    """Run in a fresh process: `etl.main.run` with `env` applied before etl is imported."""
+    os.environ.update(env)
+    import logging
+    from etl.loaders.engine import OUTCOMES
+    from etl.main import run
+    from etl.metrics import METRICS
+
+    logging.getLogger("etl").setLevel(logging.WARNING)
+    start = time.perf_counter()
+    totals = run()
+    seconds = time.perf_counter() - start
+    stages = {}
+    for name, rec in METRICS.stages.items():
+        # load.<table> / settle.<table> roll up into one stage each
+        stage = name.partition(".")[0]
+        stages[stage] = stages.get(stage, 0.0) + rec["wall_s"]
+    return {
+        "seconds": seconds,
+        "rows": sum(v for k, v in totals.items() if k.rpartition(".")[2] in OUTCOMES),
+        "bytes_sent": sum(rec["bytes_sent"] for rec in METRICS.stages.values()),
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": stages,
+    }
+
+def _in_child(env):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_etl_child, env).result()
+
+
+def startup(runs=5):
+    """Best-of-`runs` cold start of a bare interpreter and of one that imports the CLI.
+
+    `import_s`, the difference, is what the ETL itself adds to every container start.
+    """
+    def best(code):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True)
+            times.append(time.perf_counter() - start)
+        return min(times)
+    interpreter, cli = best("pass"), best("import etl.main")
+    return {"interpreter_s": round(interpreter, 4), "cli_s": round(cli, 4), "import_s": round(max(cli - interpreter, 0), 4)}
+
+
+def reset_schema(schema):
+    from etl.db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}; SET search_path TO {schema};")
+        cur.execute(SCHEMA_PATH.read_text(encoding="utf-8"))
+
+def orders_storage_mb(schema):
+    """On-disk size of the orders table (all partitions) and the raw archive, TOAST and indexes included."""
+    from etl.db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT sum(pg_total_relation_size(t.rel)) FROM unnest(%s::regclass[]) r(rel), "
+            "LATERAL (SELECT relid FROM pg_partition_tree(r.rel) UNION SELECT r.rel) t(rel)",
+            ([f"{schema}.orders", f"{schema}.order_raw_archive"],),
+        )
+        return round(float(cur.fetchone()[0]) / (1024 * 1024), 2)  # sum() of bigints is numeric
+
+def query_costs(schema, runs=3):
+    """Planner cost and best-of-`runs` execution ms of each ADDRESS_QUERIES form."""
+    from etl.db import get_conn
+    costs = {}
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {schema}; ANALYZE orders; ANALYZE addresses")
+        for name, forms in ADDRESS_QUERIES.items():
+            for form, sql in zip(("raw", "join"), forms):
+                plans = []
+                for _ in range(runs):
+                    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql)
+                    plans.append(cur.fetchone()[0][0])
+                costs[f"{name}.{form}_cost"] = plans[0]["Plan"]["Total Cost"]
+                costs[f"{name}.{form}_ms"] = round(min(p["Execution Time"] for p in plans), 2)
+    return costs
+
+def input_file(workdir, size, seed):
+    """Generate (or reuse) the input for `size` orders; returns (path, generate seconds or None)."""
+    path = Path(workdir) / f"orders-{size}-seed{seed}.json"
+    if path.exists():
+        return path, None
+    Path(workdir).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    tmp = path.with_suffix(".tmp")
+    synth.write(tmp, synth.generate(size, seed))
+    tmp.rename(path)
+    return path, time.perf_counter() - start
+
+def bench_size(size, seed, workdir, schema, env=None, queries=False):
+    path, generated = input_file(workdir, size, seed)
+    reset_schema(schema)
+    etl = _in_child(dict(env or {}, INPUT_PATH=str(path), PGOPTIONS=f"-c search_path={schema}"))
+    stages = dict(etl["stages"], etl=etl["seconds"])
+    if generated is not None:
+        stages["generate"] = generated
+    return {
+        "orders": size,
+        "rows": etl["rows"],
+        "seconds": round(etl["seconds"], 3),
+        "rows_per_sec": round(etl["rows"] / etl["seconds"], 1),
+        "orders_per_sec": round(size / etl["seconds"], 1),
+        "bytes_per_order": round(etl["bytes_sent"] / size),
+        "orders_storage_mb": orders_storage_mb(schema),
+        "peak_rss_mb": etl["peak_rss_mb"],
+        "stages": {k: round(v, 3) for k, v in stages.items()},
+        **({"queries": query_costs(schema)} if queries else {}),
+    }
+
+
+def codec_times(path):
+    """Seconds per installed JSON codec to read the orders of `path` (whole, and typed) and write them back."""
+    from etl import codec, config
+    from etl.reader import iter_orders
+    saved = config.JSON_CODEC, config.JSON_TYPED, config.RAW_MODE
+    times = {}
+    try:
+        for name in codec.available():
+            config.JSON_CODEC, config.JSON_TYPED, config.RAW_MODE = name, False, "none"
+            start = time.perf_counter()
+            orders = list(iter_orders(path))
+            parsed = time.perf_counter()
+            dumps = codec.get(name).dumps
+            for order in orders:
+                dumps(order)
+            serialized = time.perf_counter()
+            config.JSON_TYPED = True
+            orders = list(iter_orders(path))
+            times[name] = {"parse_s": round(parsed - start, 3), "serialize_s": round(serialized - parsed, 3),
+                           "parse_typed_s": round(time.perf_counter() - serialized, 3)}
+    finally:
+        config.JSON_CODEC, config.JSON_TYPED, config.RAW_MODE = saved
+    return times
+
+
+def compare(current, baseline, tolerance=0.1):
+    """Regressions of `current` against `baseline` beyond `tolerance` (a fraction), as messages."""
+    problems = []
+    for size, run in current["runs"].items():
+        base = baseline.get("runs", {}).get(size)
+        if base is None:
+            continue
+        for metric in COMPARED:
+            if metric not in run or metric not in base:
+                continue
+            new, old = run[metric], base[metric]
+            if metric in THROUGHPUT:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                problems.append(f"{size} orders: {metric} {new} vs baseline {old}")
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated order counts")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--workdir", default=os.path.join(os.getenv("TMPDIR", "/tmp"), "etl-bench"),
+                    help="where generated inputs are kept between runs")
+    ap.add_argument("--schema", default=os.getenv("BENCH_SCHEMA", "etl_bench"))
+    ap.add_argument("--save", help="write the results as a JSON baseline")
+    ap.add_argument("--baseline", help="compare against a saved baseline; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.1)
+    ap.add_argument("--raw-modes", default="",
+                    help="comma-separated RAW_MODEs to run each size with (runs are keyed <size>/<mode>)")
+    ap.add_argument("--queries", action="store_true",
+                    help="also time address queries after each run, from orders.raw and via the address links")
+    ap.add_argument("--codecs", action="store_true",
+                    help="also time reading and writing each size's orders with every installed JSON codec")
+    ap.add_argument("--startup-budget", type=float, default=0.1,
+                    help="seconds `import etl.main` may add to interpreter start; exit 1 above it")
+    args = ap.parse_args(argv)
+
+    results = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "settings": {k: os.environ[k] for k in (
+                "LOAD_ENGINE", "BATCH_SIZE", "WORKERS", "COMMIT_EVERY", "DIM_CACHE_SIZE", "RAW_MODE", "JSON_CODEC") if k in os.environ},
+        },
+        "startup": startup(),
+        "runs": {},
+        "codecs": {},
+    }
+    boot = results["startup"]
+    print(f"  startup  {boot['cli_s']:.3f}s  (interpreter {boot['interpreter_s']:.3f}s, "
+          f"etl imports {boot['import_s']:.3f}s, budget {args.startup_budget:.3f}s)")
+    raw_modes = [m for m in args.raw_modes.split(",") if m] or [None]
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        for mode in raw_modes:
+            key = str(size) if mode is None else f"{size}/{mode}"
+            run = results["runs"][key] = bench_size(
+                size, args.seed, args.workdir, args.schema, {"RAW_MODE": mode} if mode else None, args.queries,
+            )
+            print(f"{key:>18} orders  {run['seconds']:>9.2f}s  {run['rows_per_sec']:>10.0f} rows/s  "
+                  f"{run['bytes_per_order']:>7} B/order  {run['orders_storage_mb']:>8.2f} MB stored  "
+                  f"{run['peak_rss_mb']:>7.1f} MB  " + "  ".join(f"{k}={v:.2f}s" for k, v in run["stages"].items()))
+            for name in ADDRESS_QUERIES if args.queries else ():
+                q = run["queries"]
+                print(f"{key:>18} orders  {name:<16}" + "  ".join(
+                    f"{form} {q[f'{name}.{form}_ms']:>8.2f} ms (cost {q[f'{name}.{form}_cost']:.0f})" for form in ("raw", "join")))
+        if args.codecs:
+            times = results["codecs"][str(size)] = codec_times(input_file(args.workdir, size, args.seed)[0])
+            for name, t in times.items():
+                print(f"{size:>10} orders  {name:>7}  parse {t['parse_s']:.2f}s  serialize {t['serialize_s']:.2f}s  "
+                      f"parse typed {t['parse_typed_s']:.2f}s")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    problems = []
+    if boot["import_s"] > args.startup_budget:
+        problems.append(f"startup: etl imports take {boot['import_s']}s, budget {args.startup_budget}s")
+    if args.baseline:
+        problems += compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+    for p in problems:
+        print(f"REGRESSION {p}", file=sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
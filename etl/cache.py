@@ -0,0 +1,87 @@
+from collections import Counter, OrderedDict
+
+from etl.loaders.engine import fingerprint
+
+# Dimension table -> key column; the key is the first element of each row tuple.
+KEYS = {
+    "customers": "internal_customer_id",
+    "addresses": "address_id",
+}
+STATS = ("hits", "misses", "evictions")
+
+
+class DimensionCache:
+    """Bounded LRU of dimension key -> row_hash known to be stored in the database.
+
+    Rows whose key and content hash are cached are dropped before they reach
+    the loaders. Assumes the ETL is the only writer of the dimension tables.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._hashes = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def filter(self, rows):
+        """Return the rows that are not cached with the same content hash."""
+        fresh = []
+        for r in rows:
+            if self._hashes.get(r[0]) == fingerprint(r):
+                self._hashes.move_to_end(r[0])
+                self.hits += 1
+            else:
+                self.misses += 1
+                fresh.append(r)
+        return fresh
+
+    def remember(self, rows):
+        """Record rows that have just been written."""
+        for r in rows:
+            self._put(r[0], fingerprint(r))
+
+    def _put(self, key, row_hash):
+        self._hashes[key] = row_hash
+        self._hashes.move_to_end(key)
+        if len(self._hashes) > self.maxsize:
+            self._hashes.popitem(last=False)
+            self.evictions += 1
+
+    def warm(self, cur, table):
+        """Pre-load up to `maxsize` keys and hashes from `table`."""
+        cur.execute(
+            f"SELECT {KEYS[table]}, row_hash FROM {table} WHERE row_hash IS NOT NULL LIMIT %s",
+            (self.maxsize,),
+        )
+        for key, row_hash in cur.fetchall():
+            self._put(key, row_hash)
+
+    def clear(self):
+        """Forget every entry, e.g. after the transaction that wrote them rolled back."""
+        self._hashes.clear()
+
+    def stats(self):
+        return Counter(hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+def dimension_caches(cur=None, size=None, warm=None):
+    """One DimensionCache per dimension table, sized by DIM_CACHE_SIZE (0 disables caching)."""
+    from etl import config
+    size = config.DIM_CACHE_SIZE if size is None else size
+    warm = config.DIM_CACHE_WARM if warm is None else warm
+    if size <= 0:
+        return None
+    caches = {t: DimensionCache(size) for t in KEYS}
+    if warm and cur is not None:
+        for t, cache in caches.items():
+            cache.warm(cur, t)
+    return caches
+
+def cache_stats(caches):
+    """Flatten cache counters into "<table>.cache_<stat>" keys for the run totals."""
+    counts = Counter()
+    for t, cache in (caches or {}).items():
+        counts.update({f"{t}.cache_{k}": v for k, v in cache.stats().items()})
+    return counts
@@ -0,0 +1,163 @@
+"""JSON codecs (JSON_CODEC): the stdlib json module, orjson or msgspec.
+
+Every codec reads documents into the same Python objects and writes the same
+text: compact separators, non-ASCII characters as is. That is the format
+orjson and msgspec write; the stdlib is configured to match. The fast writers
+differ only in how they spell floats below 1e-4 or from 1e16 up (and refuse
+integers past 64 bits), so output holding a number like that is written again
+by the stdlib. Documents the fast readers refuse (NaN, lone surrogates) or
+would read differently (integers past 64 bits come out as floats) are read by
+the stdlib too.
+
+With JSON_TYPED (and RAW_MODE=none) orders are read cut down to the fields
+the loaders map (transform.mapped). msgspec decodes straight into TypedDicts
+declaring just those, skipping CustomFields, AdditionalInformation and the
+like without building them; the other codecs decode the whole order and cut
+it down afterwards.
+"""
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+from etl import config
+
+BACKENDS = ("msgspec", "orjson", "stdlib")
+
+# `fast_loads` leaves what the stdlib has to read to it by raising one of `errors`; `loads` doesn't.
+Codec = namedtuple("Codec", "name loads dumps fast_loads errors")
+# How the reader decodes one whole document: `loads` (None: the stdlib's raw_decode is used
+# throughout) raises one of `errors` on text it leaves to the stdlib; `finish` (or None) is
+# applied to what the stdlib decoded.
+Documents = namedtuple("Documents", "loads errors finish")
+
+# Digits to "0", e/E to "e", the rest to " ": where numbers are, without a regex pass (too slow
+# next to the fast codecs). A string that looks like a number here only costs a stdlib pass.
+_NUMBERS = bytes(48 if 48 <= b <= 57 else 101 if b in b"eE" else 32 for b in range(256))
+# An integer too long for 64 bits, which the fast readers turn into a float (or refuse).
+_LONG_INT = b"0" * 19
+
+_stdlib_dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, check_circular=False).encode
+
+
+def _spelled_like_stdlib(out):
+    """Whether the fast writer's `out` holds no float it spells differently: no exponent, no 0.0000..."""
+    return b"0e" not in out.translate(_NUMBERS) and b"0.0000" not in out
+
+def _short_ints(decode):
+    def fast_loads(text):
+        data = text.encode() if isinstance(text, str) else text
+        if _LONG_INT in data.translate(_NUMBERS):
+            raise ValueError("integer past 64 bits")
+        return decode(data)
+    return fast_loads
+
+def _codec(name, decode, dumps, errors):
+    fast_loads = _short_ints(decode)
+
+    def loads(text):
+        try:
+            return fast_loads(text)
+        except errors:
+            return json.loads(text)
+    return Codec(name, loads, dumps, fast_loads, errors)
+
+def _stdlib():
+    return Codec("stdlib", json.loads, _stdlib_dumps, json.loads, (ValueError,))
+
+def _orjson():
+    import orjson
+
+    def dumps(obj):
+        try:
+            out = orjson.dumps(obj)
+        except TypeError:  # orjson.JSONEncodeError: integers past 64 bits, lone surrogates
+            return _stdlib_dumps(obj)
+        return out.decode() if _spelled_like_stdlib(out) else _stdlib_dumps(obj)
+    return _codec("orjson", orjson.loads, dumps, (ValueError,))
+
+def _msgspec():
+    import msgspec
+
+    encode, decode = msgspec.json.Encoder().encode, msgspec.json.Decoder().decode
+
+    def dumps(obj):
+        try:
+            out = encode(obj)
+        except (msgspec.EncodeError, TypeError, OverflowError):
+            return _stdlib_dumps(obj)
+        return out.decode() if _spelled_like_stdlib(out) else _stdlib_dumps(obj)
+    return _codec("msgspec", decode, dumps, (ValueError, msgspec.DecodeError))
+
+_BUILD = {"stdlib": _stdlib, "orjson": _orjson, "msgspec": _msgspec}
+
+
+def get(name=None):
+    """The codec called `name` (default JSON_CODEC); "auto" is the first of BACKENDS installed."""
+    return _get((name or config.JSON_CODEC).strip().lower())
+
+@lru_cache(maxsize=None)
+def _get(name):
+    if name == "auto":
+        return next(c for c in map(_installed, BACKENDS) if c)
+    if name not in _BUILD:
+        raise ValueError(f"Unknown JSON_CODEC {name!r}; expected auto or one of {BACKENDS}")
+    return _BUILD[name]()
+
+def _installed(name):
+    try:
+        return get(name)
+    except ImportError:
+        return None
+
+def available():
+    """Names of the installed codecs."""
+    return [name for name in BACKENDS if _installed(name)]
+
+def dumps(obj):
+    return get().dumps(obj)
+
+def loads(text):
+    return get().loads(text)
+
+
+def _typed_decoder():
+    """msgspec decoder of an order into TypedDicts declaring only the mapped fields."""
+    from typing import Any, List, Optional, TypedDict
+
+    import msgspec
+    from etl.transform import MAPPED, MAPPED_ORDER_FIELDS
+
+    def struct(name, fields, **nested):
+        return TypedDict(name, {f: nested.get(f, Any) for f in sorted(fields)}, total=False)
+
+    tax = struct("Tax", MAPPED["Taxes"][1])
+    parts = {
+        k: struct(k, fields, Taxes=Optional[List[tax]]) if k == "LineItems" else struct(k, fields)
+        for k, (_, fields) in MAPPED.items()
+    }
+    nested = {k: Optional[List[t]] if k in ("LineItems", "Taxes", "ShippingTaxes", "OrderPayments")
+              else Optional[t] for k, t in parts.items()}
+    return msgspec.json.Decoder(struct("Order", MAPPED_ORDER_FIELDS | MAPPED.keys(), **nested)).decode
+
+def typed():
+    """Whether orders are read cut down to their mapped fields (JSON_TYPED, only with RAW_MODE=none)."""
+    return config.JSON_TYPED and config.RAW_MODE == "none"
+
+def _mapped(value):
+    from etl.transform import mapped
+    if isinstance(value, list):  # an NDJSON line holding an array of orders
+        return [mapped(r) for r in value]
+    return mapped(value)
+
+def documents():
+    """Documents for the configured codec and JSON_TYPED."""
+    codec = get()
+    if not typed():
+        return Documents(None if codec.name == "stdlib" else codec.fast_loads, codec.errors, None)
+    if codec.name == "msgspec":
+        # A document that doesn't fit the types (not an order, a malformed part) is read whole and
+        # cut down instead, exactly as the other codecs do.
+        return Documents(_short_ints(_typed_decoder()), codec.errors, _mapped)
+    if codec.name == "stdlib":
+        return Documents(None, codec.errors, _mapped)
+    return Documents(lambda text: _mapped(codec.fast_loads(text)), codec.errors, _mapped)
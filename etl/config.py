@@ -1,5 +1,8 @@
 import os
 
+def _flag(name, default="false"):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
 DB_CONN = {
     "dbname": os.getenv("PGDATABASE", "dedb"),
     "user": os.getenv("PGUSER", "deuser"),
@@ -8,4 +11,114 @@ DB_CONN = {
     "port": os.getenv("PGPORT", "55432"),
 }
 
-INPUT_PATH = os.getenv("INPUT_PATH", "data/orders_data.json")
\ No newline at end of file
+# A single file, a directory (every non-hidden file in it) or a glob pattern.
+INPUT_PATH = os.getenv("INPUT_PATH", "data/orders_data.json")
+
+# Orders per batch handed to the loaders; bounds peak memory on large inputs.
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1000"))
+
+# How loaders write rows: "values" (multi-row INSERT via execute_values) or
+# "copy" (COPY FROM STDIN into temp staging tables, then one set-based upsert per table) or
+# "asyncpg" (binary COPY over an asyncio connection pool, dimensions written concurrently,
+# one commit per batch; needs the asyncpg package).
+LOAD_ENGINE = os.getenv("LOAD_ENGINE", "values")
+# Connections in the asyncpg engine's pool.
+POOL_SIZE = int(os.getenv("POOL_SIZE", "4"))
+
+# Worker processes for multi-file inputs; each worker holds its own DB connection.
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Pipelined loads: "thread" or "process" parses and decomposes batches on a producer while
+# this process writes the previous ones; "off" does one after the other. At most QUEUE_DEPTH
+# batches wait between the two.
+PIPELINE = os.getenv("PIPELINE", "off").strip().lower()
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", "4"))
+
+# Parse a large uncompressed JSON array file on SPLIT_WORKERS processes (0 or 1: off), in
+# SPLIT_CHUNK_MB byte ranges of the memory-mapped file; see etl/split.py.
+SPLIT_WORKERS = int(os.getenv("SPLIT_WORKERS", "0"))
+SPLIT_CHUNK_MB = int(os.getenv("SPLIT_CHUNK_MB", "16"))
+
+# Incremental loads skip orders whose LastUpdatedDateUtc is not newer than the stored order:
+#   "off"       - upsert every order (default)
+#   "keys"      - look up orders.last_updated_utc for every incoming order
+#   "watermark" - additionally drop orders at or below the source's high-water mark
+#                 without a lookup; only safe for sources that never back-date updates
+INCREMENTAL = os.getenv("INCREMENTAL", "off").strip().lower()
+# Name the watermark is stored under in etl_state; defaults to INPUT_PATH.
+SOURCE_NAME = os.getenv("SOURCE_NAME") or INPUT_PATH
+
+# What each order keeps of its source document:
+#   "full"     - the whole order JSON in orders.raw (default)
+#   "none"     - nothing
+#   "unmapped" - only the fields no column holds (payments, shipping rates, custom fields, ...)
+#   "archive"  - orders.raw stays empty; the whole document goes zlib-compressed to
+#                order_raw_archive, keyed by its blake2b digest (orders.raw_digest), and is
+#                only sent when that digest is not stored yet
+RAW_MODE = os.getenv("RAW_MODE", "full").strip().lower()
+
+# JSON codec for reading orders and writing orders.raw: "auto" (msgspec, else orjson, else the
+# stdlib), "msgspec", "orjson" or "stdlib". All of them produce the same rows; see etl/codec.py.
+JSON_CODEC = os.getenv("JSON_CODEC", "auto")
+# With RAW_MODE=none, read orders cut down to the fields the loaders map (custom fields and the
+# like are skipped; with msgspec without being built at all). Dead letters then hold only those.
+JSON_TYPED = _flag("JSON_TYPED")
+
+# Month partitioning of orders and order_line_items by order_date_utc: "off" or "month". The
+# tables are converted once with `python -m etl.partitions convert`; loads then create the months
+# they touch, and runs start by creating PARTITIONS_AHEAD months past the current one.
+PARTITIONS = os.getenv("PARTITIONS", "off").strip().lower()
+PARTITIONS_AHEAD = int(os.getenv("PARTITIONS_AHEAD", "3"))
+
+# Keep the rollup tables (daily_revenue, sku_quantities) up to date from each batch's own
+# writes, in the batch's transaction; `python -m etl.rollups verify` checks them against a
+# full recompute.
+ROLLUPS = _flag("ROLLUPS", "true")
+
+# Bulk mode for cold backfills: "off", "on", or "auto" (only into an empty orders table).
+# Secondary indexes and foreign keys are dropped for the load and rebuilt after it over
+# BACKFILL_JOBS connections; see etl/backfill.py.
+BACKFILL = os.getenv("BACKFILL", "off").strip().lower()
+BACKFILL_JOBS = int(os.getenv("BACKFILL_JOBS", "4"))
+
+# Parquet export for analytics (python -m etl.export): orders and line items under
+# EXPORT_PATH/<table>/order_month=YYYY-MM/, compressed per column with EXPORT_COMPRESSION
+# ("zstd", "snappy", "gzip", "lz4", "brotli" or "none"). At most about EXPORT_ROW_GROUP rows are
+# held in memory, and files get row groups of up to that many rows; see etl/export.py.
+EXPORT_PATH = os.getenv("EXPORT_PATH", "export")
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd").strip().lower()
+EXPORT_ROW_GROUP = int(os.getenv("EXPORT_ROW_GROUP", "100000"))
+
+# Orders failing validation go to the etl_dead_letters table, or are appended as NDJSON
+# to this file when it is set.
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "")
+
+# Commit (and checkpoint) every N orders on serial loads so an interrupted run resumes where
+# it stopped; 0 loads everything in a single transaction.
+COMMIT_EVERY = int(os.getenv("COMMIT_EVERY", "0"))
+
+# Run report: per-stage/table wall and CPU time, rows, bytes sent and peak memory as JSON,
+# and/or in the Prometheus textfile-collector format. Empty disables either.
+METRICS_PATH = os.getenv("METRICS_PATH", "")
+PROMETHEUS_TEXTFILE = os.getenv("PROMETHEUS_TEXTFILE", "")
+# Opt-in profiling: "cprofile" (around the loader calls) or "tracemalloc" (whole run, adds
+# per-stage Python heap peaks); the profile/snapshot is dumped to PROFILE_PATH.
+PROFILE = os.getenv("PROFILE", "").strip().lower()
+PROFILE_PATH = os.getenv("PROFILE_PATH", "etl.prof")
+
+# Per-process LRU of customer/address keys and content hashes already in the database;
+# repeats are dropped before they reach the loaders. 0 disables the cache.
+DIM_CACHE_SIZE = int(os.getenv("DIM_CACHE_SIZE", "100000"))
+# Fill the cache from the dimension tables at startup.
+DIM_CACHE_WARM = _flag("DIM_CACHE_WARM")
+
+# Watch mode (python -m etl.watch): INPUT_PATH is a drop directory. New files are claimed into
+# processing/, loaded over one long-lived connection and moved to done/ or failed/.
+#   WATCH_MODE         - "inotify", "poll" or "auto" (inotify where available)
+#   WATCH_POLL_S       - directory rescan interval (also the inotify wake-up timeout)
+#   WATCH_BATCH_WAIT_S - after the first file lands, wait this long for more to share its commit
+#   WATCH_BATCH_BYTES  - ...or until this many bytes of files are claimed
+WATCH_MODE = os.getenv("WATCH_MODE", "auto").strip().lower()
+WATCH_POLL_S = float(os.getenv("WATCH_POLL_S", "1.0"))
+WATCH_BATCH_WAIT_S = float(os.getenv("WATCH_BATCH_WAIT_S", "0.2"))
+WATCH_BATCH_BYTES = int(os.getenv("WATCH_BATCH_BYTES", str(8 * 1024 * 1024)))
@@ -1,12 +1,38 @@
 import psycopg2
+import psycopg2.extensions
 from contextlib import contextmanager
+from time import perf_counter
 from .config import DB_CONN
+from .metrics import METRICS
+
+
+class MeteredCursor(psycopg2.extensions.cursor):
+    """Cursor that reports each statement's size and round-trip time to METRICS."""
+
+    def execute(self, query, vars=None):
+        start = perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            METRICS.sent(len(self.query or b""), perf_counter() - start)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            METRICS.sent(len(sql.encode()) + file.tell(), perf_counter() - start)
+
+
+def connect():
+    return psycopg2.connect(**DB_CONN, cursor_factory=MeteredCursor)
 
 @contextmanager
 def get_conn():
-    conn = psycopg2.connect(**DB_CONN)
+    conn = connect()
     try:
         yield conn
-        conn.commit()
+        with METRICS.stage("commit"):
+            conn.commit()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
@@ -0,0 +1,35 @@
+from collections import Counter
+
+from etl import codec, config
+
+COLUMNS = ("source", "path", "error_class", "reason", "raw")
+INSERT = f"INSERT INTO etl_dead_letters ({', '.join(COLUMNS)}) VALUES %s"
+
+
+def letters(path, rejects):
+    """Dead-letter rows (COLUMNS) for (error class, reason, order) rejects."""
+    return [(config.SOURCE_NAME, path, cls, reason, codec.dumps(r)) for cls, reason, r in rejects]
+
+def counts(rejects):
+    return Counter(f"quarantined.{cls}" for cls, _, _ in rejects)
+
+def write_file(rows):
+    with open(config.DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(codec.dumps(dict(zip(COLUMNS, row))) + "\n")
+
+def quarantine(cur, path, rejects):
+    """Write rejected orders to the dead letters; return "quarantined.<error class>" counts.
+
+    Rows go to etl_dead_letters in the batch's transaction, or are appended as
+    NDJSON to DEAD_LETTER_PATH when it is set.
+    """
+    if not rejects:
+        return Counter()
+    rows = letters(path, rejects)
+    if config.DEAD_LETTER_PATH:
+        write_file(rows)
+    else:
+        from psycopg2.extras import execute_values
+        execute_values(cur, INSERT, rows)
+    return counts(rejects)
@@ -0,0 +1,264 @@
+"""Parquet export of orders and order line items, for analytics off the database.
+
+    python -m etl.export json      # from the transform pass over INPUT_PATH; no database
+    python -m etl.export db        # orders changed since the last db export (--full: all of them)
+
+The rows are the ones the loaders write, typed as in docs/data_model.sql:
+orders without raw, raw_digest and row_hash, and line items without row_hash
+but with their order's last_updated_utc. They land under
+EXPORT_PATH/<table>/order_month=YYYY-MM/ (Hive-style, so readers prune
+months), in one file per run and month, compressed column by column with
+EXPORT_COMPRESSION. Rows are buffered per month and written as row groups of
+EXPORT_ROW_GROUP rows; once that many are buffered in all, the largest buffer
+is written early, so memory stays bounded whatever the size of the tables.
+Files are written under a hidden name and renamed when the run succeeds.
+
+Runs only ever add files, so an order exported again (changed since, or read
+from another input) has a row per run: the one with the greatest
+last_updated_utc (order_last_updated_utc for line items) is current. db
+exports keep their high-water mark in etl_state under "export:<EXPORT_PATH>";
+like INCREMENTAL=watermark, it misses orders loaded later with an older
+LastUpdatedDateUtc, which a --full export picks up.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl import config
+from etl.incremental import parse_utc
+from etl.metrics import METRICS
+from etl.partitions import month_of
+
+logger = logging.getLogger("etl")
+
+_TS = pa.timestamp("us", tz="UTC")
+_MONEY, _QUANTITY = pa.decimal128(12, 2), pa.decimal128(12, 3)
+
+SCHEMAS = {
+    "orders": pa.schema([
+        ("internal_order_id", pa.int64()), ("external_order_id", pa.string()),
+        ("order_date_utc", _TS), ("last_updated_utc", _TS), ("deadline_utc", _TS),
+        ("order_status", pa.string()), ("invoice_status", pa.string()), ("shipment_status", pa.string()),
+        ("billing_customer_id", pa.int64()), ("billing_address_id", pa.int64()), ("shipping_address_id", pa.int64()),
+        ("subtotal", _MONEY), ("shipping_total", _MONEY), ("discount_total", _MONEY), ("order_total", _MONEY),
+        ("currency_code", pa.string()), ("channel", pa.string()), ("comments", pa.string()),
+    ]),
+    "order_line_items": pa.schema([
+        ("internal_line_item_id", pa.int64()), ("internal_order_id", pa.int64()), ("order_date_utc", _TS),
+        ("sku", pa.string()), ("product_name", pa.string()), ("item_name", pa.string()), ("description", pa.string()),
+        ("quantity_ordered", _QUANTITY), ("quantity_invoiced", _QUANTITY), ("quantity_shipped", _QUANTITY),
+        ("quantity_cancelled", _QUANTITY), ("quantity_returned", _QUANTITY),
+        ("unit_price", _MONEY), ("unit_discount", _MONEY), ("subtotal", _MONEY), ("total_tax", _MONEY),
+        ("total", _MONEY), ("is_preorder", pa.bool_()),
+        ("order_last_updated_utc", _TS),
+    ]),
+}
+# The export's columns are a prefix of the loaders' (orders) or the loaders' plus one (line items).
+_ORDER_COLUMNS = len(SCHEMAS["orders"])
+
+_QUERIES = {
+    "orders": "SELECT {} FROM orders o".format(", ".join(f"o.{c}" for c in SCHEMAS["orders"].names)),
+    "order_line_items": (
+        "SELECT {}, o.last_updated_utc FROM order_line_items li "
+        "JOIN orders o ON o.internal_order_id = li.internal_order_id"
+    ).format(", ".join(f"li.{c}" for c in SCHEMAS["order_line_items"].names[:-1])),
+}
+_SINCE = " WHERE o.last_updated_utc > %s"
+
+
+def _decimal(scale):
+    # The JSON's floats, rounded the way a NUMERIC column rounds them.
+    quantum = Decimal(1).scaleb(-scale)
+
+    def convert(v):
+        return v if v is None or isinstance(v, Decimal) else Decimal(str(v)).quantize(quantum, ROUND_HALF_UP)
+    return convert
+
+def _timestamp(v):
+    return parse_utc(v) if isinstance(v, str) else v
+
+def _text(v):
+    return v if v is None or isinstance(v, str) else str(v)
+
+def _converter(t):
+    if pa.types.is_decimal(t):
+        return _decimal(t.scale)
+    if pa.types.is_timestamp(t):
+        return _timestamp
+    if pa.types.is_string(t):
+        return _text
+    return None
+
+_CONVERTERS = {name: [_converter(f.type) for f in schema] for name, schema in SCHEMAS.items()}
+
+def to_arrow(table, rows):
+    """An Arrow table of `rows` (tuples in SCHEMAS[table] column order, as read from JSON or the database)."""
+    schema = SCHEMAS[table]
+    columns = zip(*rows) if rows else [()] * len(schema)
+    return pa.Table.from_arrays([
+        pa.array(list(col) if convert is None else [convert(v) for v in col], f.type)
+        for col, convert, f in zip(columns, _CONVERTERS[table], schema)
+    ], schema=schema)
+
+
+class Export:
+    """One run's Parquet files, one per table and month, renamed into place on success."""
+
+    def __init__(self, root=None, compression=None, row_group=None):
+        self.root = root or config.EXPORT_PATH
+        self.compression = compression or config.EXPORT_COMPRESSION
+        self.row_group = row_group or config.EXPORT_ROW_GROUP
+        self.run = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{os.getpid()}"
+        self.rows = Counter()
+        self._buffers = {}  # (table, month) -> rows not written yet
+        self._buffered = 0
+        self._files = {}    # (table, month) -> (ParquetWriter, hidden path, path)
+
+    def add(self, table, rows):
+        date = SCHEMAS[table].get_field_index("order_date_utc")
+        for row in rows:
+            self._buffers.setdefault((table, month_of(row[date])), []).append(row)
+        self._buffered += len(rows)
+        for key in [k for k, buf in self._buffers.items() if len(buf) >= self.row_group]:
+            self._write(key)
+        while self._buffered > self.row_group:
+            self._write(max(self._buffers, key=lambda k: len(self._buffers[k])))
+
+    def _write(self, key):
+        rows = self._buffers.pop(key)
+        self._buffered -= len(rows)
+        table, month = key
+        with METRICS.stage(f"export.{table}", rows=len(rows)):
+            if key not in self._files:
+                folder = os.path.join(self.root, table, f"order_month={month:%Y-%m}")
+                os.makedirs(folder, exist_ok=True)
+                name = f"part-{self.run}.parquet"
+                hidden = os.path.join(folder, f".{name}")
+                writer = pq.ParquetWriter(hidden, SCHEMAS[table], compression=self.compression)
+                self._files[key] = writer, hidden, os.path.join(folder, name)
+            self._files[key][0].write_table(to_arrow(table, rows), row_group_size=self.row_group)
+        self.rows[table] += len(rows)
+
+    def close(self):
+        """Write what is buffered and publish the files; returns the rows written per table."""
+        for key in list(self._buffers):
+            self._write(key)
+        for writer, hidden, path in self._files.values():
+            writer.close()
+            os.replace(hidden, path)
+        self._files.clear()
+        return self.rows
+
+    def abort(self):
+        for writer, hidden, _ in self._files.values():
+            writer.close()
+            os.unlink(hidden)
+        self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def add_batch(export, rows):
+    """Add a RowBatch's orders and line items."""
+    export.add("orders", [o[:_ORDER_COLUMNS] for o in rows.orders])
+    updated = {o[0]: o[3] for o in rows.orders}
+    export.add("order_line_items", [li + (updated[li[1]],) for li in rows.line_items])
+
+def from_json(export):
+    """Export INPUT_PATH straight from the transform pass; returns the totals read and quarantined."""
+    from etl.deadletter import counts as quarantine_counts
+    from etl.pipeline import parsed_batches
+    from etl.reader import resolve_inputs
+
+    totals = Counter()
+    for path in resolve_inputs(config.INPUT_PATH):
+        for read, _, rejects, rows in parsed_batches(path):
+            totals["orders.read"] += read
+            totals.update(quarantine_counts(rejects))
+            add_batch(export, rows)
+    return totals
+
+def _fetch(conn, sql, params, size):
+    with conn.cursor(name="etl_export") as cur:  # server-side: `size` rows at a time
+        cur.itersize = size
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                return
+            yield rows
+
+def from_db(export, conn, since=None):
+    """Export the orders updated after `since` (None: all) and their line items, from one snapshot.
+
+    Returns the newest last_updated_utc exported, or `since` if nothing was.
+    """
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    where, params = (_SINCE, (since,)) if since is not None else ("", ())
+    mark = since
+    for rows in _fetch(conn, _QUERIES["orders"] + where, params, export.row_group):
+        export.add("orders", rows)
+        newest = max(r[3] for r in rows)
+        mark = newest if mark is None else max(mark, newest)
+    for rows in _fetch(conn, _QUERIES["order_line_items"] + where, params, export.row_group):
+        export.add("order_line_items", rows)
+    conn.rollback()
+    return mark
+
+def source_name(root=None):
+    return f"export:{root or config.EXPORT_PATH}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("json", help="export INPUT_PATH through the transform pass, without the database")
+    d = sub.add_parser("db", help="export the orders updated since the last db export")
+    d.add_argument("--full", action="store_true", help="export every order, ignoring the high-water mark")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    METRICS.reset()
+    if args.command == "json":
+        config.RAW_MODE = "none"  # orders.raw isn't exported; don't build it
+        with Export() as export:
+            totals = from_json(export)
+        quarantined = sum(v for k, v in totals.items() if k.startswith("quarantined."))
+        logger.info("Read %s orders from %s (%s invalid, left out)", totals["orders.read"], config.INPUT_PATH, quarantined)
+    else:
+        from etl.db import connect, get_conn
+        from etl.state import get_watermark, save_watermark
+
+        source = source_name()
+        with get_conn() as conn, conn.cursor() as cur:
+            since = None if args.full else get_watermark(cur, source)
+        conn = connect()
+        try:
+            with Export() as export:
+                mark = from_db(export, conn, since)
+        finally:
+            conn.close()
+        with get_conn() as conn, conn.cursor() as cur:
+            save_watermark(cur, source, mark)
+        logger.info("Exported orders updated after %s; high-water mark now %s", since, mark)
+    logger.info(
+        "Wrote %s to %s (%s)", ", ".join(f"{t}={export.rows[t]}" for t in SCHEMAS), export.root, export.compression,
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,36 @@
-from psycopg2.extras import execute_values
+from .engine import overwrite_clause, upsert, with_fingerprint
 
-def _addr_tuple(a):
-    return (
-        a["Id"],
-        a.get("ExternalAddressId"),
-        a.get("FirstName"),
-        a.get("LastName"),
-        a.get("AddressLine1"),
-        a.get("City"),
-        a.get("State"),
-        a.get("ZipCode"),
-        a.get("CountryCode"),
-    )
+COLUMNS = (
+    "address_id", "external_address_id", "first_name", "last_name", "address_line1",
+    "city", "state", "postal_code", "country_code",
+    "row_hash",
+)
 
-def upsert_addresses(cur, records):
-    rows, seen = [], set()
-    for r in records:
-        for key in ("BillingAddress", "ShippingAddress"):
-            a = r.get(key) or {}
-            aid = a.get("Id")
-            if aid is None or aid in seen:
-                continue
-            seen.add(aid)
-            rows.append(_addr_tuple(a))
-    if not rows:
-        return
-    sql = """
-    INSERT INTO addresses (address_id, external_address_id, first_name, last_name, address_line1, city, state, postal_code, country_code)
-    VALUES %s
-    ON CONFLICT (address_id) DO UPDATE
-    SET external_address_id = EXCLUDED.external_address_id,
-        first_name          = EXCLUDED.first_name,
-        last_name           = EXCLUDED.last_name,
-        address_line1       = EXCLUDED.address_line1,
-        city                = EXCLUDED.city,
-        state               = EXCLUDED.state,
-        postal_code         = EXCLUDED.postal_code,
-        country_code        = EXCLUDED.country_code;
-    """
-    execute_values(cur, sql, rows)
-    return len(rows)
\ No newline at end of file
+ON_CONFLICT = """
+ON CONFLICT (address_id) DO UPDATE
+SET external_address_id = EXCLUDED.external_address_id,
+    first_name          = EXCLUDED.first_name,
+    last_name           = EXCLUDED.last_name,
+    address_line1       = EXCLUDED.address_line1,
+    city                = EXCLUDED.city,
+    state               = EXCLUDED.state,
+    postal_code         = EXCLUDED.postal_code,
+    country_code        = EXCLUDED.country_code,
+    row_hash            = EXCLUDED.row_hash
+WHERE addresses.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+"""
+
+INSERT_NEW = """
+ON CONFLICT (address_id) DO NOTHING
+RETURNING address_id
+"""
+
+def upsert_addresses(cur, rows):
+    return upsert(cur, "addresses", COLUMNS, ON_CONFLICT, with_fingerprint(rows))
+
+def insert_new_addresses(cur, rows):
+    """Insert only addresses that do not exist yet; return the keys that were inserted."""
+    return [k for (k,) in upsert(cur, "addresses", COLUMNS, INSERT_NEW, with_fingerprint(rows), fetch=True)]
+
+def overwrite_addresses(cur, rows):
+    return upsert(cur, "addresses", COLUMNS, overwrite_clause(COLUMNS), with_fingerprint(rows))
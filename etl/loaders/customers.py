@@ -1,25 +1,27 @@
-from psycopg2.extras import execute_values
+from .engine import overwrite_clause, upsert, with_fingerprint
 
-def upsert_customers(cur, records):
-    rows = []
-    for r in records:
-        cust = r.get("BillingCustomer")
-        if not cust: continue
-        rows.append((
-            cust["InternalCustomerId"],
-            cust.get("ExternalCustomerId"),
-            cust.get("UserId"),
-            cust.get("FirstName"),
-            cust.get("LastName"),
-            cust.get("EmailAddress"),
-        ))
-    sql = """
-    INSERT INTO customers (internal_customer_id, external_customer_id, user_id, first_name, last_name, email_address)
-    VALUES %s
-    ON CONFLICT (internal_customer_id) DO UPDATE
-    SET first_name=EXCLUDED.first_name,
-        last_name=EXCLUDED.last_name,
-        email_address=EXCLUDED.email_address;
-    """
-    execute_values(cur, sql, rows)
-    return len(rows)
\ No newline at end of file
+COLUMNS = ("internal_customer_id", "external_customer_id", "user_id", "first_name", "last_name", "email_address", "row_hash")
+
+ON_CONFLICT = """
+ON CONFLICT (internal_customer_id) DO UPDATE
+SET first_name=EXCLUDED.first_name,
+    last_name=EXCLUDED.last_name,
+    email_address=EXCLUDED.email_address,
+    row_hash=EXCLUDED.row_hash
+WHERE customers.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+"""
+
+INSERT_NEW = """
+ON CONFLICT (internal_customer_id) DO NOTHING
+RETURNING internal_customer_id
+"""
+
+def upsert_customers(cur, rows):
+    return upsert(cur, "customers", COLUMNS, ON_CONFLICT, with_fingerprint(rows))
+
+def insert_new_customers(cur, rows):
+    """Insert only customers that do not exist yet; return the keys that were inserted."""
+    return [k for (k,) in upsert(cur, "customers", COLUMNS, INSERT_NEW, with_fingerprint(rows), fetch=True)]
+
+def overwrite_customers(cur, rows):
+    return upsert(cur, "customers", COLUMNS, overwrite_clause(COLUMNS), with_fingerprint(rows))
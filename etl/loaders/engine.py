@@ -0,0 +1,113 @@
+import io
+from collections import Counter
+from hashlib import blake2b
+
+from etl import config
+
+OUTCOMES = ("inserted", "updated", "unchanged")
+
+# Upserts are wrapped so each statement reports what it did instead of
+# shipping one row per change back: xmax is 0 only for freshly inserted tuples.
+# Partitioned tables don't return system columns. There a written row counts as
+# inserted when its key is not in the statement's snapshot, which never sees
+# the rows the statement writes (rollup captures rely on the same).
+_COUNTED = """
+WITH written AS (
+{insert}
+RETURNING {returning}
+){captures}
+SELECT count(*) FILTER (WHERE {inserted}), count(*) FROM written w
+"""
+
+
+def fingerprint(row):
+    """Stable signed 64-bit content hash of a mapped row tuple."""
+    return int.from_bytes(blake2b(repr(row).encode(), digest_size=8).digest(), "big", signed=True)
+
+def with_fingerprint(rows):
+    return [r + (fingerprint(r),) for r in rows]
+
+
+def _write_values(cur, table, columns, rows, statement):
+    from psycopg2.extras import execute_values
+    return execute_values(cur, statement("VALUES %s"), rows, fetch=True)
+
+
+def _csv_field(v):
+    if v is None:
+        return ""
+    if isinstance(v, bytes):
+        return "\\x" + v.hex()
+    return '"' + str(v).replace('"', '""') + '"'
+
+def _csv_buffer(rows):
+    """Render rows as COPY CSV in memory, UTF-8 encoded; unquoted empty fields are NULL."""
+    return io.BytesIO("".join(",".join(map(_csv_field, r)) + "\n" for r in rows).encode())
+
+def _write_copy(cur, table, columns, rows, statement):
+    staging = f"_stg_{table}"
+    cols = ", ".join(columns)
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS SELECT {cols} FROM {table} WITH NO DATA;"
+        f"TRUNCATE {staging};"
+    )
+    cur.copy_expert(f"COPY {staging} ({cols}) FROM STDIN WITH (FORMAT csv)", _csv_buffer(rows))
+    cur.execute(statement(f"SELECT {cols} FROM {staging}"))
+    return cur.fetchall()
+
+
+ENGINES = {
+    "values": _write_values,
+    "copy": _write_copy,
+}
+
+def overwrite_clause(columns):
+    """ON CONFLICT clause that replaces every non-key column (the key comes first)."""
+    sets = ",\n    ".join(f"{c} = EXCLUDED.{c}" for c in columns[1:])
+    return f"ON CONFLICT ({columns[0]}) DO UPDATE\nSET {sets}"
+
+def insert_statement(table, columns, on_conflict, source):
+    return f"INSERT INTO {table} ({', '.join(columns)})\n{source}\n{on_conflict}"
+
+def counted_statement(table, columns, on_conflict, source, key=None, rollups=()):
+    """The upsert wrapped to return one (inserted, written) row.
+
+    Pass the `key` columns for partitioned tables. Each of `rollups`
+    (etl.rollups.Rollup) captures the deltas of the rows actually written.
+    """
+    returning = [c for r in rollups for c in r.columns]
+    if key is None:
+        returning.insert(0, "(xmax = 0) AS inserted")
+        inserted = "inserted"
+    else:
+        returning[:0] = key
+        inserted = f"NOT EXISTS (SELECT 1 FROM {table} t WHERE {' AND '.join(f't.{c} = w.{c}' for c in key)})"
+    return _COUNTED.format(
+        insert=insert_statement(table, columns, on_conflict, source),
+        returning=", ".join(dict.fromkeys(returning)),
+        captures="".join(r.capture() for r in rollups),
+        inserted=inserted,
+    )
+
+def upsert(cur, table, columns, on_conflict, rows, fetch=False, key=None, rollups=()):
+    """Upsert `rows` into `table` with the engine selected by LOAD_ENGINE.
+
+    Returns a Counter of inserted/updated/unchanged rows, or the rows of the
+    clause's own RETURNING when `fetch` is set. `key` and `rollups` are
+    passed on to counted_statement.
+    """
+    if not rows:
+        return [] if fetch else Counter(dict.fromkeys(OUTCOMES, 0))
+    try:
+        write = ENGINES[config.LOAD_ENGINE]
+    except KeyError:
+        raise ValueError(f"Unknown LOAD_ENGINE {config.LOAD_ENGINE!r}; expected one of {sorted(ENGINES)}")
+
+    if fetch:
+        return write(cur, table, columns, rows, lambda source: insert_statement(table, columns, on_conflict, source))
+    pages = write(
+        cur, table, columns, rows, lambda source: counted_statement(table, columns, on_conflict, source, key, rollups),
+    )
+    inserted = sum(p[0] for p in pages)
+    written = sum(p[1] for p in pages)
+    return Counter(inserted=inserted, updated=written - inserted, unchanged=len(rows) - written)
@@ -0,0 +1,26 @@
+from .engine import upsert, with_fingerprint
+
+COLUMNS = (
+    "internal_order_payment_id", "internal_order_id", "external_order_payment_id",
+    "payment_type", "payment_type_description", "payment_id",
+    "amount", "amount_authorized", "amount_captured", "status",
+    "row_hash",
+)
+
+ON_CONFLICT = """
+ON CONFLICT (internal_order_payment_id) DO UPDATE
+SET internal_order_id         = EXCLUDED.internal_order_id,
+    external_order_payment_id = EXCLUDED.external_order_payment_id,
+    payment_type              = EXCLUDED.payment_type,
+    payment_type_description  = EXCLUDED.payment_type_description,
+    payment_id                = EXCLUDED.payment_id,
+    amount                    = EXCLUDED.amount,
+    amount_authorized         = EXCLUDED.amount_authorized,
+    amount_captured           = EXCLUDED.amount_captured,
+    status                    = EXCLUDED.status,
+    row_hash                  = EXCLUDED.row_hash
+WHERE order_payments.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+"""
+
+def upsert_payments(cur, rows):
+    return upsert(cur, "order_payments", COLUMNS, ON_CONFLICT, with_fingerprint(rows))
@@ -0,0 +1,14 @@
+from .engine import upsert
+
+COLUMNS = ("digest", "body")
+
+ON_CONFLICT = "ON CONFLICT (digest) DO NOTHING"
+
+def upsert_raw_archive(cur, rows):
+    """Archive (digest, body) documents; bodies whose digest is already stored are not sent."""
+    cur.execute("SELECT digest FROM order_raw_archive WHERE digest = ANY(%s)", ([d for d, _ in rows],))
+    stored = {bytes(d) for d, in cur.fetchall()}
+    fresh = [r for r in rows if r[0] not in stored]
+    counts = upsert(cur, "order_raw_archive", COLUMNS, ON_CONFLICT, fresh)
+    counts["unchanged"] += len(rows) - len(fresh)
+    return counts
@@ -0,0 +1,21 @@
+from .engine import upsert, with_fingerprint
+
+COLUMNS = (
+    "internal_order_id", "internal_tax_rate_id", "tax_amount", "tax_rate", "tax_type",
+    "backend_name", "public_tax_name",
+    "row_hash",
+)
+
+ON_CONFLICT = """
+ON CONFLICT (internal_order_id, internal_tax_rate_id) DO UPDATE
+SET tax_amount   = EXCLUDED.tax_amount,
+    tax_rate     = EXCLUDED.tax_rate,
+    tax_type     = EXCLUDED.tax_type,
+    backend_name = EXCLUDED.backend_name,
+    public_tax_name = EXCLUDED.public_tax_name,
+    row_hash     = EXCLUDED.row_hash
+WHERE order_shipping_taxes.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+"""
+
+def upsert_shipping_taxes(cur, rows):
+    return upsert(cur, "order_shipping_taxes", COLUMNS, ON_CONFLICT, with_fingerprint(rows))
@@ -1,15 +1,12 @@
-import json
-import os
-import psycopg2
 import logging
-from psycopg2.extras import execute_values
-from etl.db import get_conn
-from etl.config import INPUT_PATH
-from etl.loaders.customers import upsert_customers
-from etl.loaders.addresses import upsert_addresses
-from etl.loaders.orders import upsert_orders
-from etl.loaders.line_items import upsert_order_line_items
-from etl.loaders.order_taxes import upsert_order_taxes
+import sys
+import time
+from collections import Counter
+from etl.transform import TABLES
+from etl.loaders.engine import OUTCOMES
+from etl.metrics import METRICS, PROFILERS, write_json, write_prometheus
+# Everything that pulls in the DB driver, multiprocessing or the loaders is imported where it
+# is used, so `--transform-only` and short runs don't pay for it at startup.
 
 # --- Configure logging ---
 logging.basicConfig(
@@ -18,52 +15,194 @@ logging.basicConfig(
 )
 logger = logging.getLogger("etl")
 
-def _log_count(name, count):
+def _sent(totals, table):
+    return sum(totals[f"{table}.{k}"] for k in OUTCOMES)
+
+def _log_count(table, totals):
+    name = table.replace("_", " ")
+    count = _sent(totals, table)
     if count == 0:
         logger.warning("No %s were upserted!", name)
     else:
-        logger.info("Upserted %s %s", count, name)
+        logger.info(
+            "Upserted %s %s (inserted=%s, updated=%s, unchanged=%s)",
+            count, name, *(totals[f"{table}.{k}"] for k in OUTCOMES),
+        )
+
+def write_reports(totals, started, status):
+    """Build the run report and write it to METRICS_PATH / PROMETHEUS_TEXTFILE when set."""
+    from . import config
+    report = METRICS.report(
+        status=status,
+        input=config.INPUT_PATH,
+        started_at=started,
+        finished_at=time.time(),
+        settings={k: getattr(config, k) for k in (
+            "BATCH_SIZE", "LOAD_ENGINE", "WORKERS", "INCREMENTAL", "COMMIT_EVERY", "DIM_CACHE_SIZE", "RAW_MODE",
+            "BACKFILL")},
+        totals=dict(totals),
+    )
+    report["seconds"] = round(report["finished_at"] - started, 3)
+    if config.METRICS_PATH:
+        write_json(config.METRICS_PATH, report)
+    if config.PROMETHEUS_TEXTFILE:
+        write_prometheus(config.PROMETHEUS_TEXTFILE, report, totals)
+    return report
+
+def _report(totals, started, status):
+    report = write_reports(totals, started, status)
+    for name, rec in sorted(report["stages"].items(), key=lambda kv: -kv[1]["wall_s"]):
+        logger.info(
+            "Stage %-20s %9.3fs wall %9.3fs cpu %9.3fs db %10s rows %12s bytes",
+            name, rec["wall_s"], rec["cpu_s"], rec["db_wall_s"], rec["rows"], rec["bytes_sent"],
+        )
+    return report
 
 def load_json(path):
+    from etl.reader import iter_orders
     logger.info(f"Loading JSON from {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        return data if isinstance(data, list) else [data]
+    return list(iter_orders(path))
 
-def run():
-    from .config import DB_CONN, INPUT_PATH
-    logger.info("ETL connecting with: %s", DB_CONN)
-    logger.info("Reading input from: %s", INPUT_PATH)
+def transform_only():
+    """Parse, validate and decompose INPUT_PATH without connecting to the database."""
+    from .config import INPUT_PATH
+    from etl.deadletter import counts as quarantine_counts
+    from etl.pipeline import parsed_batches
+    from etl.reader import resolve_inputs
 
+    started = time.time()
+    totals = Counter()
+    status = "failed"
+    METRICS.reset()
     try:
-        records = load_json(INPUT_PATH)
+        for path in resolve_inputs(INPUT_PATH):
+            for read, _, rejects, rows in parsed_batches(path):
+                totals["orders.read"] += read
+                totals.update({f"{t}.transformed": n for t, n in rows.counts().items()})
+                totals.update(quarantine_counts(rejects))
+        logger.info(
+            "Transformed %s orders (dry run): %s", totals["orders.read"],
+            ", ".join(f"{t}={totals[f'{t}.transformed']}" for t in TABLES),
+        )
+        quarantined = sum(v for k, v in totals.items() if k.startswith("quarantined."))
+        if quarantined:
+            logger.warning("%s orders would be quarantined", quarantined)
+        status = "ok"
+        return totals
+    finally:
+        _report(totals, started, status)
 
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                n1 = upsert_customers(cur, records)
-                _log_count("customers", n1)
+def run():
+    from .config import (
+        DB_CONN, INPUT_PATH, BATCH_SIZE, WORKERS, INCREMENTAL, SOURCE_NAME, COMMIT_EVERY, PROFILE, PROFILE_PATH,
+        LOAD_ENGINE, PARTITIONS, BACKFILL,
+    )
+    from contextlib import nullcontext
+    from etl.cache import KEYS as CACHED_TABLES, cache_stats, dimension_caches
+    from etl.db import get_conn
+    from etl.incremental import MODES, ChangeFilter
+    from etl.pipeline import load_chunked, load_file
+    from etl.reader import resolve_inputs
+    from etl.state import clear_checkpoints, get_watermark, save_watermark
 
-                n2 = upsert_addresses(cur, records)
-                _log_count("addresses", n2)
+    logger.info("ETL connecting with: %s", DB_CONN)
+    logger.info("Reading input from: %s (batch size %s)", INPUT_PATH, BATCH_SIZE)
 
-                n3 = upsert_orders(cur, records)
-                _log_count("orders", n3)
+    started = time.time()
+    totals = Counter()
+    status = "failed"
+    METRICS.reset()
+    if PROFILE not in PROFILERS:
+        raise ValueError(f"Unknown PROFILE {PROFILE!r}; expected one of {PROFILERS[1:]}")
+    METRICS.start_profiling(PROFILE)
+    try:
+        paths = resolve_inputs(INPUT_PATH)
+        changes = None
+        if INCREMENTAL not in MODES:
+            raise ValueError(f"Unknown INCREMENTAL mode {INCREMENTAL!r}; expected one of {MODES}")
+        if INCREMENTAL != "off":
+            with get_conn() as conn, conn.cursor() as cur:
+                changes = ChangeFilter(get_watermark(cur, SOURCE_NAME), INCREMENTAL == "watermark")
+            logger.info("Incremental (%s) load of %s, high-water mark %s", INCREMENTAL, SOURCE_NAME, changes.watermark)
+        if PARTITIONS != "off":
+            from etl.partitions import prepare
+            prepare()
 
-                n4 = upsert_order_line_items(cur, records)
-                _log_count("line items", n4)
+        from etl.backfill import backfill, restore_interrupted
+        restore_interrupted()  # never load into tables a killed backfill left without indexes
+        with backfill(BACKFILL) if BACKFILL != "off" else nullcontext():
+            if LOAD_ENGINE == "asyncpg":
+                from etl.aio import load_async
+                if WORKERS > 1:
+                    logger.warning("WORKERS is ignored by the asyncpg engine")
+                totals = load_async(paths, changes)
+                with get_conn() as conn, conn.cursor() as cur:
+                    clear_checkpoints(cur, SOURCE_NAME)
+                    if changes is not None:
+                        save_watermark(cur, SOURCE_NAME, changes.high_water_mark)
+            elif WORKERS > 1 and len(paths) > 1:
+                from etl.parallel import load_parallel
+                logger.info("Loading %s files with %s workers", len(paths), WORKERS)
+                totals = load_parallel(paths, WORKERS, changes)
+            else:
+                with get_conn() as conn:
+                    with conn.cursor() as cur:
+                        caches = dimension_caches(cur)
+                        if COMMIT_EVERY > 0:
+                            totals = load_chunked(conn, paths, SOURCE_NAME, COMMIT_EVERY, changes, caches)
+                        else:
+                            for path in paths:
+                                totals.update(load_file(cur, path, changes, caches))
+                        totals.update(cache_stats(caches))
+                        clear_checkpoints(cur, SOURCE_NAME)
+                        if changes is not None:
+                            save_watermark(cur, SOURCE_NAME, changes.high_water_mark)
 
-                n5 = upsert_order_taxes(cur, records)
-                _log_count("order taxes", n5)
+        for table in TABLES:
+            _log_count(table, totals)
+        if _sent(totals, "raw_archive"):
+            _log_count("raw_archive", totals)
+        for table in CACHED_TABLES:
+            if totals[f"{table}.cache_hits"] or totals[f"{table}.cache_misses"]:
+                logger.info(
+                    "%s cache: hits=%s, misses=%s, evictions=%s", table,
+                    *(totals[f"{table}.cache_{k}"] for k in ("hits", "misses", "evictions")),
+                )
 
-        logger.info(
-            "ETL completed successfully: customers=%s, addresses=%s, orders=%s, "
-            "line_items=%s, order_taxes=%s",
-            n1, n2, n3, n4, n5
-        )
+        logger.info("ETL completed successfully: %s", ", ".join(f"{t}={_sent(totals, t)}" for t in TABLES))
+        quarantined = {k.split(".", 1)[1]: v for k, v in totals.items() if k.startswith("quarantined.") and v}
+        if quarantined:
+            logger.warning(
+                "Quarantined %s orders: %s", sum(quarantined.values()),
+                ", ".join(f"{k}={v}" for k, v in sorted(quarantined.items(), key=lambda kv: (-kv[1], kv[0]))),
+            )
+        if changes is not None:
+            totals.update(changes.counts())
+            logger.info(
+                "Incremental: applied=%s, skipped=%s, high_water_mark=%s",
+                changes.applied, changes.skipped, changes.high_water_mark,
+            )
+        status = "ok"
+        return totals
 
     except Exception as e:
         logger.exception("ETL failed due to an unexpected error")
         raise
+    finally:
+        METRICS.stop_profiling(PROFILE_PATH if PROFILE else None)
+        _report(totals, started, status)
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Load orders JSON into Postgres (settings come from the environment).")
+    ap.add_argument("--transform-only", "--dry-run", action="store_true",
+                    help="parse, validate and transform INPUT_PATH without touching the database")
+    args = ap.parse_args(argv)
+    if args.transform_only:
+        transform_only()
+    else:
+        run()
+    return 0
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import resource
+import threading
+from contextlib import contextmanager
+from time import perf_counter, thread_time
+
+logger = logging.getLogger("etl")
+
+MB = 1024 * 1024
+FIELDS = ("calls", "wall_s", "cpu_s", "db_wall_s", "rows", "bytes_sent", "rss_mb", "py_peak_mb")
+PROFILERS = ("", "cprofile", "tracemalloc")
+
+
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / MB if hasattr(os, "sysconf") else 0.0
+
+
+def _rss_mb():
+    # Resident set size now; 0 where there is no /proc.
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except OSError:
+        return 0.0
+
+def _peak_rss_mb():
+    # The largest resident set size of the process so far.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Metrics:
+    """Per-stage wall/CPU time, rows, bytes sent and memory for one process.
+
+    Stages are flat names such as "read", "transform" or "load.orders". The
+    metered cursor (etl.db) charges each statement's round trip and size to
+    the innermost open stage, so `wall_s - db_wall_s` is client-side work
+    (parsing, tuple building, SQL rendering) and `db_wall_s` is network plus
+    server time. `rss_mb` is the largest resident set size seen as the stage
+    opened or closed (Linux only); the report's `peak_rss_mb` is the process's
+    peak over the whole run.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._local = threading.local()
+        self._profiler = None
+        self._trace = False
+
+    @property
+    def _active(self):
+        # Open stages are per thread, so a producer thread keeps its own nesting.
+        try:
+            return self._local.active
+        except AttributeError:
+            self._local.active = []
+            return self._local.active
+
+    def reset(self):
+        self.stages.clear()
+        self._active.clear()
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        rec = self.stages.get(name)
+        if rec is None:
+            rec = self.stages[name] = dict.fromkeys(FIELDS, 0)
+        profiling = (
+            self._profiler is not None and name.startswith("load.")
+            and threading.current_thread() is threading.main_thread()
+        )
+        if self._trace and not self._active:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        self._active.append(rec)
+        rss = _rss_mb()
+        wall, cpu = perf_counter(), thread_time()
+        if profiling:
+            self._profiler.enable()
+        try:
+            yield rec
+        finally:
+            if profiling:
+                self._profiler.disable()
+            rec["wall_s"] += perf_counter() - wall
+            rec["cpu_s"] += thread_time() - cpu
+            # Concurrent coroutines on one thread may close their stages out of order.
+            if self._active[-1] is rec:
+                self._active.pop()
+            else:
+                self._active.remove(rec)
+            rec["calls"] += 1
+            rec["rows"] += rows
+            rec["rss_mb"] = max(rec["rss_mb"], rss, _rss_mb())
+            if self._trace:
+                import tracemalloc
+                rec["py_peak_mb"] = max(rec["py_peak_mb"], tracemalloc.get_traced_memory()[1] / MB)
+
+    def sent(self, nbytes, seconds):
+        """Charge one statement (or COPY) to the innermost open stage."""
+        if self._active:
+            rec = self._active[-1]
+            rec["bytes_sent"] += nbytes
+            rec["db_wall_s"] += seconds
+
+    def merge(self, stages):
+        """Fold in stage records from another process (a pool worker)."""
+        for name, other in stages.items():
+            rec = self.stages.setdefault(name, dict.fromkeys(FIELDS, 0))
+            for k in FIELDS:
+                if k.endswith("_mb"):
+                    rec[k] = max(rec[k], other[k])
+                else:
+                    rec[k] += other[k]
+
+    def start_profiling(self, mode):
+        """Opt-in profiling: "cprofile" around the loader calls, or "tracemalloc" for the whole run."""
+        # The profilers are imported only when asked for, to keep them off the startup path.
+        if mode == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+        elif mode == "tracemalloc":
+            import tracemalloc
+            tracemalloc.start()
+            self._trace = True
+
+    def stop_profiling(self, path=None, top=20):
+        """Stop profiling; log the top entries and dump the full profile/snapshot to `path`."""
+        if self._profiler is not None:
+            import io
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(top)
+            logger.info("cProfile of the loader calls:\n%s", out.getvalue())
+            if path:
+                self._profiler.dump_stats(path)
+            self._profiler = None
+        if self._trace:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._trace = False
+            lines = "\n".join(str(s) for s in snapshot.statistics("lineno")[:top])
+            logger.info("Largest live allocations at the end of the run:\n%s", lines)
+            if path:
+                snapshot.dump(path)
+
+    def report(self, **meta):
+        stages = {}
+        for name, rec in self.stages.items():
+            rec = {k: round(v, 4) if isinstance(v, float) else v for k, v in rec.items()}
+            rec["client_s"] = round(max(rec["wall_s"] - rec["db_wall_s"], 0.0), 4)
+            stages[name] = rec
+        return dict(meta, peak_rss_mb=round(_peak_rss_mb(), 1), stages=stages)
+
+
+def write_json(path, report):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+        f.write("\n")
+
+def write_prometheus(path, report, totals=None):
+    """Write the report in the Prometheus textfile-collector format (atomically)."""
+    lines = []
+    for field in FIELDS + ("client_s",):
+        metric = "etl_stage_" + (field[:-2] + "_seconds" if field.endswith("_s") else field)
+        lines.append(f"# TYPE {metric} gauge")
+        for name, rec in sorted(report["stages"].items()):
+            stage, _, table = name.partition(".")
+            labels = f'stage="{stage}"' + (f',table="{table}"' if table else "")
+            lines.append(f"{metric}{{{labels}}} {rec[field]}")
+    if totals:
+        lines.append("# TYPE etl_rows gauge")
+        for key, value in sorted(totals.items()):
+            table, _, outcome = key.rpartition(".")
+            if table:
+                lines.append(f'etl_rows{{table="{table}",outcome="{outcome}"}} {value}')
+    lines.append("# TYPE etl_peak_rss_mb gauge")
+    lines.append(f"etl_peak_rss_mb {report['peak_rss_mb']}")
+    lines.append("# TYPE etl_last_run_timestamp_seconds gauge")
+    lines.append(f"etl_last_run_timestamp_seconds {report['finished_at']}")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+# One registry per process, like the logging module's loggers.
+METRICS = Metrics()
@@ -0,0 +1,219 @@
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from operator import itemgetter
+
+from etl import config
+from etl.db import connect, get_conn
+from etl.metrics import METRICS
+from etl.state import save_watermark
+from etl.cache import cache_stats, dimension_caches
+from etl.incremental import parse_utc
+from etl.partitions import ensure as ensure_partitions
+from etl.pipeline import batch_months, iter_row_batches, load_facts, parsed_batches, tally
+from etl.transform import as_key, decompose
+from etl.loaders import customers, addresses
+
+logger = logging.getLogger("etl")
+
+# table -> (insert-if-absent, full overwrite, regular upsert)
+DIMENSIONS = {
+    "customers": (customers.insert_new_customers, customers.overwrite_customers, customers.upsert_customers),
+    "addresses": (addresses.insert_new_addresses, addresses.overwrite_addresses, addresses.upsert_addresses),
+}
+_BY_KEY = {
+    "customers": itemgetter(0),
+    "addresses": itemgetter(0),
+    "orders": itemgetter(0),
+    "line_items": itemgetter(0),
+    "order_taxes": itemgetter(0, 1),
+    "line_item_taxes": itemgetter(0, 1),
+    "shipping_taxes": itemgetter(0, 1),
+    "payments": itemgetter(0),
+}
+
+_conn = None
+_caches = None
+
+
+def _init_worker():
+    global _conn, _caches
+    _conn = connect()
+    Finalize(_conn, _conn.close, exitpriority=10)
+    with _conn.cursor() as cur:
+        _caches = dimension_caches(cur)
+    _conn.commit()
+
+def _load_file(path, changes=None):
+    """Load one file in a worker.
+
+    Dimension rows are only inserted when absent (enough for the facts' FKs);
+    the worker reports, per key, the row from the first and from the last batch
+    that carried it, plus the keys it created, so the parent can settle them.
+    It also reports the orders it wrote, so the parent can settle orders that
+    several files carry.
+    """
+    orders = set()
+    first = {t: {} for t in DIMENSIONS}
+    last = {t: {} for t in DIMENSIONS}
+    created = {t: [] for t in DIMENSIONS}
+    totals = Counter()
+    caches = _caches or {}
+    # Worker caches live as long as the worker; only this file's share of the counters is reported.
+    before = cache_stats(_caches)
+    METRICS.reset()
+    try:
+        with _conn.cursor() as cur:
+            for _, rows in iter_row_batches(cur, path, changes):
+                # Every worker takes row locks in the same (table, key) order: no deadlocks.
+                for t, key in _BY_KEY.items():
+                    getattr(rows, t).sort(key=key)
+                for t, (insert_new, _, _) in DIMENSIONS.items():
+                    batch = getattr(rows, t)
+                    for r in batch:
+                        first[t].setdefault(r[0], r)
+                        last[t][r[0]] = r
+                    # A cached key is known to exist, which is all insert_new needs.
+                    if t in caches:
+                        batch = caches[t].filter(batch)
+                    with METRICS.stage(f"load.{t}", rows=len(batch)):
+                        created[t] += insert_new(cur, batch)
+                    if t in caches:
+                        caches[t].remember(batch)
+                orders.update(r[0] for r in rows.orders)
+                totals.update(load_facts(cur, rows))
+                totals.update(rows.quarantined)
+                with METRICS.stage("commit"):
+                    _conn.commit()
+    except BaseException:
+        _conn.rollback()
+        for cache in caches.values():
+            cache.clear()
+        raise
+    totals.update(cache_stats(_caches) - before)
+    return totals, first, last, created, orders, changes, METRICS.stages
+
+
+class _Settle:
+    """Replay filter: the orders several files carried, in the versions a serial run applies.
+
+    Without INCREMENTAL that is every version. With it, only versions newer
+    than the stored one (`before`: as it was before the run, None if absent)
+    and than every version applied before them, above the watermark when
+    that is trusted.
+    """
+
+    def __init__(self, keys, before=None, floor=None):
+        self.keys = keys
+        self.latest = before
+        self.floor = floor
+
+    def __call__(self, cur, records):
+        kept = []
+        for r in records:
+            oid = as_key(r["InternalOrderId"])
+            if oid not in self.keys:
+                continue
+            if self.latest is not None:
+                ts = parse_utc(r["LastUpdatedDateUtc"])
+                prev = self.latest.get(oid)
+                if (self.floor is not None and ts <= self.floor) or (prev is not None and ts <= prev):
+                    continue
+                self.latest[oid] = ts
+            kept.append(r)
+        return kept
+
+def _stored_before(keys, filters):
+    """Per key, the smallest last_updated_utc any worker's filter saw stored (None if absent).
+
+    Writes only ever raise it, and the first worker to write a key looked it up
+    before, so that is the value from before the run.
+    """
+    before = {}
+    for f in filters:
+        for k, ts in f.seen.items():
+            if k in keys and (k not in before or (before[k] is not None and (ts is None or ts < before[k]))):
+                before[k] = ts
+    return before
+
+def _replay(cur, path, keep):
+    """Write the facts of `path`'s orders that `keep` lets through again, as a serial run would."""
+    for _, batch, _, _ in parsed_batches(path, decompose_rows=False):
+        batch = keep(cur, batch)
+        if not batch:
+            continue
+        if config.PARTITIONS == "month":
+            ensure_partitions(cur, batch_months(batch, None))
+        with METRICS.stage("transform", rows=len(batch)):
+            rows = decompose(batch)
+        load_facts(cur, rows)
+
+
+def load_parallel(paths, workers, changes=None):
+    """Load `paths` on a process pool, ending in the same state as a serial run.
+
+    Facts are written by the workers. Dimensions are settled by the parent in
+    file order: rows created during this run are reset to their first
+    occurrence (what a serial run would have inserted), then every key gets
+    the regular upsert with its last occurrence. Workers commit in no
+    particular order, so orders carried by several files are written again
+    by the parent, in file order, in the versions a serial run would apply,
+    leaving them, their children and the rollups as it would. (With
+    INCREMENTAL, a child row that only a version a serial run skips carries,
+    written by a worker before the newer version landed, stays.)
+    """
+    seen = Counter()
+    files = []
+    worker_filters = []
+    first = {t: {} for t in DIMENSIONS}
+    last = {t: {} for t in DIMENSIONS}
+    created = {t: set() for t in DIMENSIONS}
+    totals = Counter()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        filters = [changes.fresh() if changes is not None else None for _ in paths]
+        results = pool.map(_load_file, paths, filters)
+        for path, (counts, f_first, f_last, f_created, f_orders, f_changes, f_stages) in zip(paths, results):
+            logger.info("Loaded %s", path)
+            seen.update(f_orders)
+            files.append((path, f_orders))
+            totals.update(counts)
+            METRICS.merge(f_stages)
+            if changes is not None:
+                changes.merge(f_changes)
+                worker_filters.append(f_changes)
+            for t in DIMENSIONS:
+                for k, r in f_first[t].items():
+                    first[t].setdefault(k, r)
+                last[t].update(f_last[t])
+                created[t].update(f_created[t])
+    except BaseException:
+        pool.shutdown(cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    with get_conn() as conn, conn.cursor() as cur:
+        for t, (_, overwrite, upsert) in DIMENSIONS.items():
+            key = _BY_KEY[t]
+            rows = sorted(last[t].values(), key=key)
+            with METRICS.stage(f"settle.{t}", rows=len(created[t]) + len(rows)):
+                overwrite(cur, sorted((first[t][k] for k in created[t]), key=key))
+                upsert(cur, [r for r in rows if r[0] in created[t]])
+                # Keys a worker created count as inserted, whatever settling them did.
+                totals[f"{t}.inserted"] += len(created[t])
+                totals.update(tally(t, upsert(cur, [r for r in rows if r[0] not in created[t]])))
+        shared = {k for k, n in seen.items() if n > 1}
+        if shared:
+            logger.info("Settling %s orders found in several files", len(shared))
+            keep = _Settle(shared)
+            if changes is not None:
+                keep = _Settle(shared, _stored_before(shared, worker_filters),
+                               changes.watermark if changes.trust_watermark else None)
+            with METRICS.stage("settle.orders", rows=len(shared)):
+                for path, orders in files:
+                    if not shared.isdisjoint(orders):
+                        _replay(cur, path, keep)
+        if changes is not None:
+            save_watermark(cur, config.SOURCE_NAME, changes.high_water_mark)
+    return totals
@@ -0,0 +1,300 @@
+"""Month partitions of orders and order_line_items (PARTITIONS=month).
+
+    python -m etl.partitions convert              # once: move both tables onto month partitions
+    python -m etl.partitions ensure               # create months up to PARTITIONS_AHEAD ahead
+    python -m etl.partitions detach 2024-01       # detach every month before 2024-01 (--drop: drop it)
+
+Both tables are range-partitioned by order_date_utc in UTC months, and a line
+item carries its order's date, so an order and its line items always share a
+month. A partitioned table's keys must include the partition column, so
+convert replaces the line items' key and foreign key with (id, date) ones
+and drops the foreign keys the tax and payment tables hold on orders and
+line items; the loaders still write an order and its children together,
+and detach takes a month's tax and payment rows out with its orders. The
+ids alone are then unique only within a month. Postgres can't enforce more
+across partitions; pin() keeps the loaders from breaking it.
+"""
+import argparse
+import logging
+import re
+import sys
+from datetime import date, datetime, timezone
+
+from etl import config
+from etl.incremental import parse_utc
+from etl.metrics import METRICS
+
+logger = logging.getLogger("etl")
+
+MODES = ("off", "month")
+TABLES = ("orders", "order_line_items")
+# Tables keyed by internal_order_id whose foreign keys on orders convert drops.
+DEPENDENTS = ("order_taxes", "order_line_item_taxes", "order_shipping_taxes", "order_payments")
+_NAME = re.compile(r"^(orders|order_line_items)_p(\d{4})_(\d{2})$")
+# pg_advisory_xact_lock key: loaders creating the same month at once take turns.
+_LOCK = 6_540_214_809
+
+_PARTITIONED = """
+SELECT count(*) FROM pg_partitioned_table WHERE partrelid = ANY(%s::regclass[])
+"""
+_CHILDREN = """
+SELECT p.relname, c.relname FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent
+WHERE i.inhparent = ANY(%s::regclass[])
+"""
+_STORED_DATES = "SELECT internal_order_id, order_date_utc FROM orders WHERE internal_order_id = ANY(%s)"
+
+# Months this process knows to have both partitions; None until read from the catalog.
+_known = None
+
+
+def month_of(value):
+    """First day of the UTC month of a timestamp (ISO string or datetime)."""
+    ts = (parse_utc(value) if isinstance(value, str) else value).astimezone(timezone.utc)
+    return date(ts.year, ts.month, 1)
+
+def months(dates):
+    return {month_of(d) for d in dates}
+
+def _next(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def ahead(n=None, today=None):
+    """The current UTC month and the `n` (PARTITIONS_AHEAD) after it."""
+    month = month_of(today or datetime.now(timezone.utc))
+    out = []
+    for _ in range((config.PARTITIONS_AHEAD if n is None else n) + 1):
+        out.append(month)
+        month = _next(month)
+    return out
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+def _create(cur, parent, table, month):
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month} 00:00+00') TO ('{_next(month)} 00:00+00')"
+    )
+
+def partitions(cur):
+    """month -> the tables that have a partition for it."""
+    cur.execute(_CHILDREN, (list(TABLES),))
+    found = {}
+    for parent, name in cur.fetchall():
+        m = _NAME.match(name)
+        if m and m[1] == parent:
+            found.setdefault(date(int(m[2]), int(m[3]), 1), set()).add(parent)
+    return found
+
+def is_partitioned(cur):
+    cur.execute(_PARTITIONED, (list(TABLES),))
+    return cur.fetchone()[0] == len(TABLES)
+
+
+def ensure(cur, wanted):
+    """Create the months of `wanted` that lack partitions, in the caller's transaction.
+
+    Creating a partition locks its parent, so loaders call this at the start
+    of a batch, before they write to either table.
+    """
+    global _known
+    if _known is None:
+        _known = {m for m, tables in partitions(cur).items() if len(tables) == len(TABLES)}
+    missing = set(wanted) - _known
+    if not missing:
+        return
+    with METRICS.stage("partitions"):
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK,))
+        for month in sorted(missing):
+            for table in TABLES:
+                _create(cur, table, table, month)
+    logger.info("Created partitions for %s", ", ".join(f"{m:%Y-%m}" for m in sorted(missing)))
+    _known |= missing
+
+def forget():
+    """Re-read the partitions on the next ensure() (a rollback may have undone some)."""
+    global _known
+    _known = None
+
+def pin(cur, rows):
+    """Keep re-sent orders, and their line items, in the month they were first loaded into.
+
+    With the date in the key, an order whose OrderDateUtc changed would be
+    inserted a second time into another month; unpartitioned loads never
+    update order_date_utc either.
+    """
+    if not rows.orders:
+        return
+    with METRICS.stage("partitions"):
+        cur.execute(_STORED_DATES, ([r[0] for r in rows.orders],))
+        stored = dict(cur.fetchall())
+    moved = {}
+    for i, r in enumerate(rows.orders):
+        prev = stored.get(int(r[0]))
+        if prev is not None and prev != parse_utc(r[2]):
+            moved[r[0]] = prev.isoformat()
+            rows.orders[i] = r[:2] + (moved[r[0]],) + r[3:]
+    if moved:
+        rows.line_items[:] = [
+            li[:2] + (moved[li[1]],) + li[3:] if li[1] in moved else li for li in rows.line_items
+        ]
+
+def prepare():
+    """Check the schema matches PARTITIONS=month and create the months ahead; once per run."""
+    from etl.db import get_conn
+    if config.PARTITIONS not in MODES:
+        raise ValueError(f"Unknown PARTITIONS {config.PARTITIONS!r}; expected one of {MODES}")
+    if config.PARTITIONS == "off":
+        return
+    with get_conn() as conn, conn.cursor() as cur:
+        if not is_partitioned(cur):
+            raise ValueError("PARTITIONS=month needs partitioned tables; run `python -m etl.partitions convert` first")
+        forget()
+        ensure(cur, ahead())
+
+
+_KEYS = """
+ALTER TABLE orders ADD PRIMARY KEY (internal_order_id, order_date_utc);
+ALTER TABLE order_line_items ADD PRIMARY KEY (internal_line_item_id, order_date_utc),
+  ADD FOREIGN KEY (internal_order_id, order_date_utc)
+      REFERENCES orders (internal_order_id, order_date_utc) ON DELETE CASCADE;
+"""
+
+def convert(cur):
+    """Rebuild orders and order_line_items as month-partitioned tables, rows included.
+
+    Indexes and the foreign keys to customers/addresses are carried over;
+    returns False if the tables are partitioned already.
+    """
+    if is_partitioned(cur):
+        return False
+    # Schemas from before line items carried their order's date.
+    cur.execute("ALTER TABLE order_line_items ADD COLUMN IF NOT EXISTS order_date_utc TIMESTAMPTZ")
+    cur.execute(
+        "UPDATE order_line_items li SET order_date_utc = o.order_date_utc FROM orders o "
+        "WHERE o.internal_order_id = li.internal_order_id AND li.order_date_utc IS DISTINCT FROM o.order_date_utc"
+    )
+    cur.execute("ALTER TABLE order_line_items ALTER COLUMN order_date_utc SET NOT NULL")
+
+    cur.execute(
+        "SELECT conrelid::regclass::text, conname, confrelid = ANY(%s::regclass[]), pg_get_constraintdef(oid) "
+        "FROM pg_constraint WHERE contype = 'f' AND (confrelid = ANY(%s::regclass[]) OR conrelid = ANY(%s::regclass[]))",
+        (list(TABLES),) * 3,
+    )
+    keep = []
+    for table, name, to_ours, definition in cur.fetchall():
+        if not to_ours:
+            keep.append((table, definition))  # orders -> customers / addresses
+        elif table not in TABLES:
+            cur.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+    cur.execute(
+        "SELECT indexdef FROM pg_indexes i JOIN pg_index x ON x.indexrelid = format('%%I.%%I', i.schemaname, i.indexname)::regclass "
+        "WHERE i.tablename = ANY(%s) AND i.schemaname = current_schema() AND NOT x.indisprimary",
+        (list(TABLES),),
+    )
+    indexes = [r[0] for r in cur.fetchall()]
+
+    cur.execute("SELECT DISTINCT date_trunc('month', order_date_utc AT TIME ZONE 'UTC')::date FROM orders")
+    wanted = {m for (m,) in cur.fetchall()} | set(ahead())
+    for table in TABLES:
+        cur.execute(
+            f"CREATE TABLE {table}_by_month (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (order_date_utc)"
+        )
+        for month in sorted(wanted):
+            _create(cur, f"{table}_by_month", table, month)
+        cur.execute(f"INSERT INTO {table}_by_month SELECT * FROM {table}")
+    cur.execute(f"DROP TABLE {', '.join(reversed(TABLES))}")
+    for table in TABLES:
+        cur.execute(f"ALTER TABLE {table}_by_month RENAME TO {table}")
+    cur.execute(_KEYS)
+    for table, definition in keep:
+        cur.execute(f"ALTER TABLE {table} ADD {definition}")
+    for definition in indexes:
+        cur.execute(definition)
+    forget()
+    return True
+
+def detach(cur, before, drop=False):
+    """Detach every month before `before` from both tables; returns those months.
+
+    Detached partitions become plain tables named <partition>_detached, with
+    no foreign keys, ready to be dumped and dropped; `drop` drops them here.
+    The tax and payment rows of their orders move to <table>_pYYYY_MM_detached
+    tables alongside (or are deleted, with `drop`), and the rollups stop
+    counting their rows, all in the caller's transaction.
+    """
+    from etl import rollups
+    found = sorted(m for m in partitions(cur) if m < before)
+    for month in found:
+        for table in TABLES + DEPENDENTS:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{partition_name(table, month)}_detached",))
+            if not drop and cur.fetchone()[0]:
+                raise ValueError(f"{partition_name(table, month)}_detached exists already; drop or rename it first")
+    if found and any(rollups.for_table(t) for t in TABLES):
+        rollups.prepare(cur)
+    for month in found:
+        orders = partition_name("orders", month)
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (orders,))
+        if cur.fetchone()[0]:
+            ids = f"internal_order_id IN (SELECT internal_order_id FROM {orders})"
+            for table in DEPENDENTS:
+                if not drop:
+                    cur.execute(f"CREATE TABLE {partition_name(table, month)}_detached AS SELECT * FROM {table} WHERE {ids}")
+                cur.execute(f"DELETE FROM {table} WHERE {ids}")
+        for table in reversed(TABLES):  # line items first: they reference their orders
+            name = partition_name(table, month)
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+            if not cur.fetchone()[0]:
+                continue
+            for rollup in rollups.for_table(table):
+                cur.execute(rollup.remove(name))
+            cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            if drop:
+                cur.execute(f"DROP TABLE {name}")
+                continue
+            cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", (name,))
+            for (fk,) in cur.fetchall():
+                cur.execute(f'ALTER TABLE {name} DROP CONSTRAINT "{fk}"')
+            cur.execute(f"ALTER TABLE {name} RENAME TO {name}_detached")
+    if found and any(rollups.for_table(t) for t in TABLES):
+        rollups.flush(cur)
+    forget()
+    return found
+
+def _month(value):
+    return month_of(datetime.strptime(value, "%Y-%m").replace(tzinfo=timezone.utc))
+
+def main(argv=None):
+    from etl.db import get_conn
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("convert", help="partition orders and order_line_items by month, moving their rows")
+    sub.add_parser("ensure", help="create the current month and PARTITIONS_AHEAD months after it")
+    d = sub.add_parser("detach", help="detach (or drop) the months before BEFORE")
+    d.add_argument("before", type=_month, help="first month to keep, YYYY-MM")
+    d.add_argument("--drop", action="store_true", help="drop the detached partitions")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    with get_conn() as conn, conn.cursor() as cur:
+        if args.command == "convert":
+            if convert(cur):
+                logger.info("Partitioned orders and order_line_items: %s months", len(partitions(cur)))
+            else:
+                logger.info("orders and order_line_items are already partitioned")
+        elif not is_partitioned(cur):
+            logger.error("orders and order_line_items are not partitioned; run `python -m etl.partitions convert`")
+            return 2
+        elif args.command == "ensure":
+            ensure(cur, ahead())
+        else:
+            found = detach(cur, args.before, args.drop)
+            logger.info(
+                "%s %s month(s) before %s", "Dropped" if args.drop else "Detached", len(found), f"{args.before:%Y-%m}",
+            )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
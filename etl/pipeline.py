@@ -0,0 +1,183 @@
+import logging
+import os
+from collections import Counter
+from itertools import islice
+
+from etl import config
+from etl.metrics import METRICS
+from etl.partitions import ensure as ensure_partitions, months, pin as pin_partitions
+from etl.prefetch import prefetch
+from etl.rollups import flush as flush_rollups, prepare as prepare_rollups
+from etl.reader import iter_batches, iter_orders
+from etl.state import get_checkpoint, save_checkpoint
+from etl.transform import decompose, split_valid
+from etl.deadletter import quarantine
+from etl.loaders.customers import upsert_customers
+from etl.loaders.addresses import upsert_addresses
+from etl.loaders.orders import upsert_orders
+from etl.loaders.line_items import upsert_order_line_items
+from etl.loaders.order_taxes import upsert_order_taxes
+from etl.loaders.line_item_taxes import upsert_line_item_taxes
+from etl.loaders.shipping_taxes import upsert_shipping_taxes
+from etl.loaders.payments import upsert_payments
+from etl.loaders.raw_archive import upsert_raw_archive
+
+logger = logging.getLogger("etl")
+
+
+def parse_batches(orders, decompose_rows=True):
+    """The CPU-bound half of each batch: yield (orders read, orders, rejects, rows).
+
+    `rows` is the decomposed RowBatch, and `orders` None so the parsed dicts
+    can be freed; with `decompose_rows` off (an incremental filter still has
+    to drop orders) it is the other way round.
+    """
+    batches = iter_batches(orders, config.BATCH_SIZE)
+    while True:
+        with METRICS.stage("read") as m:
+            batch = next(batches, None)
+            read = len(batch or ())
+            m["rows"] += read
+        if batch is None:
+            return
+        with METRICS.stage("validate", rows=read):
+            batch, rejects = split_valid(batch)
+        rows = None
+        if decompose_rows:
+            with METRICS.stage("transform", rows=len(batch)):
+                rows = decompose(batch)
+            batch = None
+        yield read, batch, rejects, rows
+
+def iter_parsed(path, start=0, decompose_rows=True):
+    """parse_batches over the orders of `path`, skipping its first `start` orders."""
+    return parse_batches(islice(iter_orders(path), start, None), decompose_rows)
+
+def parsed_batches(path, start=0, decompose_rows=True):
+    """iter_parsed, split over SPLIT_WORKERS processes or run ahead on a PIPELINE producer when set."""
+    args = (path, start, decompose_rows)
+    if config.SPLIT_WORKERS > 1:
+        from multiprocessing import parent_process
+        from etl.split import iter_split, splittable
+        # A WORKERS process parses its file whole; the other workers keep the cores busy.
+        if parent_process() is None and splittable(path):
+            return iter_split(*args)
+    if config.PIPELINE == "off":
+        return iter_parsed(*args)
+    return prefetch(iter_parsed, args, config.PIPELINE, config.QUEUE_DEPTH)
+
+def iter_row_batches(cur, path, changes=None, start=0):
+    """Yield (orders read, RowBatch) for `path`, skipping its first `start` orders.
+
+    Invalid orders are quarantined; `changes` (a ChangeFilter) then drops
+    unchanged ones before the rest are decomposed. With PIPELINE set, parsing
+    runs ahead on a producer thread/process while the caller writes; with
+    SPLIT_WORKERS, a large file is parsed on several processes. With
+    PARTITIONS=month the months a batch touches are created before anything
+    else in its transaction.
+    """
+    for read, batch, rejects, rows in parsed_batches(path, start, changes is None):
+        if config.PARTITIONS == "month":
+            ensure_partitions(cur, batch_months(batch, rows))
+        if rows is None:
+            with METRICS.stage("filter", rows=len(batch)):
+                batch = changes(cur, batch)
+            with METRICS.stage("transform", rows=len(batch)):
+                rows = decompose(batch)
+        with METRICS.stage("quarantine", rows=len(rejects)):
+            rows.quarantined = quarantine(cur, path, rejects)
+        yield read, rows
+
+def batch_months(batch, rows):
+    """UTC months of a batch's orders, from the parsed orders or, once freed, the decomposed rows."""
+    if rows is None:
+        return months(r["OrderDateUtc"] for r in batch)
+    return months(r[2] for r in rows.orders)
+
+def tally(table, result):
+    """Flatten a loader's outcome Counter into "<table>.<outcome>" keys."""
+    return Counter({f"{table}.{k}": v for k, v in result.items()})
+
+def written(counts, tables):
+    return sum(counts[f"{t}.{k}"] for t in tables for k in ("inserted", "updated"))
+
+def load_table(cur, table, upsert, rows):
+    with METRICS.stage(f"load.{table}", rows=len(rows)):
+        return tally(table, upsert(cur, rows))
+
+def load_facts(cur, rows):
+    counts = Counter()
+    rollups = config.ROLLUPS and bool(rows.orders or rows.line_items)
+    if rollups:
+        prepare_rollups(cur)
+    if rows.raw_archive:
+        counts.update(load_table(cur, "raw_archive", upsert_raw_archive, rows.raw_archive))
+    if config.PARTITIONS == "month":
+        pin_partitions(cur, rows)
+    counts.update(load_table(cur, "orders", upsert_orders, rows.orders))
+    counts.update(load_table(cur, "line_items", upsert_order_line_items, rows.line_items))
+    counts.update(load_table(cur, "order_taxes", upsert_order_taxes, rows.order_taxes))
+    counts.update(load_table(cur, "line_item_taxes", upsert_line_item_taxes, rows.line_item_taxes))
+    counts.update(load_table(cur, "shipping_taxes", upsert_shipping_taxes, rows.shipping_taxes))
+    counts.update(load_table(cur, "payments", upsert_payments, rows.payments))
+    if rollups and written(counts, ("orders", "line_items")):
+        flush_rollups(cur)
+    return counts
+
+def load_dimension(cur, table, upsert, rows, cache=None):
+    """Upsert dimension rows, skipping (and counting as unchanged) rows the cache already holds."""
+    if cache is None:
+        return load_table(cur, table, upsert, rows)
+    fresh = cache.filter(rows)
+    counts = load_table(cur, table, upsert, fresh)
+    counts[f"{table}.unchanged"] += len(rows) - len(fresh)
+    cache.remember(fresh)
+    return counts
+
+def load_rows(cur, rows, caches=None):
+    """Write one RowBatch; dimensions go first so the fact rows' FKs resolve."""
+    caches = caches or {}
+    counts = load_dimension(cur, "customers", upsert_customers, rows.customers, caches.get("customers"))
+    counts.update(load_dimension(cur, "addresses", upsert_addresses, rows.addresses, caches.get("addresses")))
+    counts.update(load_facts(cur, rows))
+    counts.update(rows.quarantined)
+    return counts
+
+def load_file(cur, path, changes=None, caches=None):
+    totals = Counter()
+    for _, rows in iter_row_batches(cur, path, changes):
+        totals.update(load_rows(cur, rows, caches))
+    return totals
+
+def load_chunked(conn, paths, source, every, changes=None, caches=None):
+    """Load `paths` serially, committing after roughly every `every` orders.
+
+    Each commit falls on a batch boundary (dimensions and facts of a batch are
+    written together) and records a per-file checkpoint, so a run that stops
+    part-way resumes after its last committed chunk; the caller clears the
+    checkpoints once the run is complete.
+    """
+    totals = Counter()
+    with conn.cursor() as cur:
+        for path in paths:
+            size = os.path.getsize(path)
+            done, finished = get_checkpoint(cur, source, path, size)
+            if finished:
+                logger.info("Skipping %s (finished by an earlier run)", path)
+                continue
+            if done:
+                logger.info("Resuming %s after %s orders", path, done)
+            pending = 0
+            for read, rows in iter_row_batches(cur, path, changes, start=done):
+                totals.update(load_rows(cur, rows, caches))
+                done += read
+                pending += read
+                if pending >= every:
+                    save_checkpoint(cur, source, path, size, done)
+                    with METRICS.stage("commit"):
+                        conn.commit()
+                    pending = 0
+            save_checkpoint(cur, source, path, size, done, finished=True)
+            with METRICS.stage("commit"):
+                conn.commit()
+    return totals
@@ -0,0 +1,88 @@
+import queue
+import threading
+
+from etl.metrics import METRICS
+
+MODES = ("off", "thread", "process")
+# Seconds between checks that the producer is still there.
+_POLL = 1.0
+
+
+def _run(func, args, q, stop, own_metrics):
+    """Producer body: push every item of func(*args) onto `q`, then ("done", metrics)."""
+    def put(msg):
+        while not stop.is_set():
+            try:
+                q.put(msg, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        if own_metrics:
+            METRICS.reset()
+        for item in func(*args):
+            if not put(("item", item)):
+                if own_metrics:
+                    q.cancel_join_thread()  # the consumer is gone; don't wait to flush
+                return
+        put(("done", METRICS.stages if own_metrics else None))
+    except BaseException as e:
+        put(("error", e))
+
+
+def _get(q, worker):
+    # A producer that dies without a word (killed, out of memory) must not hang the consumer.
+    while True:
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            if not worker.is_alive():
+                break
+    try:
+        return q.get(timeout=_POLL)  # anything it sent on its way out
+    except queue.Empty:
+        code = f" with exit code {worker.exitcode}" if hasattr(worker, "exitcode") else ""
+        raise RuntimeError(f"Prefetch producer exited{code} before finishing") from None
+
+
+def prefetch(func, args, mode="thread", depth=4):
+    """Yield the items of func(*args), produced ahead of the consumer on a thread or process.
+
+    At most `depth` items wait in the queue, so a slow consumer throttles the
+    producer. Items keep their order. In "process" mode `func` and `args` must
+    be picklable and the producer's stage metrics are merged when it finishes;
+    daemonic processes (pool workers) fall back to a thread.
+    """
+    if mode not in MODES[1:]:
+        raise ValueError(f"Unknown PIPELINE mode {mode!r}; expected one of {MODES}")
+    if mode == "process":
+        from multiprocessing import current_process, get_context
+        if current_process().daemon:
+            mode = "thread"
+    if mode == "thread":
+        q, stop = queue.Queue(depth), threading.Event()
+        worker = threading.Thread(target=_run, args=(func, args, q, stop, False), daemon=True)
+    else:
+        ctx = get_context("spawn")
+        q, stop = ctx.Queue(depth), ctx.Event()
+        worker = ctx.Process(target=_run, args=(func, args, q, stop, True), daemon=True)
+    worker.start()
+    try:
+        while True:
+            with METRICS.stage("wait"):
+                kind, value = _get(q, worker)
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                if value:
+                    METRICS.merge(value)
+                return
+    finally:
+        stop.set()
+        worker.join(timeout=5)
+        if mode == "process" and worker.is_alive():
+            worker.terminate()
@@ -0,0 +1,251 @@
+import glob
+import gzip
+import io
+import json
+import os
+import re
+from itertools import islice
+
+from etl import codec
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_CHUNK_SIZE = 1 << 16
+_NON_WS = re.compile(r"[^ \t\n\r]")
+_NON_WS_BYTES = re.compile(rb"[^ \t\n\r]")
+_decode = json.JSONDecoder().raw_decode
+_MISS = object()
+
+
+def open_input(path):
+    """Open `path` as UTF-8 text, transparently decompressing gzip/zstd input."""
+    raw = open(path, "rb")
+    head = raw.peek(4)[:4]
+    if head.startswith(_GZIP_MAGIC):
+        stream = gzip.GzipFile(fileobj=raw)
+    elif head.startswith(_ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError:
+            raw.close()
+            raise RuntimeError(f"zstandard is required to read zstd-compressed input: {path}")
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding="utf-8")
+
+
+class _Buffer:
+    def __init__(self, f, chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+        self._loads, self._errors, self._finish = codec.documents()
+
+    def _fill(self, size):
+        data = self._f.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            m = _NON_WS.search(self.text, self.pos)
+            if m:
+                self.pos = m.start()
+                return self.text[self.pos]
+            self.pos = len(self.text)
+            if self.eof or not self._fill(self._chunk_size):
+                return ""
+
+    def _decode_line(self):
+        """The document at `pos` decoded by the fast codec if it ends its line (one order per line,
+        as in NDJSON and most array dumps, give or take a `,`); _MISS if it doesn't or won't decode.
+
+        From the start of a value, text that decodes whole is exactly what raw_decode would take.
+        """
+        end = self.text.find("\n", self.pos)
+        if end < 0:
+            return _MISS
+        line = self.text[self.pos:end].rstrip()
+        if line.endswith(","):
+            line = line[:-1].rstrip()
+        try:
+            value = self._loads(line)
+        except self._errors:
+            return _MISS
+        self.pos += len(line)
+        return value
+
+    def decode(self):
+        if self._loads is not None:
+            value = self._decode_line()
+            if value is not _MISS:
+                return value
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = _decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A scalar ending exactly at the buffer edge may still be truncated.
+            if end == len(self.text) and not self.eof and self._fill(size):
+                continue
+            self.pos = end
+            return value if self._finish is None else self._finish(value)
+
+
+def _iter_documents(f, chunk_size=_CHUNK_SIZE):
+    buf = _Buffer(f, chunk_size)
+    if buf.peek() != "[":
+        # JSON-lines / concatenated documents (a single object is the 1-line case)
+        while buf.peek():
+            value = buf.decode()
+            if isinstance(value, list):
+                yield from value
+            else:
+                yield value
+        return
+
+    buf.pos += 1
+    if buf.peek() == "]":
+        buf.pos += 1
+    else:
+        while True:
+            buf.peek()
+            yield buf.decode()
+            c = buf.peek()
+            buf.pos += 1
+            if c == "]":
+                break
+            if c != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf.text, buf.pos - 1)
+    if buf.peek():
+        raise json.JSONDecodeError("Extra data", buf.text, buf.pos)
+
+
+class _MappedText:
+    """Text reads from byte `pos` of an mmap, cut at UTF-8 character boundaries."""
+
+    def __init__(self, mm, pos):
+        self._mm = mm
+        self.pos = pos
+
+    def read(self, size):
+        end = min(self.pos + size, len(self._mm))
+        while end < len(self._mm) and self._mm[end] & 0xC0 == 0x80:
+            end -= 1
+        data = self._mm[self.pos:end].decode("utf-8")
+        self.pos = end
+        return data
+
+
+class _Tracked(_Buffer):
+    """A _Buffer over a mmap that also knows the byte offset of its position."""
+
+    def __init__(self, mm, pos, chunk_size=_CHUNK_SIZE):
+        super().__init__(_MappedText(mm, pos), chunk_size)
+        self._mark = 0
+        self._mark_offset = pos
+
+    def offset(self):
+        done = self.text[self._mark:self.pos]
+        self._mark_offset += len(done) if done.isascii() else len(done.encode("utf-8"))
+        self._mark = self.pos
+        return self._mark_offset
+
+    def _fill(self, size):
+        self.offset()
+        if not super()._fill(size):
+            return False
+        self._mark = 0
+        return True
+
+
+def array_start(mm):
+    """Byte offset of the first element (or the ']') of a top-level JSON array in `mm`; None for other input."""
+    m = _NON_WS_BYTES.search(mm)
+    if not m or m[0] != b"[":
+        return None
+    m = _NON_WS_BYTES.search(mm, m.end())
+    return m.start() if m else len(mm)
+
+
+class ArrayRange:
+    """The elements of a top-level JSON array that start in bytes [pos, stop) of a mmap.
+
+    `pos` is where an element (or, for an empty array, the ']') starts.
+    Iterating yields (byte offset, element) like a serial parse would; then
+    `next` is the offset of the first element at or past `stop`, or None if
+    the array ended. With `objects_only`, anything but a run of objects
+    followed by the end of the array or input is an error, which is how a
+    wrongly guessed start is told apart.
+    """
+
+    def __init__(self, mm, pos, stop, objects_only=False):
+        self._buf = _Tracked(mm, pos)
+        self.stop = stop
+        self.objects_only = objects_only
+        self.next = None
+
+    def offset(self):
+        return self._buf.offset()
+
+    def __iter__(self):
+        buf = self._buf
+        if buf.peek() == "]":
+            buf.pos += 1
+            return self._end()
+        while True:
+            c = buf.peek()
+            at = buf.offset()
+            if at >= self.stop:
+                self.next = at
+                return
+            if self.objects_only and c != "{":
+                raise json.JSONDecodeError("Expecting an object", buf.text, buf.pos)
+            yield at, buf.decode()
+            c = buf.peek()
+            buf.pos += 1
+            if c == "]":
+                return self._end()
+            if c != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf.text, buf.pos - 1)
+
+    def _end(self):
+        if self._buf.peek():
+            raise json.JSONDecodeError("Extra data", self._buf.text, self._buf.pos)
+
+
+def iter_orders(path, chunk_size=_CHUNK_SIZE):
+    """Yield orders one at a time from a JSON array, a single object or NDJSON input."""
+    with open_input(path) as f:
+        yield from _iter_documents(f, chunk_size)
+
+
+def iter_batches(records, size):
+    it = iter(records)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def resolve_inputs(path):
+    """Expand INPUT_PATH (a file, a directory or a glob) into a sorted list of files."""
+    if os.path.isdir(path):
+        files = [e.path for e in os.scandir(path) if e.is_file() and not e.name.startswith(".")]
+    elif glob.has_magic(path):
+        files = [p for p in glob.glob(path) if os.path.isfile(p)]
+    else:
+        return [path]
+    if not files:
+        raise FileNotFoundError(f"No input files found for {path}")
+    return sorted(files)
@@ -0,0 +1,175 @@
+"""Rollup tables the loaders keep up to date (ROLLUPS, on by default).
+
+    python -m etl.rollups verify              # compare every rollup with a full recompute
+    python -m etl.rollups verify --rebuild    # ...and replace the rollups with it
+
+Every upsert into orders / order_line_items also records, for the rows it
+actually wrote, their new values and the negated values of their previous
+version (read from the statement's snapshot) in a per-connection temp table.
+At the end of each batch flush() adds those deltas to the rollups in one
+statement per rollup, in key order, inside the batch's transaction.
+"""
+import argparse
+import logging
+import sys
+
+from etl import config
+from etl.metrics import METRICS
+
+logger = logging.getLogger("etl")
+
+
+class Rollup:
+    """Sums of `measures` over the rows of `source`, grouped by one expression.
+
+    Expressions are written against the table alias {t}; `columns` are the
+    source columns they read and `key` joins a written row to its previous
+    version.
+    """
+
+    def __init__(self, name, source, key, group, measures, columns, where=None):
+        self.name = name
+        self.source = source
+        self.key = key
+        self.group = group        # (column, expression)
+        self.measures = measures  # ((column, expression), ...)
+        self.columns = columns
+        self.where = where
+
+    @property
+    def _targets(self):
+        return ", ".join((self.group[0],) + tuple(c for c, _ in self.measures))
+
+    def _values(self, t, sign=""):
+        return ", ".join([self.group[1].format(t=t)] + [f"{sign}({e.format(t=t)})" for _, e in self.measures])
+
+    def _filter(self, t):
+        return f" WHERE {self.where.format(t=t)}" if self.where else ""
+
+    def temp_table(self):
+        return (
+            f"CREATE TEMP TABLE IF NOT EXISTS _delta_{self.name} AS "
+            f"SELECT {self._targets} FROM {self.name} WITH NO DATA"
+        )
+
+    def capture(self):
+        """CTE for counted_statement: the deltas of the `written` rows, into the temp table."""
+        return (
+            f", capture_{self.name} AS (\n"
+            f"INSERT INTO _delta_{self.name} ({self._targets})\n"
+            f"SELECT {self._values('w')} FROM written w{self._filter('w')}\n"
+            f"UNION ALL\n"
+            f"SELECT {self._values('o', '-')} FROM {self.source} o "
+            f"JOIN written w ON o.{self.key} = w.{self.key}{self._filter('o')}\n"
+            f")"
+        )
+
+    def remove(self, relation):
+        """Capture the negated values of every row of `relation` (rows of `source` about to go)."""
+        return (
+            f"INSERT INTO _delta_{self.name} ({self._targets}) "
+            f"SELECT {self._values('o', '-')} FROM {relation} o{self._filter('o')}"
+        )
+
+    def flush(self):
+        """Apply and clear the captured deltas; keys are locked in order, so concurrent loaders can't deadlock."""
+        col = self.group[0]
+        sums = [f"coalesce(sum({c}), 0)" for c, _ in self.measures]
+        sets = ", ".join(f"{c} = {self.name}.{c} + EXCLUDED.{c}" for c, _ in self.measures)
+        return (
+            f"INSERT INTO {self.name} ({self._targets})\n"
+            f"SELECT {col}, {', '.join(sums)} FROM _delta_{self.name} GROUP BY {col}\n"
+            f"HAVING {' OR '.join(f'{s} <> 0' for s in sums)} ORDER BY {col}\n"
+            f"ON CONFLICT ({col}) DO UPDATE SET {sets};\n"
+            f"TRUNCATE _delta_{self.name}"
+        )
+
+    def recompute(self):
+        sums = ", ".join(f"coalesce(sum({e.format(t='t')}), 0) AS {c}" for c, e in self.measures)
+        return f"SELECT {self.group[1].format(t='t')} AS {self.group[0]}, {sums} FROM {self.source} t{self._filter('t')} GROUP BY 1"
+
+    def mismatches(self, cur):
+        """Keys where the rollup and a full recompute disagree: (key, stored, recomputed)."""
+        cols = [c for c, _ in self.measures]
+        stored = ", ".join(f"coalesce(r.{c}, 0)" for c in cols)
+        fresh = ", ".join(f"coalesce(f.{c}, 0)" for c in cols)
+        cur.execute(
+            f"SELECT {self.group[0]}, ({stored})::text, ({fresh})::text "
+            f"FROM {self.name} r FULL JOIN ({self.recompute()}) f USING ({self.group[0]}) "
+            f"WHERE ({stored}) IS DISTINCT FROM ({fresh}) ORDER BY 1"
+        )
+        return cur.fetchall()
+
+    def rebuild(self, cur):
+        cur.execute(f"DELETE FROM {self.name}; INSERT INTO {self.name} ({self._targets}) {self.recompute()}")
+
+
+ROLLUPS = (
+    # Revenue per UTC day
+    Rollup(
+        "daily_revenue", "orders", "internal_order_id",
+        ("day", "({t}.order_date_utc AT TIME ZONE 'UTC')::date"),
+        (("orders", "1"), ("revenue", "{t}.order_total")),
+        columns=("internal_order_id", "order_date_utc", "order_total"),
+    ),
+    # Quantity ordered per SKU (line items without one are left out)
+    Rollup(
+        "sku_quantities", "order_line_items", "internal_line_item_id",
+        ("sku", "{t}.sku"),
+        (("line_items", "1"), ("quantity", "{t}.quantity_ordered")),
+        columns=("internal_line_item_id", "sku", "quantity_ordered"),
+        where="{t}.sku IS NOT NULL",
+    ),
+)
+
+def for_table(source):
+    """The rollups fed by upserts into `source`; none with ROLLUPS off."""
+    if not config.ROLLUPS:
+        return ()
+    return tuple(r for r in ROLLUPS if r.source == source)
+
+def temp_tables():
+    return ";\n".join(r.temp_table() for r in ROLLUPS)
+
+def flush_statement():
+    return ";\n".join(r.flush() for r in ROLLUPS)
+
+def prepare(cur):
+    """Create this connection's delta tables, if this transaction doesn't have them yet."""
+    with METRICS.stage("rollups"):
+        cur.execute(temp_tables())
+
+def flush(cur):
+    with METRICS.stage("rollups"):
+        cur.execute(flush_statement())
+
+
+def main(argv=None):
+    from etl.db import get_conn
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    v = sub.add_parser("verify", help="compare the rollups with a full recompute; exit 1 on a mismatch")
+    v.add_argument("--rebuild", action="store_true", help="replace the rollups with the recompute")
+    v.add_argument("--show", type=int, default=10, help="mismatching keys to log per rollup")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    failed = False
+    with get_conn() as conn, conn.cursor() as cur:
+        for rollup in ROLLUPS:
+            bad = rollup.mismatches(cur)
+            if not bad:
+                logger.info("%s matches a full recompute", rollup.name)
+                continue
+            logger.warning("%s: %s keys differ from a full recompute", rollup.name, len(bad))
+            for key, stored, fresh in bad[:args.show]:
+                logger.warning("  %s: stored %s, recomputed %s", key, stored, fresh)
+            if args.rebuild:
+                rollup.rebuild(cur)
+                logger.info("Rebuilt %s", rollup.name)
+            else:
+                failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
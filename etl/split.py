@@ -0,0 +1,139 @@
+"""Parsing one large JSON array file on several processes (SPLIT_WORKERS).
+
+The file is memory-mapped and cut into SPLIT_CHUNK_MB byte ranges, and each
+range goes to a worker process that maps the file itself, so nothing but
+offsets and results cross between processes. A worker guesses where the first
+order of its range starts (the first `}, {` in it) and parses and transforms
+the orders starting in the range from there. A guess that lands inside a
+string or a nested array soon fails to parse as a run of objects ending the
+array, and the worker moves on to the next guess.
+
+The ranges are then taken in file order. A range is accepted when its first
+order starts exactly where the previous range says the next order starts:
+from a true element start the parse can only follow the elements a serial
+parse sees. A range that doesn't line up is parsed again here from the known
+offset. The orders come out exactly as a serial parse yields them; only the
+batches start afresh with each range.
+"""
+import json
+import logging
+import mmap
+import os
+import re
+from collections import deque
+
+from etl import config
+from etl.metrics import METRICS
+from etl.reader import _GZIP_MAGIC, _ZSTD_MAGIC, ArrayRange, array_start
+
+logger = logging.getLogger("etl")
+
+# A `}` `,` `{` run: the `{` may start the next element of the top-level array.
+_GUESS = re.compile(rb"\}[ \t\n\r]*,[ \t\n\r]*\{")
+# How far before a range to look for the `}` of a guess whose `{` is in the range.
+_LOOKBEHIND = 4096
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def splittable(path):
+    """Whether `path` is an uncompressed JSON array file worth splitting (at least two ranges)."""
+    if os.path.getsize(path) < 2 * (config.SPLIT_CHUNK_MB << 20):
+        return False
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith(_GZIP_MAGIC) or head.startswith(_ZSTD_MAGIC):
+        return False
+    with _map(path) as mm:
+        return array_start(mm) is not None
+
+def _guesses(mm, pos, stop):
+    lo = max(pos - _LOOKBEHIND, 0)
+    while True:
+        m = _GUESS.search(mm, lo, stop)
+        if m is None:
+            return
+        lo = m.end() - 1
+        if lo >= pos:
+            yield lo
+
+def parse_range(path, pos, stop, known, decompose_rows, skip=0):
+    """Parse and transform the orders starting in bytes [pos, stop) of `path`.
+
+    `known` says `pos` is a true element start; otherwise the first one is
+    guessed. The first `skip` orders are parsed but left out. Returns (first
+    order's offset, next range's first offset, orders, batches as from
+    parse_batches).
+    """
+    from etl.pipeline import parse_batches
+    with _map(path) as mm:
+        for start in ((pos,) if known else _guesses(mm, pos, stop)):
+            elements = ArrayRange(mm, start, stop, objects_only=not known)
+            offsets = []
+
+            def orders():
+                for at, order in elements:
+                    offsets.append(at)
+                    if len(offsets) > skip:
+                        yield order
+            try:
+                batches = list(parse_batches(orders(), decompose_rows))
+            except json.JSONDecodeError:
+                if known:
+                    raise
+                continue
+            return (offsets[0] if offsets else None), elements.next, len(offsets), batches
+    return None, None, 0, []
+
+def _work(*args):
+    """parse_range in a pool worker, plus the worker's stage metrics."""
+    METRICS.reset()
+    return parse_range(*args), METRICS.stages
+
+
+def iter_split(path, start=0, decompose_rows=True, chunk=None):
+    """parse_batches' output for `path`, parsed in `chunk`-byte ranges on SPLIT_WORKERS processes."""
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    size = os.path.getsize(path)
+    with _map(path) as mm:
+        first = array_start(mm)
+    chunk = chunk or config.SPLIT_CHUNK_MB << 20
+    ranges = [(pos, min(pos + chunk, size)) for pos in range(first, size, chunk)]
+    logger.info("Parsing %s in %s ranges on %s processes", path, len(ranges), config.SPLIT_WORKERS)
+
+    # spawn: a forked worker would share this process's database sockets.
+    pool = ProcessPoolExecutor(config.SPLIT_WORKERS, mp_context=get_context("spawn"))
+    pending = deque()
+    todo = iter(enumerate(ranges))
+
+    def submit():
+        for i, (pos, stop) in todo:
+            pending.append(((pos, stop), pool.submit(_work, path, pos, stop, i == 0, decompose_rows)))
+            return
+
+    try:
+        for _ in range(2 * config.SPLIT_WORKERS):
+            submit()
+        expected, skip = first, start
+        while pending:
+            (pos, stop), future = pending.popleft()
+            submit()
+            with METRICS.stage("wait"):
+                (found, after, count, batches), stages = future.result()
+            METRICS.merge(stages)
+            if expected is None or expected >= stop:
+                continue  # the array ended, or one order spans the whole range
+            if found != expected or 0 < skip < count:
+                with METRICS.stage("resplit"):
+                    found, after, count, batches = parse_range(path, expected, stop, True, decompose_rows, skip)
+            elif skip:
+                batches = ()  # loaded before this (resumed) run
+            skip = max(skip - count, 0)
+            expected = after
+            yield from batches
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
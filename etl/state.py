@@ -0,0 +1,42 @@
+def get_watermark(cur, source):
+    cur.execute("SELECT high_water_mark FROM etl_state WHERE source = %s", (source,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def save_watermark(cur, source, mark):
+    if mark is None:
+        return
+    cur.execute("""
+    INSERT INTO etl_state (source, high_water_mark) VALUES (%s, %s)
+    ON CONFLICT (source) DO UPDATE
+    SET high_water_mark = GREATEST(etl_state.high_water_mark, EXCLUDED.high_water_mark),
+        updated_at      = now();
+    """, (source, mark))
+
+
+def get_checkpoint(cur, source, path, file_size):
+    """Orders already committed from `path` and whether the file is finished.
+
+    A checkpoint written for a file of a different size is ignored.
+    """
+    cur.execute(
+        "SELECT file_size, records, finished FROM etl_checkpoints WHERE source = %s AND path = %s",
+        (source, path),
+    )
+    row = cur.fetchone()
+    if row is None or row[0] != file_size:
+        return 0, False
+    return row[1], row[2]
+
+def save_checkpoint(cur, source, path, file_size, records, finished=False):
+    cur.execute("""
+    INSERT INTO etl_checkpoints (source, path, file_size, records, finished) VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (source, path) DO UPDATE
+    SET file_size  = EXCLUDED.file_size,
+        records    = EXCLUDED.records,
+        finished   = EXCLUDED.finished,
+        updated_at = now();
+    """, (source, path, file_size, records, finished))
+
+def clear_checkpoints(cur, source):
+    cur.execute("DELETE FROM etl_checkpoints WHERE source = %s", (source,))
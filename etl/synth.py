@@ -0,0 +1,197 @@
+"""Deterministic synthetic orders shaped like data/orders_data.json.
+
+    python -m etl.synth --orders 100000 --seed 1 --out /tmp/orders.json
+"""
+import argparse
+import gzip
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+FIRST_NAMES = ("Anna", "Mads", "Sofie", "Lars", "Freja", "Jonas", "Ida", "Mikkel", "Emma", "Søren")
+LAST_NAMES = ("Jensen", "Nielsen", "Hansen", "Pedersen", "Andersen", "Christensen", "Larsen", "Sørensen")
+CITIES = (("Copenhagen", "1203"), ("Aarhus", "8000"), ("Odense", "5000"), ("Aalborg", "9000"), ("Esbjerg", "6700"))
+STREETS = ("Nybrogade", "Strøget", "Vesterbrogade", "Nørrebrogade", "Amagerbrogade", "Østergade")
+PRODUCTS = (
+    ("VELVET/MRKEGRN, PYNTEPUDE", "M* Living", 299.0),
+    ("Koral Musselmalet Halvblonde Tallerken 19 cm", "Royal Copenhagen", 1167.55),
+    ("Bomulds T-shirt, Hvid", "Magasin du Nord Collection", 149.95),
+    ("Læderbælte, Sort", "Tiger of Sweden", 899.0),
+    ("Duftlys 200 g", "Skandinavisk", 349.0),
+    ("Uldtæppe 130x180", "Klippan", 1099.0),
+)
+# (InternalTaxRateId, Rate); the first one is the common DK VAT rate.
+TAX_RATES = ((8, 0.25), (9, 0.0), (10, 0.12), (11, 0.06), (12, 0.19), (13, 0.21))
+STATUSES = (
+    ("Paid", "FullyInvoiced", "FullyShipped"),
+    ("ShipmentsCreated", "NotInvoiced", "NotShipped"),
+    ("Cancelled", "NotInvoiced", "NotShipped"),
+)
+EPOCH = datetime(2025, 9, 1, tzinfo=timezone.utc)
+
+
+def _utc(ts):
+    return ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+
+def _fields(**values):
+    return [{"Name": k, "Value": v} for k, v in values.items()]
+
+def _tax(rate_id, rate, amount):
+    return {
+        "InternalTaxRateId": rate_id, "Amount": round(amount, 2),
+        "BackendName": f"VAT DK {rate}", "PublicTaxName": f"VAT DK {round(rate * 100)}%",
+        "TaxType": "Net", "Rate": rate,
+    }
+
+def _customer(cid):
+    first, last = FIRST_NAMES[cid % len(FIRST_NAMES)], LAST_NAMES[cid // 7 % len(LAST_NAMES)]
+    return {
+        "FirstName": first, "LastName": last,
+        "EmailAddress": f"{first.lower()}.{cid}@example.com",
+        "InternalCustomerId": cid, "ExternalCustomerId": None, "UserId": str(80000000 + cid),
+    }
+
+def _address(aid):
+    city, zip_code = CITIES[aid % len(CITIES)]
+    return {
+        "Id": aid, "ExternalAddressId": "",
+        "FirstName": FIRST_NAMES[aid % len(FIRST_NAMES)], "LastName": LAST_NAMES[aid % len(LAST_NAMES)],
+        "CompanyName": "", "AddressLine1": f"{STREETS[aid % len(STREETS)]} {aid % 120 + 1}",
+        "AddressLine2": "", "AddressLine3": "", "City": city, "State": "DEFAULT",
+        "ZipCode": zip_code, "CountryCode": "DK", "Latitude": None, "Longitude": None,
+    }
+
+
+def generate(orders, seed=0, max_line_items=4, reuse=0.8, tax_rates=2, start_id=1):
+    """Yield `orders` synthetic orders; the same arguments always yield the same orders.
+
+    `reuse` is the share of orders placed by a returning customer: there are
+    about orders * (1 - reuse) distinct customers, each with a billing and a
+    shipping address. Each order has 1..max_line_items line items, each taxed
+    at one of the first `tax_rates` rates.
+    """
+    rng = random.Random(seed)
+    customers = max(1, round(orders * (1 - reuse)))
+    rates = TAX_RATES[:max(1, min(tax_rates, len(TAX_RATES)))]
+    rate_of = dict(rates)
+    line_id = start_id * 10
+    for n in range(orders):
+        oid = start_id + n
+        cid = 1 + rng.randrange(customers)
+        placed = EPOCH + timedelta(seconds=n * 30 + rng.randrange(30), milliseconds=rng.randrange(1000))
+        updated = placed + timedelta(minutes=rng.randrange(5, 600))
+        status, invoiced, shipped = STATUSES[0] if rng.random() < 0.8 else rng.choice(STATUSES[1:])
+        done = status == "Paid"
+
+        line_items, taxes = [], {}
+        for _ in range(rng.randint(1, max(1, max_line_items))):
+            product = rng.randrange(len(PRODUCTS))
+            name, brand, price = PRODUCTS[product]
+            qty = rng.randint(1, 3)
+            discount = rng.choice((0, 0, 0, round(price * 0.1, 2)))
+            subtotal = round((price - discount) * qty, 2)
+            rate_id, rate = rng.choice(rates)
+            tax = round(subtotal * rate / (1 + rate), 2)
+            taxes[rate_id] = taxes.get(rate_id, 0) + tax
+            sku = f"S{12000000 + product * 1000 + rng.randrange(1000)}"
+            line_items.append({
+                "InternalLineItemId": line_id, "ProductName": name,
+                "ItemName": f"{rng.randrange(1000, 9999)},{brand},{name},{sku[1:]}",
+                "Description": "",
+                "QuantityInvoiced": qty if done else 0, "QuantityShipped": qty if done else 0,
+                "QuantityCancelled": qty if status == "Cancelled" else 0, "QuantityReturned": 0,
+                "SubTotal": subtotal, "TotalTax": tax, "Total": subtotal, "IsPreOrder": rng.random() < 0.02,
+                "Taxes": [_tax(rate_id, rate, tax)],
+                "SKU": sku, "ExternalLineItemId": None, "QuantityOrdered": qty,
+                "UnitPrice": price, "UnitDiscount": discount,
+                "CustomFields": _fields(externallineitemid=str(len(line_items) + 1), productean=sku[1:],
+                                        restrictiongroup="GENERIC", size="NO_SIZE",
+                                        unittotal=f"{price - discount:.6f}"),
+            })
+            line_id += 1
+
+        sub_total = round(sum(li["SubTotal"] for li in line_items), 2)
+        shipping = rng.choice((0, 0, 29, 55))
+        discount_total = rng.choice((0, 0, 0, round(sub_total * 0.05, 2)))
+        order_total = round(sub_total + shipping - discount_total, 2)
+        vat_id, vat = rates[0]
+        shipping_tax = round(shipping * vat / (1 + vat), 2)
+        yield {
+            "InternalOrderId": oid,
+            "ExternalOrderId": str(10000000 + oid),
+            "OrderDateUtc": _utc(placed),
+            "LastUpdatedDateUtc": _utc(updated),
+            "DeadlineDateUtc": None,
+            "OrderStatus": status, "InvoiceStatus": invoiced, "ShipmentStatus": shipped,
+            "ShipToStore": None,
+            "BillingCustomer": _customer(cid),
+            "LineItems": line_items,
+            "BillingAddress": _address(cid * 2),
+            "ShippingAddress": _address(cid * 2 + 1),
+            "OrderPayments": [{
+                "InternalOrderPaymentId": oid, "ExternalOrderPaymentId": None,
+                "PaymentType": "CreditCard", "PaymentTypeDescription": "OTHER - XXXXXXXXXXXX0000",
+                "PaymentId": 10000 + oid, "Amount": order_total, "AmountAuthorized": order_total,
+                "AmountCaptured": order_total if done else 0, "Status": "Captured" if done else "Authorized",
+                "LastUpdatedBy": {"StaffName": "", "StaffId": None},
+                "CustomFields": _fields(refundpriority=True, capturepriority=0),
+            }],
+            "Taxes": [_tax(rid, rate_of[rid], amount) for rid, amount in sorted(taxes.items())],
+            "ShippingRate": [{
+                "InternalShippingRateId": 33, "PublicShippingRateName": "glsPrivate", "BackendName": "glsPrivate",
+                "RateCode": "glsPrivate", "CurrentRate": shipping, "EnableReturnLabelGeneration": False,
+            }],
+            "ShippingTaxes": [_tax(vat_id, vat, shipping_tax)] if shipping else [],
+            "ShippingTotal": shipping,
+            "SubTotal": sub_total,
+            "DiscountTotal": discount_total,
+            "OrderTotal": order_total,
+            "CurrencyCode": "DKK",
+            "UICultureName": "da-DK",
+            "EStoreCultureName": "da-DK",
+            "Channel": "MAGASIN_DK_DKK",
+            "AdditionalFlags": "None",
+            "Comments": "",
+            "OriginIPAddress": "",
+            "CustomFields": _fields(ordertype="STD", ordercaptured=done, isguest="no",
+                                    ordercompleteddate=_utc(updated) if done else None),
+            "AdditionalInformation": {"OrderCurrency": "DKK", "IsImportedOrder": True},
+        }
+
+
+def write(path, orders, fmt="json", compress=False):
+    """Stream `orders` to `path` as a JSON array or NDJSON, optionally gzip-compressed."""
+    opener = gzip.open if compress else open
+    count = 0
+    with opener(path, "wt", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[")
+        for order in orders:
+            if fmt == "json":
+                f.write(",\n" if count else "\n")
+            f.write(json.dumps(order, ensure_ascii=False))
+            if fmt == "ndjson":
+                f.write("\n")
+            count += 1
+        if fmt == "json":
+            f.write("\n]\n")
+    return count
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--orders", type=int, default=10000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--max-line-items", type=int, default=4)
+    ap.add_argument("--reuse", type=float, default=0.8, help="share of orders from returning customers")
+    ap.add_argument("--tax-rates", type=int, default=2, help=f"distinct tax rates (max {len(TAX_RATES)})")
+    ap.add_argument("--start-id", type=int, default=1)
+    ap.add_argument("--format", choices=("json", "ndjson"), default="json")
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args(argv)
+    orders = generate(args.orders, args.seed, args.max_line_items, args.reuse, args.tax_rates, args.start_id)
+    write(args.out, orders, args.format, args.gzip)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Shared Postgres for the integration tests.
+
+One container per session. docs/data_model.sql is applied once, to a template
+database; every database a test asks for is cloned from it with
+CREATE DATABASE ... TEMPLATE (a file copy, no DDL) and dropped afterwards.
+Tests get a `db` of their own, or call `clone_db()` for more (or for a
+fixture of a wider scope).
+
+The ETL runs against a Database in this process (`db.run`), or as the CLI
+in a subprocess (`db.cli`) where a test needs its exit code, its stderr,
+signals or worker processes of its own.
+"""
+import os, pathlib, subprocess, sys, uuid
+import urllib.parse as up
+
+import psycopg2
+import pytest
+from testcontainers.postgres import PostgresContainer
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[2]
+SCHEMA_PATH = REPO_ROOT / "docs" / "data_model.sql"
+
+
+class Database:
+    """A scratch database cloned from the schema template."""
+
+    def __init__(self, server, name):
+        self.name = name
+        self.params = dict(server, dbname=name)
+        self._conns = []
+
+    def connect(self):
+        conn = psycopg2.connect(**self.params)
+        self._conns.append(conn)
+        return conn
+
+    def env(self, **settings):
+        """os.environ for a subprocess on this database, plus `settings` (config names)."""
+        p = self.params
+        env = dict(os.environ, PGDATABASE=p["dbname"], PGUSER=p["user"], PGPASSWORD=p["password"],
+                   PGHOST=p["host"], PGPORT=p["port"], PYTHONPATH=str(REPO_ROOT))
+        env.update({k: str(v) for k, v in settings.items()})
+        return env
+
+    def cli(self, *args, check=True, **settings):
+        """`python <args>` (default: -m etl.main) on this database; returns the CompletedProcess."""
+        return subprocess.run([sys.executable, *(args or ("-m", "etl.main"))], cwd=str(REPO_ROOT),
+                              env=self.env(**settings), capture_output=True, text=True, check=check)
+
+    def run(self, **settings):
+        """etl.main.run() in this process with `settings` (config names) in effect; returns its totals.
+
+        They are set in os.environ too, so worker processes see them.
+        """
+        from etl import config, partitions
+        from etl.main import run
+
+        settings.setdefault("SOURCE_NAME", settings.get("INPUT_PATH", config.INPUT_PATH))
+        p = self.params
+        saved = {k: getattr(config, k) for k in settings}, dict(config.DB_CONN), dict(os.environ)
+        config.DB_CONN.update(dbname=p["dbname"], user=p["user"], password=p["password"],
+                              host=p["host"], port=p["port"])
+        for k, v in settings.items():
+            setattr(config, k, v)
+        os.environ.update(self.env(**settings))
+        partitions.forget()  # months known for another database
+        try:
+            return run()
+        finally:
+            for k, v in saved[0].items():
+                setattr(config, k, v)
+            config.DB_CONN.clear()
+            config.DB_CONN.update(saved[1])
+            os.environ.clear()
+            os.environ.update(saved[2])
+            partitions.forget()
+
+    def close(self):
+        for conn in self._conns:
+            conn.close()
+
+
+@pytest.fixture(scope="session")
+def pg_server():
+    """Connection parameters of the session's Postgres server (its own database)."""
+    with PostgresContainer("postgres:15") as pg:
+        p = up.urlparse(pg.get_connection_url())
+        yield {"dbname": p.path.lstrip("/"), "user": p.username, "password": p.password,
+               "host": p.hostname, "port": str(p.port)}
+
+@pytest.fixture(scope="session")
+def _admin(pg_server):
+    conn = psycopg2.connect(**pg_server)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+@pytest.fixture(scope="session")
+def schema_template(pg_server, _admin):
+    """Name of a database holding docs/data_model.sql and nothing else."""
+    name = f"etl_template_{uuid.uuid4().hex[:8]}"
+    with _admin.cursor() as cur:
+        cur.execute(f"CREATE DATABASE {name} ENCODING 'UTF8' TEMPLATE template0")
+    conn = psycopg2.connect(**dict(pg_server, dbname=name))
+    with conn, conn.cursor() as cur:
+        cur.execute(SCHEMA_PATH.read_text(encoding="utf-8"))
+    conn.close()  # a template can't be cloned while anyone is connected to it
+    yield name
+    with _admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {name}")
+
+@pytest.fixture(scope="session")
+def clone_db(pg_server, _admin, schema_template):
+    """Factory of fresh Databases cloned from the template; all are dropped at the end of the session."""
+    made = []
+
+    def clone():
+        db = Database(pg_server, f"etl_test_{uuid.uuid4().hex[:12]}")
+        with _admin.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {db.name} TEMPLATE {schema_template}")
+        made.append(db)
+        return db
+    yield clone
+    for db in made:
+        _drop(_admin, db)
+
+def _drop(admin, db):
+    db.close()
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {db.name} WITH (FORCE)")
+
+@pytest.fixture
+def db(clone_db, _admin):
+    """A fresh database with the schema applied, dropped after the test."""
+    database = clone_db()
+    yield database
+    _drop(_admin, database)
@@ -0,0 +1,49 @@
+import json
+import pytest
+
+SCHEMA = """
+SELECT indexdef FROM pg_indexes WHERE schemaname = 'public'
+UNION ALL
+SELECT conrelid::regclass || ' ' || conname || ' ' || pg_get_constraintdef(oid) FROM pg_constraint
+WHERE connamespace = 'public'::regnamespace
+ORDER BY 1
+"""
+
+def order(oid):
+    return {
+        "InternalOrderId": oid, "OrderDateUtc": "2025-09-01T05:40:48Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "BillingCustomer": {"InternalCustomerId": oid % 3, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": oid * 10, "SKU": f"SKU{oid % 2}", "QuantityOrdered": 1}],
+        "Taxes": [{"InternalTaxRateId": 8, "Amount": 2.0}],
+    }
+
+@pytest.mark.parametrize("engine", ["values", "asyncpg"])
+def test_backfill_restores_schema(tmp_path, db, engine):
+    conn = db.connect()
+    with conn, conn.cursor() as cur:
+        cur.execute(SCHEMA)
+        schema = cur.fetchall()
+
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([order(i) for i in range(1, 21)]), encoding="utf-8")
+    run = lambda *args: db.cli(*args, INPUT_PATH=fx, LOAD_ENGINE=engine, BACKFILL="auto")
+
+    def state():
+        with conn, conn.cursor() as cur:
+            cur.execute(SCHEMA)
+            found = cur.fetchall()
+            cur.execute("SELECT (SELECT count(*) FROM order_line_items), (SELECT count(*) FROM etl_backfill_ddl)")
+            return found, cur.fetchone()
+
+    run("-m", "etl.main")
+    assert state() == (schema, (20, 0))
+    run("-m", "etl.rollups", "verify")
+
+    # a backfill that died after dropping the indexes is finished by the next run, backfill or not
+    kill = "from etl.backfill import drop; from etl.db import connect; drop(connect().cursor())"
+    for backfill in ("auto", "off"):
+        run("-c", kill)
+        dropped, (_, pending) = state()
+        assert len(dropped) < len(schema) and pending > 0
+        db.cli(INPUT_PATH=fx, LOAD_ENGINE=engine, BACKFILL=backfill)
+        assert state() == (schema, (20, 0))
@@ -0,0 +1,18 @@
+from etl.cache import DimensionCache, cache_stats
+
+def test_cache_drops_repeats_until_content_changes():
+    cache = DimensionCache(10)
+    rows = [(1, "a"), (2, "b")]
+    assert cache.filter(rows) == rows
+    cache.remember(rows)
+    assert cache.filter([(1, "a"), (2, "changed")]) == [(2, "changed")]
+    assert cache.stats() == {"hits": 1, "misses": 3, "evictions": 0}
+
+def test_cache_evicts_least_recently_used():
+    cache = DimensionCache(2)
+    cache.remember([(1, "a"), (2, "b")])
+    cache.filter([(1, "a")])           # 1 is now the most recently used
+    cache.remember([(3, "c")])
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.filter([(1, "a"), (2, "b"), (3, "c")]) == [(2, "b")]
+    assert cache_stats({"customers": cache})["customers.cache_evictions"] == 1
@@ -0,0 +1,42 @@
+import json
+
+def orders():
+    return [{
+        "InternalOrderId": i, "OrderDateUtc": "2025-09-01T05:26:24Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "SubTotal": 1.0, "BillingCustomer": {"InternalCustomerId": i % 3, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": i * 10, "SKU": "SKU1", "QuantityOrdered": 1}],
+    } for i in range(1, 11)]
+
+# Makes the database refuse order 7, so the run fails part way through an unchanged file.
+REFUSE_ORDER_7 = """
+CREATE FUNCTION refuse_order_7() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF NEW.internal_order_id = 7 THEN RAISE EXCEPTION 'order 7 refused'; END IF;
+  RETURN NEW;
+END $$;
+CREATE TRIGGER refuse_order_7 BEFORE INSERT OR UPDATE ON orders FOR EACH ROW EXECUTE FUNCTION refuse_order_7();
+"""
+
+def test_chunked_run_resumes_after_last_commit(tmp_path, db):
+    conn = db.connect()
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps(orders()), encoding="utf-8")
+    with conn, conn.cursor() as cur:
+        cur.execute(REFUSE_ORDER_7)
+    settings = dict(INPUT_PATH=fx, BATCH_SIZE=2, COMMIT_EVERY=4)
+
+    # Order 7 fails: the chunks committed before it (orders 1-4) stay, with their checkpoint.
+    failed = db.cli(check=False, **settings)
+    assert failed.returncode != 0
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM orders"); assert cur.fetchone()[0] == 4
+        cur.execute("SELECT count(*) FROM order_line_items"); assert cur.fetchone()[0] == 4
+        cur.execute("SELECT records, finished FROM etl_checkpoints"); assert cur.fetchall() == [(4, False)]
+
+    with conn, conn.cursor() as cur:
+        cur.execute("DROP TRIGGER refuse_order_7 ON orders")
+    out = db.cli(**settings)
+    assert "after 4 orders" in out.stderr
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM orders"); assert cur.fetchone()[0] == 10
+        cur.execute("SELECT count(*) FROM etl_checkpoints"); assert cur.fetchone()[0] == 0
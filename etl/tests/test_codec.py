@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from etl import codec, config
+from etl.reader import iter_orders
+from etl.transform import TABLES, decompose, mapped
+
+BACKENDS = codec.available()
+
+# Numbers the fast codecs spell or read differently from the stdlib, and text needing escapes.
+ODD = {
+    "Floats": [0.1, 12.5, -0.0, 1e-05, 0.00009, 1.234e-07, 1e16, 1.5e+16, 5e-324, 1e300, 1000000000000000.0],
+    "Ints": [0, -1, 2**63 - 1, -2**63, 2**64, 123456789012345678901234567890],
+    "Text": 'Grøn ✓ 😀 "q" \\ / \n\t\x00\x1f\x7f   :1e5 ,0.00001',
+}
+ORDERS = [
+    {
+        "InternalOrderId": i, "OrderDateUtc": "2025-09-01T05:40:48Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "OrderTotal": 10.5 * i, "CustomFields": {"Gift": True, "Odd": ODD}, "AdditionalInformation": [ODD],
+        "BillingCustomer": {"InternalCustomerId": i, "FirstName": "Å", "Loyalty": {"Tier": 2}},
+        "BillingAddress": None,
+        "LineItems": [{"InternalLineItemId": i * 10, "SKU": "S", "Extra": 1,
+                       "Taxes": [{"InternalTaxRateId": 8, "Amount": 2.0, "Note": "x"}] + [None] * (i == 3)}],
+        "OrderPayments": "not a list" if i == 3 else [],
+    }
+    for i in range(1, 6)
+]
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    monkeypatch.setattr(config, "JSON_CODEC", request.param)
+    return request.param
+
+def test_dumps_is_the_same_text_on_every_backend():
+    expected = json.dumps(ORDERS, separators=(",", ":"), ensure_ascii=False)
+    for name in BACKENDS:
+        assert codec.get(name).dumps(ORDERS) == expected, name
+        assert codec.get(name).loads(expected) == ORDERS, name
+
+@pytest.mark.parametrize("layout", ["lines", "indent", "ndjson"])
+@pytest.mark.parametrize("typed", [False, True])
+def test_every_backend_reads_the_same_orders(tmp_path, monkeypatch, backend, layout, typed):
+    monkeypatch.setattr(config, "JSON_TYPED", typed)
+    monkeypatch.setattr(config, "RAW_MODE", "none")
+    text = {
+        "lines": "[\n" + ",\n".join(json.dumps(o) for o in ORDERS) + "\n]\n",
+        "indent": json.dumps(ORDERS, indent=2),
+        "ndjson": "".join(json.dumps(o, ensure_ascii=False) + "\r\n" for o in ORDERS) + "NaN\n",
+    }[layout]
+    p = tmp_path/"orders.json"
+    p.write_text(text, encoding="utf-8")
+    expected = json.loads(text) if layout != "ndjson" else ORDERS + [float("nan")]
+    got = list(iter_orders(str(p), chunk_size=256))
+    if typed:
+        expected = [mapped(o) for o in expected]
+        assert "CustomFields" not in got[0] and "Extra" not in got[0]["LineItems"][0]
+    assert json.dumps(got) == json.dumps(expected)
+
+def test_mapped_keeps_what_the_loaders_read(monkeypatch):
+    monkeypatch.setattr(config, "RAW_MODE", "none")
+    cut = [mapped(o) for o in ORDERS]
+    assert cut[0]["BillingCustomer"] == {"InternalCustomerId": 1, "FirstName": "Å"}
+    assert cut[2]["LineItems"][0]["Taxes"] == [{"InternalTaxRateId": 8, "Amount": 2.0}, None]
+    assert cut[2]["OrderPayments"] == "not a list"
+    full, typed = decompose(ORDERS[:2]), decompose(cut[:2])
+    assert all(getattr(full, t) == getattr(typed, t) for t in TABLES)
+
+def test_msgspec_decodes_orders_straight_into_their_mapped_fields(monkeypatch):
+    pytest.importorskip("msgspec")
+    monkeypatch.setattr(config, "JSON_CODEC", "msgspec")
+    monkeypatch.setattr(config, "JSON_TYPED", True)
+    monkeypatch.setattr(config, "RAW_MODE", "none")
+    docs = codec.documents()
+    clean = dict(ORDERS[0], CustomFields={"Gift": True}, AdditionalInformation=[{"Note": "x"}])
+    text = json.dumps(clean).encode()
+    assert docs.finish is not None and docs.loads(text) == mapped(clean) == mapped(json.loads(text))
+    # parts of the wrong type are left to the stdlib, which reads the whole order and cuts it down
+    with pytest.raises(docs.errors):
+        docs.loads(json.dumps(ORDERS[2]).encode())
@@ -1,23 +1,6 @@
-import json, os, pathlib, psycopg2, subprocess, sys
-from pathlib import Path
-from testcontainers.postgres import PostgresContainer
-import urllib.parse as up
+import json
 import pytest
 
-# -------- helpers to resolve repo root & schema path --------
-def find_upwards(start: Path, rel: str) -> Path:
-    cur = start.resolve()
-    for _ in range(6):
-        cand = cur / rel
-        if cand.exists():
-            return cand
-        cur = cur.parent
-    raise FileNotFoundError(f"Could not find {rel} starting from {start}")
-
-THIS = Path(__file__)
-SCHEMA_PATH = find_upwards(THIS, "docs/data_model.sql")
-REPO_ROOT = SCHEMA_PATH.parent.parent  # repo root
-
 # -------- a fixture we can assert against --------
 SAMPLE = [{
     "InternalOrderId": 555,
@@ -66,36 +49,13 @@ SAMPLE = [{
 }]
 
 @pytest.fixture(scope="module")
-def loaded_db(tmp_path_factory):
-    """Start a temporary Postgres, load schema, run ETL on our SAMPLE once. Yield a psycopg2 connection."""
-    with PostgresContainer("postgres:15") as pg:
-        url = pg.get_connection_url()
-        p = up.urlparse(url)
-        db, user, pwd, host, port = p.path.lstrip("/"), p.username, p.password, p.hostname, str(p.port)
-
-        # Load schema
-        conn = psycopg2.connect(dbname=db, user=user, password=pwd, host=host, port=port)
-        with conn, conn.cursor() as cur:
-            cur.execute(SCHEMA_PATH.read_text(encoding="utf-8"))
-
-        # Write fixture file
-        tmp = tmp_path_factory.mktemp("mapping")
-        fixture = tmp / "orders.json"
-        fixture.write_text(json.dumps(SAMPLE), encoding="utf-8")
-
-        # Run ETL as a subprocess (so it uses your package)
-        env = os.environ.copy()
-        env.update({
-            "PGDATABASE": db, "PGUSER": user, "PGPASSWORD": pwd,
-            "PGHOST": host, "PGPORT": port, "INPUT_PATH": str(fixture),
-            "PYTHONPATH": str(REPO_ROOT),
-        })
-        subprocess.check_call([sys.executable, "-m", "etl.main"], cwd=str(REPO_ROOT), env=env)
-
-        try:
-            yield conn
-        finally:
-            conn.close()
+def loaded_db(tmp_path_factory, clone_db):
+    """A database the ETL has loaded our SAMPLE into once. Yield a psycopg2 connection."""
+    db = clone_db()
+    fixture = tmp_path_factory.mktemp("mapping") / "orders.json"
+    fixture.write_text(json.dumps(SAMPLE), encoding="utf-8")
+    db.run(INPUT_PATH=str(fixture))
+    return db.connect()
 
 def test_order_row_matches_source(loaded_db):
     conn = loaded_db
@@ -114,6 +74,16 @@ def test_order_row_matches_source(loaded_db):
         assert currency == "DKK"
         assert channel == "WEB"
 
+def test_order_links_its_addresses(loaded_db):
+    conn = loaded_db
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT o.billing_address_id, o.shipping_address_id, s.state
+            FROM orders o JOIN addresses s ON s.address_id = o.shipping_address_id
+            WHERE o.internal_order_id = %s
+        """, (555,))
+        assert cur.fetchone() == (2001, 2002, "COPENHAGEN")
+
 def test_customer_row_matches_source(loaded_db):
     conn = loaded_db
     with conn, conn.cursor() as cur:
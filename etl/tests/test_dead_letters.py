@@ -0,0 +1,41 @@
+import json
+
+def order(oid, **fields):
+    return dict({
+        "InternalOrderId": oid, "OrderDateUtc": "2025-09-01T05:26:24Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "BillingCustomer": {"InternalCustomerId": 7, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": (oid or 0) * 10, "SKU": "SKU1", "QuantityOrdered": 1}],
+    }, **fields)
+
+def test_invalid_orders_are_quarantined_and_the_rest_load(tmp_path, db):
+    conn = db.connect()
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([
+        order(1), order(None), order(3, OrderDateUtc=None),
+        order(4, BillingCustomer={"FirstName": "B"}), order(5, LastUpdatedDateUtc="yesterday"), order(6),
+    ]), encoding="utf-8")
+    out = db.cli(INPUT_PATH=fx)
+    assert "Quarantined 4 orders" in out.stderr
+
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT internal_order_id FROM orders ORDER BY 1")
+        assert cur.fetchall() == [(1,), (6,)]
+        cur.execute("SELECT error_class, raw FROM etl_dead_letters ORDER BY id")
+        letters = cur.fetchall()
+    assert [cls for cls, _ in letters] == [
+        "missing:InternalOrderId", "missing:OrderDateUtc",
+        "missing:BillingCustomer.InternalCustomerId", "invalid:LastUpdatedDateUtc",
+    ]
+    assert json.loads(letters[3][1])["InternalOrderId"] == 5
+
+def test_keys_spelled_as_strings_load_as_the_same_rows(tmp_path, db):
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([
+        order(1), order(2, InternalOrderId="2", BillingCustomer={"InternalCustomerId": "7", "FirstName": "B"}),
+    ]), encoding="utf-8")
+    db.cli(INPUT_PATH=fx, INCREMENTAL="keys")
+    with db.connect() as conn, conn.cursor() as cur:
+        cur.execute("SELECT internal_customer_id, first_name FROM customers")
+        assert cur.fetchall() == [(7, "B")]
+        cur.execute("SELECT internal_order_id, billing_customer_id FROM orders ORDER BY 1")
+        assert cur.fetchall() == [(1, 7), (2, 7)]
@@ -0,0 +1,74 @@
+import json
+from decimal import Decimal
+
+import pyarrow.dataset as ds
+
+from etl.export import SCHEMAS, Export
+
+def order(oid, day, updated="2025-09-01T05:40:48Z", total=10.5, status="Paid"):
+    return {
+        "InternalOrderId": oid, "OrderDateUtc": day, "LastUpdatedDateUtc": updated, "OrderTotal": total,
+        "OrderStatus": status, "ExternalOrderId": 1000 + oid,
+        "BillingCustomer": {"InternalCustomerId": 7, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": oid * 10 + i, "SKU": f"SKU{i}", "QuantityOrdered": 1.0005, "UnitPrice": 2.675}
+                      for i in range(2)],
+    }
+
+def read(root, table):
+    found = ds.dataset(f"{root}/{table}", partitioning="hive").to_table()
+    updated = "last_updated_utc" if table == "orders" else "order_last_updated_utc"
+    return found.sort_by([(found.schema.names[0], "ascending"), (updated, "ascending")])
+
+def test_json_and_db_exports_match_and_db_exports_are_incremental(tmp_path, db):
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([
+        order(1, "2025-07-10T10:00:00Z"), order(2, "2025-08-31T23:30:00-02:00", total=0.125), order(3, "2025-09-02T08:00:00Z"),
+    ]), encoding="utf-8")
+    db.run(INPUT_PATH=str(fx))
+    db.cli("-m", "etl.export", "json", INPUT_PATH=fx, EXPORT_PATH=tmp_path/"from_json")
+    db.cli("-m", "etl.export", "db", EXPORT_PATH=tmp_path/"from_db")
+
+    for table in SCHEMAS:
+        assert read(tmp_path/"from_json", table).equals(read(tmp_path/"from_db", table)), table
+    orders = read(tmp_path/"from_db", "orders").to_pydict()
+    assert orders["order_month"] == ["2025-07", "2025-09", "2025-09"]  # UTC months
+    assert orders["order_total"] == [Decimal("10.50"), Decimal("0.13"), Decimal("10.50")]
+    assert orders["external_order_id"] == ["1001", "1002", "1003"]
+    items = read(tmp_path/"from_db", "order_line_items").to_pydict()
+    assert set(items["quantity_ordered"]) == {Decimal("1.001")} and set(items["unit_price"]) == {Decimal("2.68")}
+
+    # the next db export only adds the order updated since
+    fx.write_text(json.dumps([order(2, "2025-08-31T23:30:00-02:00", "2025-09-03T00:00:00Z", status="Refunded")]), encoding="utf-8")
+    db.run(INPUT_PATH=str(fx))
+    db.cli("-m", "etl.export", "db", EXPORT_PATH=tmp_path/"from_db")
+    orders = read(tmp_path/"from_db", "orders").to_pydict()
+    assert list(zip(orders["internal_order_id"], orders["order_status"])) == [
+        (1, "Paid"), (2, "Paid"), (2, "Refunded"), (3, "Paid"),
+    ]
+    assert len(read(tmp_path/"from_db", "order_line_items")) == 8
+    db.cli("-m", "etl.export", "db", EXPORT_PATH=tmp_path/"from_db")
+    assert len(read(tmp_path/"from_db", "orders")) == 4
+    assert not list(tmp_path.glob("from_*/*/*/.*")), "unpublished files left behind"
+
+def test_ids_spelled_as_strings_export_as_integers(tmp_path, db):
+    fx = tmp_path/"orders.json"
+    spelled = dict(order(4, "2025-09-02T08:00:00Z"), InternalOrderId=" 4 ",
+                   BillingCustomer={"InternalCustomerId": "7", "FirstName": "A"})
+    spelled["LineItems"] = [dict(li, InternalLineItemId=str(li["InternalLineItemId"])) for li in spelled["LineItems"]]
+    fx.write_text(json.dumps([order(3, "2025-09-02T08:00:00Z"), spelled]), encoding="utf-8")
+    db.cli("-m", "etl.export", "json", INPUT_PATH=fx, EXPORT_PATH=tmp_path/"out")
+    orders = read(tmp_path/"out", "orders").to_pydict()
+    assert orders["internal_order_id"] == [3, 4] and orders["billing_customer_id"] == [7, 7]
+    items = read(tmp_path/"out", "order_line_items").to_pydict()
+    assert items["internal_line_item_id"] == [30, 31, 40, 41] and items["internal_order_id"] == [3, 3, 4, 4]
+
+def test_buffered_rows_stay_bounded(tmp_path):
+    rows = [(i, None, f"2025-{1 + i % 12:02d}-15T00:00:00Z", "2025-12-31T00:00:00Z") + (None,) * 14 for i in range(50)]
+    export = Export(tmp_path, "snappy", row_group=4)
+    with export:
+        for i in range(0, 50, 7):
+            export.add("orders", rows[i:i + 7])
+            assert export._buffered <= 4
+    assert export.rows["orders"] == 50
+    assert len(list(tmp_path.glob("orders/order_month=2025-*/part-*.parquet"))) == 12
+    assert sorted(read(tmp_path, "orders")["internal_order_id"].to_pylist()) == list(range(50))
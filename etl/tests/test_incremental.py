@@ -0,0 +1,61 @@
+import json
+from datetime import datetime, timezone
+
+from etl.incremental import ChangeFilter, parse_utc
+
+def order(oid, updated, status="FullyShipped"):
+    return {
+        "InternalOrderId": oid, "OrderDateUtc": "2025-09-01T05:26:24Z", "LastUpdatedDateUtc": updated,
+        "OrderStatus": "Paid", "ShipmentStatus": status,
+        "BillingCustomer": {"InternalCustomerId": 7, "FirstName": "A", "LastName": "B"},
+        "LineItems": [{"InternalLineItemId": oid * 10, "SKU": "SKU1", "QuantityOrdered": 1}],
+    }
+
+class StubCursor:
+    def __init__(self, stored):
+        self.stored = stored
+    def execute(self, sql, params):
+        self.ids = params[0]
+    def fetchall(self):
+        return [(i, self.stored[i]) for i in self.ids if i in self.stored]
+
+def test_change_filter_compares_against_stored_orders():
+    stored = {1: parse_utc("2025-09-02T00:00:00Z"), 2: parse_utc("2025-09-02T00:00:00Z")}
+    f = ChangeFilter(watermark=parse_utc("2025-09-05T00:00:00Z"))
+    kept = f(StubCursor(stored), [order(1, "2025-09-02T00:00:00Z"), order(2, "2025-09-03T00:00:00"), order(3, "2025-09-01T00:00:00Z")])
+    assert [r["InternalOrderId"] for r in kept] == [2, 3]
+    assert (f.applied, f.skipped) == (2, 1)
+    assert f.high_water_mark == datetime(2025, 9, 5, tzinfo=timezone.utc)
+
+def test_trusted_watermark_skips_without_lookup():
+    f = ChangeFilter(watermark=parse_utc("2025-09-05T00:00:00Z"), trust_watermark=True)
+    kept = f(StubCursor({}), [order(1, "2025-09-04T00:00:00Z"), order(2, "2025-09-06T00:00:00Z")])
+    assert [r["InternalOrderId"] for r in kept] == [2]
+    assert f.high_water_mark == datetime(2025, 9, 6, tzinfo=timezone.utc)
+
+def test_incremental_rerun_writes_nothing(tmp_path, db):
+    conn = db.connect()
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([order(1, "2025-09-01T05:40:48Z"), order(2, "2025-09-01T06:00:00Z")]), encoding="utf-8")
+    run_etl = lambda: db.run(INPUT_PATH=str(fx), INCREMENTAL="keys", SOURCE_NAME="nightly")
+
+    def versions():
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT internal_order_id, xmin::text, shipment_status FROM orders ORDER BY 1")
+            return cur.fetchall()
+
+    run_etl()
+    first = versions()
+    run_etl()
+    assert versions() == first, "Unchanged orders were rewritten"
+
+    # Only the order with a newer LastUpdatedDateUtc is applied
+    fx.write_text(json.dumps([order(1, "2025-09-02T00:00:00Z", "Returned"), order(2, "2025-09-01T06:00:00Z", "Lost")]), encoding="utf-8")
+    run_etl()
+    after = versions()
+    assert after[0][2] == "Returned" and after[0][1] != first[0][1]
+    assert after[1] == first[1]
+
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT high_water_mark FROM etl_state WHERE source = 'nightly'")
+        assert cur.fetchone()[0] == datetime(2025, 9, 2, tzinfo=timezone.utc)
@@ -0,0 +1,23 @@
+import csv
+import io
+from collections import Counter
+
+import pytest
+
+from etl import config
+from etl.loaders.engine import _csv_buffer, upsert
+
+def test_csv_buffer_distinguishes_null_from_empty_and_escapes():
+    rows = [(1, None, "", 'say "hi"', "a,b\nc", True, 0.25, b"\x00\xff")]
+    text = _csv_buffer(rows).getvalue().decode()
+    assert text.startswith('"1",,"",')
+    assert list(csv.reader(io.StringIO(text))) == [["1", "", "", 'say "hi"', "a,b\nc", "True", "0.25", "\\x00ff"]]
+    buf = _csv_buffer([("Søren",)])
+    buf.read()
+    assert buf.tell() == 9  # what COPY sends, and what METRICS is charged: bytes, not characters
+
+def test_upsert_skips_empty_batches_and_rejects_unknown_engine(monkeypatch):
+    assert upsert(None, "customers", ("internal_customer_id",), "", []) == Counter(inserted=0, updated=0, unchanged=0)
+    monkeypatch.setattr(config, "LOAD_ENGINE", "bogus")
+    with pytest.raises(ValueError, match="LOAD_ENGINE"):
+        upsert(None, "customers", ("internal_customer_id",), "", [(1,)])
@@ -0,0 +1,41 @@
+import json
+
+from etl.metrics import Metrics, write_json, write_prometheus
+
+def test_stages_accumulate_and_db_time_goes_to_the_innermost_stage():
+    m = Metrics()
+    for _ in range(2):
+        with m.stage("load.orders", rows=10):
+            m.sent(100, 0.5)
+    m.sent(1, 1.0)  # outside any stage: ignored
+    rec = m.stages["load.orders"]
+    assert (rec["calls"], rec["rows"], rec["bytes_sent"], rec["db_wall_s"]) == (2, 20, 200, 1.0)
+
+    other = Metrics()
+    with other.stage("load.orders", rows=5):
+        pass
+    m.merge(other.stages)
+    assert m.stages["load.orders"]["rows"] == 25 and m.stages["load.orders"]["calls"] == 3
+
+def test_stages_record_the_resident_set_size_they_see():
+    m = Metrics()
+    with m.stage("read"):
+        block = b"x" * (64 * 1024 * 1024)  # touched, so resident
+    del block
+    with m.stage("transform"):
+        pass
+    assert m.stages["read"]["rss_mb"] - m.stages["transform"]["rss_mb"] > 32  # current, not the process peak
+
+def test_report_files(tmp_path):
+    m = Metrics()
+    with m.stage("read", rows=3):
+        pass
+    report = m.report(status="ok", finished_at=1700000000)
+    write_json(tmp_path/"run.json", report)
+    assert json.loads((tmp_path/"run.json").read_text())["stages"]["read"]["rows"] == 3
+
+    write_prometheus(tmp_path/"etl.prom", report, {"orders.inserted": 3, "orders_applied": 3})
+    text = (tmp_path/"etl.prom").read_text()
+    assert 'etl_stage_rows{stage="read"} 3' in text
+    assert 'etl_rows{table="orders",outcome="inserted"} 3' in text
+    assert "orders_applied" not in text
@@ -0,0 +1,86 @@
+import json
+
+def make_order(oid, file_no):
+    # Every file touches the same customers/addresses with different attribute values.
+    cid, aid = 100 + oid % 3, 1000 + oid % 4
+    return {
+        "InternalOrderId": oid,
+        "OrderDateUtc": "2025-09-01T05:26:24Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "OrderStatus": "Paid", "InvoiceStatus": "FullyInvoiced", "ShipmentStatus": "FullyShipped",
+        "BillingCustomer": {"InternalCustomerId": cid, "UserId": f"u{file_no}",
+                            "FirstName": f"F{file_no}", "LastName": "L", "EmailAddress": f"{oid}@example.com"},
+        "BillingAddress": {"Id": aid, "AddressLine1": f"Street {file_no}", "City": "C", "ZipCode": "Z", "CountryCode": "DK"},
+        "ShippingAddress": {"Id": aid + 1, "AddressLine1": f"Road {file_no}", "City": "C", "ZipCode": "Z", "CountryCode": "DK"},
+        "SubTotal": 100.00, "ShippingTotal": 10.00, "DiscountTotal": 5.00, "OrderTotal": 105.00,
+        "CurrencyCode": "DKK", "Channel": "WEB",
+        "LineItems": [{"InternalLineItemId": oid * 10, "SKU": "SKU1", "QuantityOrdered": 1, "UnitPrice": 100.00,
+                       "Taxes": [{"InternalTaxRateId": 8, "Amount": 20.00, "Rate": 0.25}]}],
+        "Taxes": [{"InternalTaxRateId": 8, "Amount": 20.00, "Rate": 0.25}],
+        "ShippingTaxes": [{"InternalTaxRateId": 8, "Amount": 2.00, "Rate": 0.25}],
+        "OrderPayments": [{"InternalOrderPaymentId": oid, "PaymentType": "CreditCard", "Amount": 105.00}],
+    }
+
+def snapshot(conn):
+    with conn, conn.cursor() as cur:
+        state = {}
+        for tbl in ("customers", "addresses", "orders", "order_line_items", "order_taxes",
+                    "order_line_item_taxes", "order_shipping_taxes", "order_payments"):
+            cur.execute(f"SELECT t::text FROM {tbl} t ORDER BY 1")
+            state[tbl] = cur.fetchall()
+        return state
+
+def test_parallel_and_pipelined_loads_match_serial(tmp_path, clone_db):
+    inputs = tmp_path/"inputs"; inputs.mkdir()
+    for file_no in range(4):
+        orders = [make_order(file_no * 10 + i, file_no) for i in range(10)]
+        (inputs/f"orders_{file_no}.json").write_text(json.dumps(orders), encoding="utf-8")
+
+    states = []
+    runs = [
+        {"WORKERS": "1"},
+        {"WORKERS": "3"},
+        {"PIPELINE": "thread", "QUEUE_DEPTH": "1", "BATCH_SIZE": "3"},
+        {"PIPELINE": "process", "BATCH_SIZE": "3"},
+        {"LOAD_ENGINE": "asyncpg", "BATCH_SIZE": "3", "POOL_SIZE": "2"},
+    ]
+    for settings in runs:
+        db = clone_db()  # a fresh database per run
+        db.cli(INPUT_PATH=inputs, **settings)
+        states.append(snapshot(db.connect()))
+
+    assert len(states[0]["orders"]) == 40
+    for settings, state in zip(runs[1:], states[1:]):
+        assert state == states[0], f"{settings} load diverged from the serial load"
+
+def test_orders_in_several_files_end_as_in_a_serial_load(tmp_path, clone_db):
+    # Orders 0-9 in every file: each later file re-sends them with a new status, line item
+    # and timestamp, except file 2, which carries a stale version of them.
+    inputs = tmp_path/"inputs"; inputs.mkdir()
+    stamps = ["2025-09-01T05:40:48Z", "2025-09-03T00:00:00Z", "2025-09-02T00:00:00Z", "2025-09-04T00:00:00Z"]
+    for file_no, stamp in enumerate(stamps):
+        orders = []
+        for oid in list(range(10)) + [100 + file_no * 10 + i for i in range(5)]:
+            o = make_order(oid, file_no)
+            o.update(LastUpdatedDateUtc=stamp, ShipmentStatus=f"Status{file_no}")
+            o["LineItems"].append(dict(o["LineItems"][0], InternalLineItemId=oid * 10 + 1 + file_no % 2,
+                                       QuantityOrdered=file_no + 1))
+            orders.append(o)
+        (inputs/f"orders_{file_no}.json").write_text(json.dumps(orders), encoding="utf-8")
+
+    for incremental in ("off", "keys"):
+        states, inserted = [], []
+        for workers in ("1", "3"):
+            db = clone_db()
+            report = tmp_path/f"run-{incremental}-{workers}.json"
+            db.cli(INPUT_PATH=inputs, WORKERS=workers, INCREMENTAL=incremental, BATCH_SIZE=4, METRICS_PATH=report)
+            totals = json.loads(report.read_text())["totals"]
+            inserted.append((totals["customers.inserted"], totals["addresses.inserted"]))
+            conn = db.connect()
+            states.append(snapshot(conn))
+            with conn, conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM daily_revenue WHERE orders <> 0")
+                assert cur.fetchone()[0] == 1
+                cur.execute("SELECT sum(quantity) FROM sku_quantities")
+                states[-1]["sku_quantities"] = cur.fetchall()
+        assert states[1] == states[0], f"INCREMENTAL={incremental}: parallel load diverged from the serial load"
+        assert inserted[1] == inserted[0] == (3, 5)
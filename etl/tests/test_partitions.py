@@ -0,0 +1,105 @@
+import json
+from datetime import date, datetime, timezone
+from pathlib import Path
+import pytest
+
+from etl.partitions import ahead, month_of
+
+SCHEMA_PATH = Path(__file__).resolve().parents[2] / "docs" / "data_model.sql"
+_FOREIGN_KEYS = """
+SELECT conrelid::regclass::text, pg_get_constraintdef(oid) FROM pg_constraint
+WHERE contype = 'f' AND conparentid = 0 AND confrelid IN ('orders'::regclass, 'order_line_items'::regclass) ORDER BY 1, 2
+"""
+
+def order(oid, day):
+    return {
+        "InternalOrderId": oid, "OrderDateUtc": day, "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "BillingCustomer": {"InternalCustomerId": 7, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": oid * 10, "SKU": "SKU1", "QuantityOrdered": 1}],
+        "Taxes": [{"InternalTaxRateId": 8, "Amount": 2.0}],
+    }
+
+def test_months_are_utc():
+    assert month_of("2025-08-31T23:30:00-02:00") == date(2025, 9, 1)
+    assert month_of("2025-09-01T00:30:00+02:00") == date(2025, 8, 1)
+    november = datetime(2025, 11, 15, tzinfo=timezone.utc)
+    assert ahead(2, today=november) == [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1)]
+
+@pytest.mark.parametrize("engine", ["values", "copy", "asyncpg"])
+def test_month_partitioned_loads(tmp_path, db, engine):
+    conn = db.connect()
+    fx = tmp_path/"orders.json"
+    settings = dict(INPUT_PATH=str(fx), LOAD_ENGINE=engine, PARTITIONS="month")
+    run_etl = lambda **extra: db.run(**dict(settings, **extra))
+    partitions = lambda *args: db.cli("-m", "etl.partitions", *args, **settings)
+
+    # rows loaded before the conversion move over
+    fx.write_text(json.dumps([order(1, "2025-07-10T10:00:00Z")]), encoding="utf-8")
+    run_etl(PARTITIONS="off")
+    partitions("convert")
+    fx.write_text(json.dumps([order(1, "2025-07-10T10:00:00Z"), order(2, "2025-08-31T23:30:00-02:00"),
+                              order(3, "2025-09-02T08:00:00Z")]), encoding="utf-8")
+    run_etl()
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT tableoid::regclass::text, internal_order_id FROM orders ORDER BY 2")
+        assert cur.fetchall() == [("orders_p2025_07", 1), ("orders_p2025_09", 2), ("orders_p2025_09", 3)]
+        cur.execute("SELECT tableoid::regclass::text FROM order_line_items ORDER BY internal_line_item_id")
+        assert cur.fetchall() == [("order_line_items_p2025_07",), ("order_line_items_p2025_09",),
+                                  ("order_line_items_p2025_09",)]
+        cur.execute("SELECT xmin::text FROM orders UNION ALL SELECT xmin::text FROM order_line_items")
+        v1 = cur.fetchall()
+
+    # a re-run rewrites nothing; a re-dated order stays where it is
+    run_etl()
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT xmin::text FROM orders UNION ALL SELECT xmin::text FROM order_line_items")
+        assert cur.fetchall() == v1
+    fx.write_text(json.dumps([dict(order(3, "2025-10-01T08:00:00Z"), OrderStatus="Paid")]), encoding="utf-8")
+    run_etl()
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT order_date_utc::date::text, order_status FROM orders WHERE internal_order_id = 3")
+        assert cur.fetchall() == [("2025-09-02", "Paid")]
+        cur.execute("SELECT count(*) FROM order_line_items WHERE internal_order_id = 3")
+        assert cur.fetchone()[0] == 1
+
+    # a detached month takes its orders' taxes along and leaves the rollups
+    partitions("detach", "2025-09")
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT internal_order_id FROM orders ORDER BY 1")
+        assert cur.fetchall() == [(2,), (3,)]
+        cur.execute("SELECT count(*) FROM orders_p2025_07_detached")
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT internal_order_id FROM order_taxes ORDER BY 1")
+        assert cur.fetchall() == [(2,), (3,)]
+        cur.execute("SELECT internal_order_id FROM order_taxes_p2025_07_detached")
+        assert cur.fetchall() == [(1,)]
+    db.cli("-m", "etl.rollups", "verify")
+    partitions("detach", "2025-10", "--drop")
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT (SELECT count(*) FROM orders), (SELECT count(*) FROM order_taxes)")
+        assert cur.fetchone() == (0, 0)
+    db.cli("-m", "etl.rollups", "verify")
+
+def test_schema_applies_again_after_convert(tmp_path, db):
+    conn = db.connect()
+    with conn, conn.cursor() as cur:
+        cur.execute(_FOREIGN_KEYS)
+        assert len(cur.fetchall()) == 6  # the line items' and the five of the tax and payment tables
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([order(1, "2025-07-10T10:00:00Z")]), encoding="utf-8")
+    db.run(INPUT_PATH=str(fx))
+    db.cli("-m", "etl.partitions", "convert")
+
+    # tables created after the conversion get no foreign keys on the partitioned ones
+    with conn, conn.cursor() as cur:
+        cur.execute("DROP TABLE order_line_item_taxes, order_payments")
+        cur.execute(SCHEMA_PATH.read_text(encoding="utf-8"))
+        cur.execute(SCHEMA_PATH.read_text(encoding="utf-8"))
+        cur.execute(_FOREIGN_KEYS)
+        assert cur.fetchall() == [("order_line_items", "FOREIGN KEY (internal_order_id, order_date_utc) "
+                                   "REFERENCES orders(internal_order_id, order_date_utc) ON DELETE CASCADE")]
+    fx.write_text(json.dumps([order(2, "2025-08-10T10:00:00Z")]), encoding="utf-8")
+    db.run(INPUT_PATH=str(fx), PARTITIONS="month")
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT tableoid::regclass::text FROM orders ORDER BY internal_order_id")
+        assert cur.fetchall() == [("orders_p2025_07",), ("orders_p2025_08",)]
@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+
+import pytest
+
+from etl.prefetch import prefetch
+
+def numbers(n, fail_at=None):
+    for i in range(n):
+        if i == fail_at:
+            raise KeyError(i)
+        yield i
+
+def dies(n):
+    yield from range(n)
+    os._exit(3)  # as if killed: no "done" and no error
+
+def test_prefetch_keeps_order_and_propagates_errors():
+    assert list(prefetch(numbers, (50,), "thread", depth=2)) == list(range(50))
+    with pytest.raises(KeyError):
+        list(prefetch(numbers, (10, 5), "thread"))
+    with pytest.raises(ValueError):
+        list(prefetch(numbers, (1,), "fibers"))
+
+def test_prefetch_applies_backpressure_and_stops_when_abandoned():
+    produced = []
+    def tracked():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+    before = threading.active_count()
+    it = prefetch(tracked, (), "thread", depth=2)
+    assert next(it) == 0
+    time.sleep(0.2)
+    # the queued items plus the one blocked in put(); the producer never runs further ahead
+    assert len(produced) <= 4
+    it.close()
+    assert threading.active_count() == before and len(produced) <= 4
+
+def test_prefetch_raises_when_the_producer_process_dies(monkeypatch):
+    monkeypatch.setattr("etl.prefetch._POLL", 0.1)
+    with pytest.raises(RuntimeError, match="exit code 3"):
+        list(prefetch(dies, (3,), "process"))
@@ -0,0 +1,58 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from etl.reader import _iter_documents, iter_batches, iter_orders, resolve_inputs
+
+ORDERS = [
+    {"InternalOrderId": i, "Comments": "line\nbreak, [not] {json}", "Name": "Grøn"}
+    for i in range(1, 6)
+]
+
+def test_reads_pretty_printed_array(tmp_path):
+    p = tmp_path/"orders.json"
+    p.write_text(json.dumps(ORDERS, indent=2, ensure_ascii=False), encoding="utf-8")
+    assert list(iter_orders(str(p))) == ORDERS
+
+def test_reads_single_object_and_empty_array(tmp_path):
+    obj = tmp_path/"obj.json"; obj.write_text(json.dumps(ORDERS[0]), encoding="utf-8")
+    empty = tmp_path/"empty.json"; empty.write_text(" [ ] \n", encoding="utf-8")
+    assert list(iter_orders(str(obj))) == ORDERS[:1]
+    assert list(iter_orders(str(empty))) == []
+
+def test_reads_ndjson(tmp_path):
+    p = tmp_path/"orders.ndjson"
+    p.write_text("\n".join(json.dumps(o) for o in ORDERS) + "\n", encoding="utf-8")
+    assert list(iter_orders(str(p))) == ORDERS
+
+def test_reads_gzip_regardless_of_extension(tmp_path):
+    p = tmp_path/"orders.json"
+    p.write_bytes(gzip.compress(json.dumps(ORDERS).encode("utf-8")))
+    assert list(iter_orders(str(p))) == ORDERS
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64])
+def test_small_chunks_split_documents_and_numbers(chunk_size):
+    text = json.dumps(ORDERS + [12345678, [1, 2]], ensure_ascii=False)
+    assert list(_iter_documents(io.StringIO(text), chunk_size)) == ORDERS + [12345678, [1, 2]]
+
+def test_malformed_array_raises():
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_documents(io.StringIO('[{"a": 1} {"a": 2}]'), 4))
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_documents(io.StringIO('[{"a": 1},'), 4))
+
+def test_iter_batches_bounds_batch_size():
+    batches = list(iter_batches(iter(range(7)), 3))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_resolve_inputs_expands_directories_and_globs(tmp_path):
+    for name in ("b.json", "a.json.gz", ".hidden.json"):
+        (tmp_path/name).write_text("[]", encoding="utf-8")
+    (tmp_path/"sub").mkdir()
+    assert resolve_inputs(str(tmp_path)) == [str(tmp_path/"a.json.gz"), str(tmp_path/"b.json")]
+    assert resolve_inputs(str(tmp_path/"*.json")) == [str(tmp_path/"b.json")]
+    assert resolve_inputs(str(tmp_path/"b.json")) == [str(tmp_path/"b.json")]
+    with pytest.raises(FileNotFoundError):
+        resolve_inputs(str(tmp_path/"*.ndjson"))
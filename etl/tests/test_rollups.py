@@ -0,0 +1,54 @@
+import json
+from decimal import Decimal
+import pytest
+
+def order(oid, day, total, items, updated="2025-09-01T05:40:48Z"):
+    return {
+        "InternalOrderId": oid, "OrderDateUtc": day, "LastUpdatedDateUtc": updated, "OrderTotal": total,
+        "BillingCustomer": {"InternalCustomerId": 7, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": oid * 10 + i, "SKU": sku, "QuantityOrdered": qty}
+                      for i, (sku, qty) in enumerate(items)],
+    }
+
+@pytest.mark.parametrize("engine", ["values", "copy", "asyncpg"])
+def test_rollups_follow_updates(tmp_path, db, engine):
+    conn = db.connect()
+    fx = tmp_path/"orders.json"
+    run_etl = lambda: db.run(INPUT_PATH=str(fx), LOAD_ENGINE=engine)
+    verify = lambda *args: db.cli("-m", "etl.rollups", "verify", *args, check=False).returncode
+
+    def rollups():
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT day::text, orders, revenue FROM daily_revenue WHERE orders <> 0 ORDER BY 1")
+            days = cur.fetchall()
+            cur.execute("SELECT sku, line_items, quantity FROM sku_quantities WHERE line_items <> 0 ORDER BY 1")
+            return days, cur.fetchall()
+
+    fx.write_text(json.dumps([
+        order(1, "2025-08-31T23:30:00-02:00", 10.5, [("A", 1), ("B", 2)]),
+        order(2, "2025-09-01T08:00:00Z", 4, [("A", 3), (None, 1)]),
+    ]), encoding="utf-8")
+    run_etl()
+    assert rollups() == (
+        [("2025-09-01", 2, Decimal("14.50"))],
+        [("A", 2, Decimal("4.000")), ("B", 1, Decimal("2.000"))],
+    )
+
+    # a re-send, a changed line item and a new order: only the deltas land
+    fx.write_text(json.dumps([
+        order(1, "2025-08-31T23:30:00-02:00", 10.5, [("A", 1), ("B", 2)]),
+        order(2, "2025-09-01T08:00:00Z", 4, [("C", 5), (None, 1)], updated="2025-09-02T00:00:00Z"),
+        order(3, "2025-09-02T08:00:00Z", 1.25, [("B", 1)]),
+    ]), encoding="utf-8")
+    run_etl()
+    assert rollups() == (
+        [("2025-09-01", 2, Decimal("14.50")), ("2025-09-02", 1, Decimal("1.25"))],
+        [("A", 1, Decimal("1.000")), ("B", 2, Decimal("3.000")), ("C", 1, Decimal("5.000"))],
+    )
+    assert verify() == 0
+
+    with conn, conn.cursor() as cur:
+        cur.execute("UPDATE sku_quantities SET quantity = 0 WHERE sku = 'B'")
+    assert verify() == 1
+    assert verify("--rebuild") == 0
+    assert verify() == 0
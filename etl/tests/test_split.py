@@ -0,0 +1,55 @@
+import json
+import mmap
+
+import pytest
+
+from etl import config
+from etl.reader import ArrayRange, array_start, iter_orders
+from etl.split import iter_split
+
+# Strings holding what a splitter might take for boundaries, nested arrays of objects, multi-byte text.
+ORDERS = [
+    {
+        "InternalOrderId": i, "OrderDateUtc": "2025-09-01T05:40:48Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "Comments": 'ends}, {"InternalOrderId": 99} \\"}, {' * (i % 3), "Name": "Grøn ✓ " * i,
+        "LineItems": [{"InternalLineItemId": i * 10 + k, "SKU": f"S{k}"} for k in range(i % 4)],
+    }
+    for i in range(1, 40)
+]
+
+def _write(tmp_path, orders, **dump):
+    p = tmp_path/"orders.json"
+    p.write_text(json.dumps(orders, ensure_ascii=False, **dump), encoding="utf-8")
+    return str(p)
+
+def test_array_range_reports_byte_offsets(tmp_path):
+    path = _write(tmp_path, ORDERS[:5], indent=1)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        elements = ArrayRange(mm, array_start(mm), len(mm))
+        found = list(elements)
+        assert [o for _, o in found] == ORDERS[:5] and elements.next is None
+        assert all(json.JSONDecoder().raw_decode(mm[at:].decode())[0] == o for at, o in found)
+        # stopping half way says where the next element starts
+        half = ArrayRange(mm, array_start(mm), found[2][0])
+        assert [o for _, o in half] == ORDERS[:2] and half.next == found[2][0]
+        with pytest.raises(json.JSONDecodeError):
+            list(ArrayRange(mm, found[1][0] + 1, len(mm), objects_only=True))
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_split_matches_a_serial_parse(tmp_path, monkeypatch, indent):
+    monkeypatch.setattr(config, "SPLIT_WORKERS", 2)
+    monkeypatch.setattr(config, "BATCH_SIZE", 4)
+    path = _write(tmp_path, ORDERS, indent=indent)
+    serial = list(iter_orders(path))
+    for chunk in (97, 613, 4000):
+        parsed = [o for _, batch, _, _ in iter_split(path, 0, False, chunk) for o in batch]
+        assert parsed == serial
+        resumed = [o for _, batch, _, _ in iter_split(path, 17, False, chunk) for o in batch]
+        assert resumed == serial[17:]
+
+def test_split_raises_like_a_serial_parse(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SPLIT_WORKERS", 2)
+    p = tmp_path/"orders.json"
+    p.write_text(json.dumps(ORDERS)[:-1] + ", 1] x", encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_split(str(p), 0, False, 500))
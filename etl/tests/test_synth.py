@@ -0,0 +1,31 @@
+from itertools import islice
+
+from etl.bench import compare
+from etl.synth import generate, write
+from etl.reader import iter_orders
+from etl.transform import decompose, split_valid
+
+def test_generate_is_deterministic_and_valid():
+    orders = list(generate(200, seed=3, max_line_items=3, reuse=0.9, tax_rates=3))
+    assert orders == list(generate(200, seed=3, max_line_items=3, reuse=0.9, tax_rates=3))
+    assert orders != list(generate(200, seed=4, max_line_items=3, reuse=0.9, tax_rates=3))
+    valid, rejects = split_valid(orders)
+    assert rejects == []
+    rows = decompose(valid)
+    assert len(rows.orders) == 200
+    assert len(rows.customers) <= 20 and len(rows.addresses) == 2 * len(rows.customers)
+    assert all(1 <= len(o["LineItems"]) <= 3 for o in orders)
+    assert {t[1] for t in rows.order_taxes} <= {8, 9, 10}
+
+def test_write_round_trips_through_the_reader(tmp_path):
+    for fmt, compress in (("json", False), ("ndjson", True)):
+        p = tmp_path/f"orders.{fmt}"
+        assert write(p, generate(5, seed=1), fmt, compress) == 5
+        assert list(iter_orders(str(p))) == list(islice(generate(5, seed=1), 5))
+
+def test_compare_flags_regressions_beyond_tolerance():
+    base = {"runs": {"10": {"rows_per_sec": 100.0, "orders_per_sec": 10.0, "peak_rss_mb": 50.0}}}
+    ok = {"runs": {"10": {"rows_per_sec": 95.0, "orders_per_sec": 9.5, "peak_rss_mb": 54.0}}}
+    bad = {"runs": {"10": {"rows_per_sec": 80.0, "orders_per_sec": 10.0, "peak_rss_mb": 60.0}}}
+    assert compare(ok, base, 0.1) == []
+    assert [p.split(":")[1].split()[0] for p in compare(bad, base, 0.1)] == ["rows_per_sec", "peak_rss_mb"]
@@ -0,0 +1,176 @@
+import json, os, pathlib, subprocess, sys, zlib
+
+import pytest
+
+from etl import config
+from etl.transform import RowBatch, decompose, split_valid, unmapped
+
+ORDER = {
+    "InternalOrderId": 1, "ExternalOrderId": "EXT-1",
+    "OrderDateUtc": "2025-09-01T05:26:24Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+    "OrderStatus": "Paid", "InvoiceStatus": "FullyInvoiced", "ShipmentStatus": "FullyShipped",
+    "BillingCustomer": {"InternalCustomerId": 10, "FirstName": "A", "LastName": "B", "EmailAddress": "a@b.com"},
+    "BillingAddress": {"Id": 100, "City": "C", "ZipCode": "Z", "CountryCode": "DK"},
+    "ShippingAddress": {"Id": 101, "City": "C", "ZipCode": "Z", "CountryCode": "DK"},
+    "SubTotal": 100.0, "ShippingTotal": 10.0, "DiscountTotal": 5.0, "OrderTotal": 105.0,
+    "CurrencyCode": "DKK", "Channel": "WEB",
+    "LineItems": [{"InternalLineItemId": 1000, "SKU": "SKU1", "QuantityOrdered": 2, "UnitPrice": 50.0}],
+    "Taxes": [{"InternalTaxRateId": 8, "Amount": 20.0, "Rate": 0.25, "TaxType": "Net"}],
+}
+
+def test_decompose_emits_rows_for_all_tables():
+    rows = decompose([ORDER])
+    assert isinstance(rows, RowBatch)
+    assert rows.counts() == {"customers": 1, "addresses": 2, "orders": 1, "line_items": 1, "order_taxes": 1,
+                             "line_item_taxes": 0, "shipping_taxes": 0, "payments": 0}
+    assert rows.customers[0] == (10, None, None, "A", "B", "a@b.com")
+    assert rows.addresses[0] == (100, None, None, None, None, "C", None, "Z", "DK")
+    order = rows.orders[0]
+    assert order[:3] == (1, "EXT-1", "2025-09-01T05:26:24Z")
+    assert order[8:11] == (10, 100, 101)
+    assert json.loads(order[-1]) == ORDER
+    assert rows.line_items[0][:4] == (1000, 1, "2025-09-01T05:26:24Z", "SKU1")
+    assert rows.order_taxes[0][:4] == (1, 8, 20.0, 0.25)
+
+def test_decompose_dedupes_dimensions_last_wins():
+    second = dict(ORDER, InternalOrderId=2, LineItems=[], Taxes=None,
+                  BillingCustomer=dict(ORDER["BillingCustomer"], EmailAddress="new@b.com"),
+                  ShippingAddress=dict(ORDER["BillingAddress"], City="D"))
+    rows = decompose([ORDER, second])
+    assert [c[5] for c in rows.customers] == ["new@b.com"]
+    assert sorted((a[0], a[5]) for a in rows.addresses) == [(100, "D"), (101, "C")]
+    assert len(rows.orders) == 2 and len(rows.line_items) == 1 and len(rows.order_taxes) == 1
+
+def test_decompose_tolerates_missing_nested_objects():
+    bare = {"InternalOrderId": 3, "OrderDateUtc": "x", "LastUpdatedDateUtc": "y"}
+    rows = decompose([bare])
+    assert rows.counts() == {"customers": 0, "addresses": 0, "orders": 1, "line_items": 0, "order_taxes": 0,
+                             "line_item_taxes": 0, "shipping_taxes": 0, "payments": 0}
+    assert rows.orders[0][8:11] == (None, None, None)
+
+def test_split_valid_routes_bad_orders_with_error_class():
+    bad = [
+        dict(ORDER, InternalOrderId=None),
+        dict(ORDER, OrderDateUtc="2025-13-01T00:00:00Z"),
+        dict(ORDER, BillingCustomer={"FirstName": "A"}),
+        dict(ORDER, LineItems=[{"SKU": "SKU1"}]),
+        dict(ORDER, ShippingAddress={"Id": "A-1", "City": "C"}),
+        "not an order",
+    ]
+    valid, rejects = split_valid([ORDER] + bad)
+    assert valid == [ORDER]
+    assert [cls for cls, _, _ in rejects] == [
+        "missing:InternalOrderId", "invalid:OrderDateUtc", "missing:BillingCustomer.InternalCustomerId",
+        "missing:LineItems.InternalLineItemId", "invalid:ShippingAddress.Id", "invalid:order",
+    ]
+    assert rejects[0][2] is bad[0]
+
+def test_numbers_the_columns_cannot_hold_are_rejected():
+    item = ORDER["LineItems"][0]
+    fine = [
+        dict(ORDER, SubTotal=9999999999.99, OrderTotal="-12.5"),
+        dict(ORDER, LineItems=[dict(item, QuantityOrdered=999999999.9994)]),
+        dict(ORDER, Taxes=[{"InternalTaxRateId": 8, "Amount": 0, "Rate": "999.9999"}]),
+    ]
+    bad = [
+        dict(ORDER, SubTotal="x"),
+        dict(ORDER, OrderTotal=1e10),
+        dict(ORDER, DiscountTotal=9999999999.995),
+        dict(ORDER, ShippingTotal=float("nan")),
+        dict(ORDER, OrderTotal=True),
+        dict(ORDER, LineItems=[dict(item, QuantityOrdered=999999999.9995)]),
+        dict(ORDER, LineItems=[dict(item, UnitPrice="1e400")]),
+        dict(ORDER, LineItems=[dict(item, Taxes=[{"InternalTaxRateId": 8, "Rate": 1000}])]),
+        dict(ORDER, ShippingTaxes=[{"InternalTaxRateId": 8, "Amount": [1]}]),
+        dict(ORDER, OrderPayments=[{"InternalOrderPaymentId": 7, "AmountCaptured": "1_000"}]),
+    ]
+    valid, rejects = split_valid(fine + bad)
+    assert valid == fine
+    assert [cls for cls, _, _ in rejects] == [
+        "invalid:SubTotal", "invalid:OrderTotal", "invalid:DiscountTotal", "invalid:ShippingTotal",
+        "invalid:OrderTotal", "invalid:LineItems.QuantityOrdered", "invalid:LineItems.UnitPrice",
+        "invalid:LineItems.Taxes.Rate", "invalid:ShippingTaxes.Amount", "invalid:OrderPayments.AmountCaptured",
+    ]
+
+def test_keys_timestamps_and_flags_postgres_would_refuse_are_rejected():
+    item = ORDER["LineItems"][0]
+    fine = [
+        dict(ORDER, InternalOrderId=2**63 - 1, OrderDateUtc="2025-09-01T05:26:24.1234567+02:00"),
+        dict(ORDER, InternalOrderId=" -12 ", DeadlineDateUtc="2025-09-01"),
+        dict(ORDER, LineItems=[dict(item, IsPreOrder=False)], OrderPayments=[{"InternalOrderPaymentId": 7, "PaymentId": "3"}]),
+    ]
+    bad = [
+        dict(ORDER, InternalOrderId=2**70),
+        dict(ORDER, InternalOrderId="9223372036854775808"),
+        dict(ORDER, BillingCustomer={"InternalCustomerId": 2**64}),
+        dict(ORDER, InternalOrderId="²"),
+        dict(ORDER, ShippingAddress={"Id": "١٢"}),
+        dict(ORDER, OrderDateUtc="2025-W01-1"),
+        dict(ORDER, LastUpdatedDateUtc="20250901T054048Z"),
+        dict(ORDER, LineItems=[dict(item, IsPreOrder="maybe")]),
+        dict(ORDER, OrderPayments=[{"InternalOrderPaymentId": 7, "PaymentId": 1.5}]),
+    ]
+    valid, rejects = split_valid(fine + bad)
+    assert valid == fine
+    assert [cls for cls, _, _ in rejects] == [
+        "invalid:InternalOrderId", "invalid:InternalOrderId", "invalid:BillingCustomer.InternalCustomerId",
+        "invalid:InternalOrderId", "invalid:ShippingAddress.Id", "invalid:OrderDateUtc", "invalid:LastUpdatedDateUtc",
+        "invalid:LineItems.IsPreOrder", "invalid:OrderPayments.PaymentId",
+    ]
+
+def test_keys_spelled_as_strings_become_the_same_ints():
+    spelled = dict(ORDER, InternalOrderId="1", BillingCustomer=dict(ORDER["BillingCustomer"], InternalCustomerId="10"),
+                   BillingAddress=dict(ORDER["BillingAddress"], Id=" 100 "),
+                   LineItems=[dict(ORDER["LineItems"][0], InternalLineItemId="1000")])
+    rows = decompose([ORDER, spelled])
+    assert [c[0] for c in rows.customers] == [10] and sorted(a[0] for a in rows.addresses) == [100, 101]
+    assert [o[:1] + o[8:11] for o in rows.orders] == [(1, 10, 100, 101)] * 2
+    assert [li[:2] for li in rows.line_items] == [(1000, 1)] * 2
+
+def test_nested_taxes_and_payments_get_their_own_rows():
+    order = dict(ORDER, ShippingTaxes=[{"InternalTaxRateId": 8, "Amount": 2.0, "Rate": 0.25}],
+                 OrderPayments=[{"InternalOrderPaymentId": 7, "PaymentType": "CreditCard", "Amount": 105.0}],
+                 LineItems=[dict(ORDER["LineItems"][0], Taxes=[{"InternalTaxRateId": 8, "Amount": 20.0, "Rate": 0.25}])])
+    rows = decompose([order])
+    assert rows.line_item_taxes == [(1000, 8, 1, 20.0, 0.25, None, None, None)]
+    assert rows.shipping_taxes == [(1, 8, 2.0, 0.25, None, None, None)]
+    assert rows.payments == [(7, 1, None, "CreditCard", None, None, 105.0, None, None, None)]
+    bad = dict(order, OrderPayments=[{"Amount": 1.0}])
+    assert split_valid([bad])[1][0][0] == "missing:OrderPayments.InternalOrderPaymentId"
+    bad = dict(order, LineItems=[dict(ORDER["LineItems"][0], Taxes=[{"Amount": 1.0}])])
+    assert split_valid([bad])[1][0][0] == "missing:LineItems.Taxes.InternalTaxRateId"
+
+def test_unmapped_keeps_only_fields_without_a_column():
+    order = dict(ORDER, CustomFields=[{"Name": "x", "Value": 1}], ShippingRate=[{"RateCode": "gls"}],
+                 OrderPayments=[{"InternalOrderPaymentId": 7, "Amount": 105.0, "CustomFields": [{"Name": "p"}]}],
+                 LineItems=[dict(ORDER["LineItems"][0], CustomFields=[{"Name": "size"}]),
+                            {"InternalLineItemId": 1001, "SKU": "SKU2"}])
+    assert unmapped(order) == {
+        "CustomFields": [{"Name": "x", "Value": 1}], "ShippingRate": [{"RateCode": "gls"}],
+        "OrderPayments": [{"InternalOrderPaymentId": 7, "CustomFields": [{"Name": "p"}]}],
+        "LineItems": [{"InternalLineItemId": 1000, "CustomFields": [{"Name": "size"}]}],
+    }
+    assert unmapped(ORDER) is None
+
+def test_raw_modes(monkeypatch):
+    monkeypatch.setattr(config, "RAW_MODE", "none")
+    assert decompose([ORDER]).orders[0][-2:] == (None, None)
+    monkeypatch.setattr(config, "RAW_MODE", "archive")
+    rows = decompose([ORDER, ORDER])
+    digest, raw = rows.orders[0][-2:]
+    assert raw is None and rows.raw_archive == [(digest, rows.raw_archive[0][1])]
+    assert json.loads(zlib.decompress(rows.raw_archive[0][1])) == ORDER
+    monkeypatch.setattr(config, "RAW_MODE", "bogus")
+    with pytest.raises(ValueError, match="RAW_MODE"):
+        decompose([ORDER])
+
+def test_transform_only_never_loads_the_db_driver(tmp_path):
+    fx = tmp_path/"orders.json"
+    fx.write_text(json.dumps([ORDER, dict(ORDER, InternalOrderId=None)]), encoding="utf-8")
+    code = "import sys; from etl.main import main; main(['--transform-only']); assert 'psycopg2' not in sys.modules"
+    repo = pathlib.Path(__file__).resolve().parents[2]
+    env = dict(os.environ, INPUT_PATH=str(fx), PGHOST="nowhere.invalid", PYTHONPATH=str(repo))
+    out = subprocess.run([sys.executable, "-c", code], cwd=str(repo), env=env,
+                         capture_output=True, text=True, check=True)
+    assert "Transformed 2 orders (dry run)" in out.stderr
+    assert "1 orders would be quarantined" in out.stderr
@@ -0,0 +1,82 @@
+import json, os, pathlib, signal, socket, subprocess, sys, time
+from collections import Counter
+import pytest
+
+from etl.watch import Watcher
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parents[2]
+
+def order(oid):
+    return {
+        "InternalOrderId": oid, "OrderDateUtc": "2025-09-01T05:26:24Z", "LastUpdatedDateUtc": "2025-09-01T05:40:48Z",
+        "BillingCustomer": {"InternalCustomerId": 7, "FirstName": "A"},
+        "LineItems": [{"InternalLineItemId": oid * 10, "SKU": "SKU1", "QuantityOrdered": 1}],
+    }
+
+def drop(inbox, name, text):
+    tmp = inbox/f".{name}"
+    tmp.write_text(text, encoding="utf-8")
+    tmp.rename(inbox/name)
+
+def wait_for(check, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.1)
+
+@pytest.mark.parametrize("mode", ["inotify", "poll"])
+def test_watcher_loads_files_as_they_land(tmp_path, db, mode):
+    conn = db.connect()
+
+    inbox = tmp_path/"inbox"
+    (inbox/"processing").mkdir(parents=True)
+    # left behind by a watcher that was killed mid-load
+    (inbox/"processing"/"stale.json").write_text(json.dumps([order(1)]), encoding="utf-8")
+    proc = subprocess.Popen([sys.executable, "-m", "etl.watch"], cwd=str(REPO_ROOT),
+                            env=db.env(INPUT_PATH=inbox, WATCH_MODE=mode, WATCH_POLL_S=0.2),
+                            stderr=subprocess.PIPE, text=True)
+    try:
+        done = lambda *names: all((inbox/"done"/n).exists() for n in names)
+        wait_for(lambda: done("stale.json"))
+        drop(inbox, "a.json", json.dumps([order(2), order(3)]))
+        drop(inbox, "broken.json", '[{"InternalOrderId": 4,')
+        drop(inbox, "b.json", json.dumps([order(5)]))
+        (inbox/"c.json.part").write_text("[", encoding="utf-8")  # still being written
+        wait_for(lambda: done("a.json", "b.json") and (inbox/"failed"/"broken.json").exists())
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        _, err = proc.communicate(timeout=30)
+    assert proc.returncode == 0, err
+    assert "3 files loaded, 1 failed" in err
+
+    assert (inbox/"c.json.part").exists()
+    assert not list((inbox/"processing").iterdir())
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT internal_order_id FROM orders ORDER BY 1")
+        assert cur.fetchall() == [(1,), (2,), (3,), (5,)]
+
+def test_recovery_leaves_files_of_running_watchers_alone(tmp_path):
+    inbox, host = tmp_path/"inbox", socket.gethostname()
+    gone = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    files = {
+        "legacy.json": inbox/"processing",                              # claimed before per-watcher folders
+        "dead.json": inbox/"processing"/f"{host}-{gone.stdout.strip()}",
+        "busy.json": inbox/"processing"/f"{host}-{os.getppid()}",       # a watcher still loading it
+        "remote.json": inbox/"processing"/"elsewhere-1",
+    }
+    for name, folder in files.items():
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder/name).write_text("[]", encoding="utf-8")
+
+    watcher = Watcher(str(inbox))
+    watcher.recover()
+    assert sorted(p.name for p in inbox.iterdir() if p.is_file()) == ["dead.json", "legacy.json"]
+    assert (files["busy.json"]/"busy.json").exists() and (files["remote.json"]/"remote.json").exists()
+    assert not files["dead.json"].exists()
+
+    # a loaded file that vanished before it could be filed away doesn't stop the watcher
+    claimed = watcher.claimed
+    (pathlib.Path(claimed)/"x.json").write_text("[]", encoding="utf-8")
+    watcher.load_group = lambda paths: (os.remove(paths[0]), Counter())[1]
+    watcher.process([os.path.join(claimed, "x.json")])
+    assert watcher.totals["files.done"] == 1
@@ -0,0 +1,443 @@
+import re
+import zlib
+from collections import Counter
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from hashlib import blake2b
+
+from etl import codec, config
+
+TABLES = (
+    "customers", "addresses", "orders", "line_items", "order_taxes",
+    "line_item_taxes", "shipping_taxes", "payments",
+)
+RAW_MODES = ("full", "none", "unmapped", "archive")
+
+# Source fields that end up in columns, per part of an order; RAW_MODE=unmapped keeps the rest.
+# Nested parts keep their key next to any leftovers so they can be matched back to their rows.
+_ADDRESS_FIELDS = frozenset((
+    "Id", "ExternalAddressId", "FirstName", "LastName", "AddressLine1", "City", "State", "ZipCode", "CountryCode",
+))
+_TAX_FIELDS = frozenset(("InternalTaxRateId", "Amount", "Rate", "TaxType", "BackendName", "PublicTaxName"))
+MAPPED = {
+    "BillingCustomer": ("InternalCustomerId", frozenset((
+        "InternalCustomerId", "ExternalCustomerId", "UserId", "FirstName", "LastName", "EmailAddress",
+    ))),
+    "BillingAddress": ("Id", _ADDRESS_FIELDS),
+    "ShippingAddress": ("Id", _ADDRESS_FIELDS),
+    "LineItems": ("InternalLineItemId", frozenset((
+        "InternalLineItemId", "SKU", "ProductName", "ItemName", "Description",
+        "QuantityOrdered", "QuantityInvoiced", "QuantityShipped", "QuantityCancelled", "QuantityReturned",
+        "UnitPrice", "UnitDiscount", "SubTotal", "TotalTax", "Total", "IsPreOrder", "Taxes",
+    ))),
+    "Taxes": ("InternalTaxRateId", _TAX_FIELDS),
+    "ShippingTaxes": ("InternalTaxRateId", _TAX_FIELDS),
+    "OrderPayments": ("InternalOrderPaymentId", frozenset((
+        "InternalOrderPaymentId", "ExternalOrderPaymentId", "PaymentType", "PaymentTypeDescription", "PaymentId",
+        "Amount", "AmountAuthorized", "AmountCaptured", "Status",
+    ))),
+}
+MAPPED_ORDER_FIELDS = frozenset((
+    "InternalOrderId", "ExternalOrderId", "OrderDateUtc", "LastUpdatedDateUtc", "DeadlineDateUtc",
+    "OrderStatus", "InvoiceStatus", "ShipmentStatus",
+    "SubTotal", "ShippingTotal", "DiscountTotal", "OrderTotal", "CurrencyCode", "Channel", "Comments",
+))
+
+
+class RowBatch:
+    """Row tuples for every target table, decomposed from one batch of orders."""
+    __slots__ = TABLES + ("raw_archive", "quarantined")
+
+    def __init__(self, customers=None, addresses=None, orders=None, line_items=None, order_taxes=None,
+                 line_item_taxes=None, shipping_taxes=None, payments=None, raw_archive=None):
+        self.customers = customers or []
+        self.addresses = addresses or []
+        self.orders = orders or []
+        self.line_items = line_items or []
+        self.order_taxes = order_taxes or []
+        self.line_item_taxes = line_item_taxes or []
+        self.shipping_taxes = shipping_taxes or []
+        self.payments = payments or []
+        # (digest, compressed document) for RAW_MODE=archive
+        self.raw_archive = raw_archive or []
+        # "quarantined.<error class>" -> orders of this batch sent to the dead letters
+        self.quarantined = Counter()
+
+    def counts(self):
+        return {t: len(getattr(self, t)) for t in TABLES}
+
+
+def as_key(v):
+    """A validated key as an int (the JSON may spell it as a digit string); None stays None."""
+    return v if v is None or type(v) is int else int(v)
+
+def _customer_tuple(c):
+    return (
+        as_key(c["InternalCustomerId"]),
+        c.get("ExternalCustomerId"),
+        c.get("UserId"),
+        c.get("FirstName"),
+        c.get("LastName"),
+        c.get("EmailAddress"),
+    )
+
+def _addr_tuple(a):
+    return (
+        as_key(a["Id"]),
+        a.get("ExternalAddressId"),
+        a.get("FirstName"),
+        a.get("LastName"),
+        a.get("AddressLine1"),
+        a.get("City"),
+        a.get("State"),
+        a.get("ZipCode"),
+        a.get("CountryCode"),
+    )
+
+def _address_id(a):
+    return as_key(a.get("Id")) if a else None
+
+def _order_tuple(r, customer_id, raw=None, raw_digest=None):
+    return (
+        as_key(r["InternalOrderId"]),
+        r.get("ExternalOrderId"),
+        r["OrderDateUtc"],
+        r["LastUpdatedDateUtc"],
+        r.get("DeadlineDateUtc"),
+        r.get("OrderStatus"),
+        r.get("InvoiceStatus"),
+        r.get("ShipmentStatus"),
+        customer_id,
+        _address_id(r.get("BillingAddress")),
+        _address_id(r.get("ShippingAddress")),
+        r.get("SubTotal"),
+        r.get("ShippingTotal"),
+        r.get("DiscountTotal"),
+        r.get("OrderTotal"),
+        r.get("CurrencyCode"),
+        r.get("Channel"),
+        r.get("Comments"),
+        raw_digest,
+        raw,
+    )
+
+def _line_item_tuple(li, oid, order_date):
+    return (
+        as_key(li["InternalLineItemId"]),
+        oid,
+        order_date,  # the order's; puts the line item in its order's partition
+        li.get("SKU"),
+        li.get("ProductName"),
+        li.get("ItemName"),
+        li.get("Description"),
+        li.get("QuantityOrdered"),
+        li.get("QuantityInvoiced"),
+        li.get("QuantityShipped"),
+        li.get("QuantityCancelled"),
+        li.get("QuantityReturned"),
+        li.get("UnitPrice"),
+        li.get("UnitDiscount"),
+        li.get("SubTotal"),
+        li.get("TotalTax"),
+        li.get("Total"),
+        li.get("IsPreOrder"),
+    )
+
+def _tax_tuple(t, oid):
+    return (
+        oid,
+        as_key(t["InternalTaxRateId"]),
+        t.get("Amount"),
+        t.get("Rate"),
+        t.get("TaxType"),
+        t.get("BackendName"),
+        t.get("PublicTaxName"),
+    )
+
+def _line_item_tax_tuple(t, li_id, oid):
+    return (
+        li_id,
+        as_key(t["InternalTaxRateId"]),
+        oid,
+        t.get("Amount"),
+        t.get("Rate"),
+        t.get("TaxType"),
+        t.get("BackendName"),
+        t.get("PublicTaxName"),
+    )
+
+def _payment_tuple(p, oid):
+    return (
+        as_key(p["InternalOrderPaymentId"]),
+        oid,
+        p.get("ExternalOrderPaymentId"),
+        p.get("PaymentType"),
+        p.get("PaymentTypeDescription"),
+        as_key(p.get("PaymentId")),
+        p.get("Amount"),
+        p.get("AmountAuthorized"),
+        p.get("AmountCaptured"),
+        p.get("Status"),
+    )
+
+
+def _leftover(part, obj):
+    key, mapped = MAPPED[part]
+    rest = {k: v for k, v in obj.items() if k not in mapped}
+    if rest and key in obj:
+        rest = {key: obj[key], **rest}
+    return rest
+
+def unmapped(r):
+    """The fields of order `r` that no column holds, or None if every field is mapped."""
+    out = {}
+    for k, v in r.items():
+        if k in MAPPED_ORDER_FIELDS:
+            continue
+        if k in MAPPED and isinstance(v, dict):
+            v = _leftover(k, v)
+        elif k in MAPPED and isinstance(v, list):
+            v = [rest for rest in (_leftover(k, x) if isinstance(x, dict) else x for x in v) if rest]
+        if k not in MAPPED or v:
+            out[k] = v
+    return out or None
+
+def _mapped_part(part, obj):
+    fields = MAPPED[part][1]
+    out = {k: v for k, v in obj.items() if k in fields}
+    if part == "LineItems" and isinstance(out.get("Taxes"), list):
+        out["Taxes"] = [_mapped_part("Taxes", t) if isinstance(t, dict) else t for t in out["Taxes"]]
+    return out
+
+def mapped(r):
+    """Order `r` cut down to the fields columns are loaded from (the other half of `unmapped`).
+
+    Parts that aren't objects, or lists of them, are kept as they are for validate to judge.
+    """
+    if not isinstance(r, dict):
+        return r
+    out = {}
+    for k, v in r.items():
+        if k in MAPPED:
+            if isinstance(v, dict):
+                v = _mapped_part(k, v)
+            elif isinstance(v, list):
+                v = [_mapped_part(k, x) if isinstance(x, dict) else x for x in v]
+        elif k not in MAPPED_ORDER_FIELDS:
+            continue
+        out[k] = v
+    return out
+
+def archived(r):
+    """(digest, zlib-compressed JSON) of order `r` for the content-addressed raw archive."""
+    body = codec.dumps(r).encode()
+    return blake2b(body, digest_size=16).digest(), zlib.compress(body)
+
+
+# BIGINT
+_KEY_MIN, _KEY_MAX = -2**63, 2**63
+# ISO 8601 as Postgres reads it: extended format, ASCII digits, optional time and offset.
+_TIMESTAMP = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}([T ][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?)?(Z|[+-][0-9]{2}(:?[0-9]{2})?)?")
+
+def _is_key(v):
+    if type(v) is not int:
+        if not isinstance(v, str):
+            return False
+        digits = v.strip()
+        digits = digits[1:] if digits[:1] == "-" else digits
+        if not (digits.isascii() and digits.isdigit()):
+            return False
+        v = int(v)
+    return _KEY_MIN <= v < _KEY_MAX
+
+def _is_timestamp(v):
+    if not isinstance(v, str) or not _TIMESTAMP.fullmatch(v):
+        return False
+    try:
+        datetime.fromisoformat(v)
+    except ValueError:
+        return False
+    return True
+
+def _check(value, field, valid):
+    if value is None:
+        return f"missing:{field}", f"{field} is missing"
+    if not valid(value):
+        return f"invalid:{field}", f"{field} is not valid: {value!r}"
+    return None
+
+def _fits(v, limit, scale):
+    # Whether the NUMERIC column takes v: rounded to `scale` decimals, its magnitude is below `limit`.
+    if type(v) is int:
+        return -limit < v < limit
+    if type(v) is float:  # NaN and infinities fail the first test
+        return -limit < v < limit and abs(round(v, scale)) < limit
+    if not isinstance(v, str) or "_" in v:
+        return False
+    try:
+        d = Decimal(v)
+    except InvalidOperation:
+        return False
+    return d.is_finite() and abs(d) < limit and abs(d.quantize(Decimal(1).scaleb(-scale), ROUND_HALF_UP)) < limit
+
+def _check_numbers(obj, fields, prefix=""):
+    for field, (limit, scale) in fields:
+        v = obj.get(field)
+        if v is not None and not _fits(v, limit, scale):
+            return f"invalid:{prefix}{field}", f"{prefix}{field} is not valid: {v!r}"
+    return None
+
+# Numeric fields per part of an order, with the (limit, scale) of their column:
+# NUMERIC(12,2) for amounts, NUMERIC(12,3) for quantities, NUMERIC(7,4) for tax rates.
+_MONEY, _QUANTITY, _RATE = (10**10, 2), (10**9, 3), (10**3, 4)
+_TAX_NUMBERS = (("Amount", _MONEY), ("Rate", _RATE))
+_NUMBERS = {
+    "order": (("SubTotal", _MONEY), ("ShippingTotal", _MONEY), ("DiscountTotal", _MONEY), ("OrderTotal", _MONEY)),
+    "LineItems": (
+        ("QuantityOrdered", _QUANTITY), ("QuantityInvoiced", _QUANTITY), ("QuantityShipped", _QUANTITY),
+        ("QuantityCancelled", _QUANTITY), ("QuantityReturned", _QUANTITY),
+        ("UnitPrice", _MONEY), ("UnitDiscount", _MONEY), ("SubTotal", _MONEY), ("TotalTax", _MONEY), ("Total", _MONEY),
+    ),
+    "Taxes": _TAX_NUMBERS,
+    "ShippingTaxes": _TAX_NUMBERS,
+    "OrderPayments": (("Amount", _MONEY), ("AmountAuthorized", _MONEY), ("AmountCaptured", _MONEY)),
+}
+
+# Other typed fields of child rows, checked when present.
+_OPTIONAL = {
+    "LineItems": (("IsPreOrder", lambda v: type(v) is bool),),
+    "OrderPayments": (("PaymentId", _is_key),),
+}
+
+# Lists of child rows and the key each element needs.
+_CHILDREN = (
+    ("LineItems", "InternalLineItemId"), ("Taxes", "InternalTaxRateId"),
+    ("ShippingTaxes", "InternalTaxRateId"), ("OrderPayments", "InternalOrderPaymentId"),
+)
+
+def validate(r):
+    """Return (error class, reason) for an order the loaders would reject, or None."""
+    if not isinstance(r, dict):
+        return "invalid:order", f"expected an object, got {type(r).__name__}"
+    error = (
+        _check(r.get("InternalOrderId"), "InternalOrderId", _is_key)
+        or _check(r.get("OrderDateUtc"), "OrderDateUtc", _is_timestamp)
+        or _check(r.get("LastUpdatedDateUtc"), "LastUpdatedDateUtc", _is_timestamp)
+    )
+    if error:
+        return error
+    if r.get("DeadlineDateUtc") is not None and not _is_timestamp(r["DeadlineDateUtc"]):
+        return "invalid:DeadlineDateUtc", f"DeadlineDateUtc is not valid: {r['DeadlineDateUtc']!r}"
+    error = _check_numbers(r, _NUMBERS["order"])
+    if error:
+        return error
+    cust = r.get("BillingCustomer")
+    if cust:
+        if not isinstance(cust, dict):
+            return "invalid:BillingCustomer", "BillingCustomer is not an object"
+        error = _check(cust.get("InternalCustomerId"), "BillingCustomer.InternalCustomerId", _is_key)
+        if error:
+            return error
+    for key in ("BillingAddress", "ShippingAddress"):
+        a = r.get(key)
+        if a and not isinstance(a, dict):
+            return f"invalid:{key}", f"{key} is not an object"
+        if a and a.get("Id") is not None and not _is_key(a["Id"]):
+            return f"invalid:{key}.Id", f"{key}.Id is not valid: {a['Id']!r}"
+    for items, id_field in _CHILDREN:
+        for i, item in enumerate(r.get(items) or ()):
+            if not isinstance(item, dict):
+                return f"invalid:{items}", f"{items}[{i}] is not an object"
+            error = (
+                _check(item.get(id_field), f"{items}.{id_field}", _is_key)
+                or _check_numbers(item, _NUMBERS[items], f"{items}.")
+            )
+            if error:
+                return error
+            for field, valid in _OPTIONAL.get(items, ()):
+                v = item.get(field)
+                if v is not None and not valid(v):
+                    return f"invalid:{items}.{field}", f"{items}.{field} is not valid: {v!r}"
+            if items == "LineItems":
+                for j, tax in enumerate(item.get("Taxes") or ()):
+                    if not isinstance(tax, dict):
+                        return "invalid:LineItems.Taxes", f"LineItems[{i}].Taxes[{j}] is not an object"
+                    error = (
+                        _check(tax.get("InternalTaxRateId"), "LineItems.Taxes.InternalTaxRateId", _is_key)
+                        or _check_numbers(tax, _TAX_NUMBERS, "LineItems.Taxes.")
+                    )
+                    if error:
+                        return error
+    return None
+
+def split_valid(records):
+    """Split a batch into the orders that can be loaded and (error class, reason, order) rejects."""
+    valid, rejects = [], []
+    for r in records:
+        error = validate(r)
+        if error is None:
+            valid.append(r)
+        else:
+            rejects.append((*error, r))
+    return valid, rejects
+
+
+def decompose(records):
+    """Walk each order once and emit the rows for every table.
+
+    Customers and addresses are de-duplicated by key; the last occurrence wins.
+    What lands in orders.raw depends on RAW_MODE; archived documents are
+    de-duplicated by digest.
+    """
+    mode = config.RAW_MODE
+    dumps = codec.get().dumps
+    if mode not in RAW_MODES:
+        raise ValueError(f"Unknown RAW_MODE {mode!r}; expected one of {RAW_MODES}")
+    customers, addresses, archive = {}, {}, {}
+    orders, line_items, order_taxes = [], [], []
+    line_item_taxes, shipping_taxes, payments = [], [], []
+    add_order, add_line_item, add_tax = orders.append, line_items.append, order_taxes.append
+    add_line_item_tax, add_shipping_tax, add_payment = line_item_taxes.append, shipping_taxes.append, payments.append
+
+    for r in records:
+        oid = as_key(r["InternalOrderId"])
+
+        cust = r.get("BillingCustomer")
+        cid = None
+        if cust:
+            row = _customer_tuple(cust)
+            cid = row[0]
+            customers[cid] = row
+
+        for part in ("BillingAddress", "ShippingAddress"):
+            a = r.get(part)
+            if a and a.get("Id") is not None:
+                row = _addr_tuple(a)
+                addresses[row[0]] = row
+
+        if mode == "full":
+            add_order(_order_tuple(r, cid, dumps(r)))
+        elif mode == "unmapped":
+            rest = unmapped(r)
+            add_order(_order_tuple(r, cid, rest and dumps(rest)))
+        elif mode == "archive":
+            digest, body = archived(r)
+            archive[digest] = body
+            add_order(_order_tuple(r, cid, raw_digest=digest))
+        else:
+            add_order(_order_tuple(r, cid))
+        for li in (r.get("LineItems") or ()):
+            add_line_item(_line_item_tuple(li, oid, r["OrderDateUtc"]))
+            for t in (li.get("Taxes") or ()):
+                add_line_item_tax(_line_item_tax_tuple(t, as_key(li["InternalLineItemId"]), oid))
+        for t in (r.get("Taxes") or ()):
+            add_tax(_tax_tuple(t, oid))
+        for t in (r.get("ShippingTaxes") or ()):
+            add_shipping_tax(_tax_tuple(t, oid))
+        for p in (r.get("OrderPayments") or ()):
+            add_payment(_payment_tuple(p, oid))
+
+    return RowBatch(
+        list(customers.values()), list(addresses.values()), orders, line_items, order_taxes,
+        line_item_taxes, shipping_taxes, payments, list(archive.items()),
+    )
@@ -0,0 +1,328 @@
+"""Resident loader for a drop directory.
+
+    INPUT_PATH=/data/inbox python -m etl.watch
+
+Files are claimed by renaming them into processing/<host>-<pid>/ (so two
+watchers never load the same file), loaded over one long-lived connection
+and moved to done/ or failed/. Files that land close together share one
+commit. Writers should create files under a hidden or *.tmp / *.part name
+and rename them into place once complete. SIGTERM/SIGINT stop the watcher after the group
+in flight.
+"""
+import ctypes
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+
+from etl import config
+from etl.cache import dimension_caches, cache_stats
+from etl.db import connect
+from etl.incremental import MODES as INCREMENTAL_MODES, ChangeFilter
+from etl.loaders.engine import OUTCOMES
+from etl.main import write_reports
+from etl.metrics import METRICS
+from etl.partitions import forget as forget_partitions, prepare as prepare_partitions
+from etl.pipeline import load_file
+from etl.state import get_watermark, save_watermark
+
+logger = logging.getLogger("etl")
+
+MODES = ("auto", "inotify", "poll")
+FOLDERS = ("processing", "done", "failed")
+PARTIAL = (".tmp", ".part")
+# <sys/inotify.h>
+IN_CLOSE_WRITE, IN_MOVED_TO = 0x08, 0x80
+
+
+class Poller:
+    """Wakes up every `timeout` seconds; the caller rescans the directory."""
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+
+    def close(self):
+        pass
+
+
+class Inotify:
+    """Wakes up as soon as a file is written or moved into `path` (Linux only)."""
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout):
+        if select.select([self.fd], [], [], timeout)[0]:
+            try:
+                while os.read(self.fd, 64 * 1024):  # the events themselves don't matter; we rescan
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def waiter(path, mode="auto"):
+    if mode not in MODES:
+        raise ValueError(f"Unknown WATCH_MODE {mode!r}; expected one of {MODES}")
+    if mode != "poll":
+        try:
+            return Inotify(path)
+        except (OSError, AttributeError) as e:  # AttributeError: libc without inotify
+            if mode == "inotify":
+                raise
+            logger.info("inotify unavailable (%s); polling %s every %ss", e, path, config.WATCH_POLL_S)
+    return Poller()
+
+
+def pending(inbox):
+    """Complete files waiting in `inbox`, oldest first."""
+    found = []
+    for e in os.scandir(inbox):
+        if e.name.startswith(".") or e.name.endswith(PARTIAL):
+            continue
+        try:
+            if e.is_file():
+                found.append((e.stat().st_mtime, e.name, e.path))
+        except FileNotFoundError:  # claimed by another watcher meanwhile
+            pass
+    return [path for _, _, path in sorted(found)]
+
+def claim(path, folder):
+    """Atomically move `path` into `folder`; None if another watcher got it first."""
+    target = os.path.join(folder, os.path.basename(path))
+    try:
+        os.rename(path, target)
+    except FileNotFoundError:
+        return None
+    return target
+
+def move(path, folder):
+    """Move `path` into `folder`, keeping an earlier file of the same name."""
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.exists(target):
+        target += time.strftime(".%Y%m%dT%H%M%S", time.gmtime())
+    os.replace(path, target)
+    return target
+
+
+def _abandoned(name, host):
+    # Whether processing/<name> belongs to a watcher on this host that is gone.
+    owner, _, pid = name.rpartition("-")
+    if owner != host or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return True  # an earlier run under the same pid (a restarted container)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:  # alive, someone else's
+        pass
+    return False
+
+
+class Watcher:
+    """Claims, loads and files away whatever lands in `inbox`, until `stop` is set."""
+
+    def __init__(self, inbox, stop=None):
+        self.inbox = inbox
+        self.stop = stop or threading.Event()
+        self.folders = {name: os.path.join(inbox, name) for name in FOLDERS}
+        self.host = socket.gethostname()
+        # Only this watcher moves files in or out of its own folder.
+        self.claimed = os.path.join(self.folders["processing"], f"{self.host}-{os.getpid()}")
+        for folder in (*self.folders.values(), self.claimed):
+            os.makedirs(folder, exist_ok=True)
+        self.conn = None
+        self.caches = None
+        self.changes = None
+        self.totals = Counter()
+
+    def _connect(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = connect()
+            with self.conn.cursor() as cur:
+                self.caches = dimension_caches(cur)
+                self._reset_changes(cur)
+            self.conn.commit()
+        return self.conn
+
+    def _reset_changes(self, cur):
+        if config.INCREMENTAL != "off":
+            self.changes = ChangeFilter(get_watermark(cur, config.SOURCE_NAME), config.INCREMENTAL == "watermark")
+
+    def _rollback(self):
+        """Undo a failed group; the caches, high-water mark and known partitions may hold what it rolled back."""
+        if self.conn is None or self.conn.closed:
+            return
+        self.conn.rollback()
+        forget_partitions()
+        for cache in (self.caches or {}).values():
+            cache.clear()
+        with self.conn.cursor() as cur:
+            self._reset_changes(cur)
+        self.conn.commit()
+
+    def _disconnect(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+        forget_partitions()
+
+    def requeue(self, paths):
+        """Put claimed files back into the inbox."""
+        for path in paths:
+            logger.warning("Re-queueing %s", path)
+            try:
+                move(path, self.inbox)
+            except OSError:
+                logger.exception("Could not re-queue %s", path)
+
+    def recover(self):
+        """Re-queue what stopped watchers on this host left in processing/.
+
+        Folders of watchers on other hosts are theirs to recover.
+        """
+        processing = self.folders["processing"]
+        self.requeue(pending(processing))  # claimed before watchers had folders of their own
+        for e in os.scandir(processing):
+            if e.is_dir() and _abandoned(e.name, self.host):
+                self.requeue(pending(e.path))
+                try:
+                    os.rmdir(e.path)
+                except OSError:  # not empty: a file failed to move, or landed meanwhile
+                    pass
+        os.makedirs(self.claimed, exist_ok=True)
+
+    def file_away(self, path, folder):
+        try:
+            move(path, self.folders[folder])
+        except OSError:
+            logger.exception("Could not move %s to %s/", path, folder)
+
+    def claim_group(self, wake):
+        """Claim files until WATCH_BATCH_BYTES are in hand or WATCH_BATCH_WAIT_S passed since the first."""
+        group, size, deadline = [], 0, None
+        while not self.stop.is_set():
+            for path in pending(self.inbox):
+                claimed = claim(path, self.claimed)
+                if claimed is None:
+                    continue
+                group.append(claimed)
+                size += os.path.getsize(claimed)
+                if size >= config.WATCH_BATCH_BYTES:
+                    return group
+            if group and deadline is None:
+                deadline = time.monotonic() + config.WATCH_BATCH_WAIT_S
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return group
+                wake.wait(min(left, config.WATCH_POLL_S))
+            else:
+                wake.wait(config.WATCH_POLL_S)
+        return group
+
+    def load_group(self, paths):
+        """Load `paths` in one transaction; returns their totals."""
+        conn = self._connect()
+        totals = Counter()
+        with conn.cursor() as cur:
+            for path in paths:
+                totals.update(load_file(cur, path, self.changes, self.caches))
+            if self.changes is not None:
+                save_watermark(cur, config.SOURCE_NAME, self.changes.high_water_mark)
+        with METRICS.stage("commit"):
+            conn.commit()
+        return totals
+
+    def process(self, paths):
+        """Load a claimed group and file it away; a failing group is retried file by file."""
+        landed = min(os.path.getmtime(p) for p in paths)
+        try:
+            totals = self.load_group(paths)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The database, not the data: keep the files for the next attempt.
+            logger.exception("Lost the database connection; re-queueing %s files", len(paths))
+            self._disconnect()
+            self.requeue(paths)
+            self.stop.wait(config.WATCH_POLL_S)
+            return
+        except Exception:
+            self._rollback()
+            if len(paths) == 1:
+                logger.exception("Failed to load %s", paths[0])
+                self.file_away(paths[0], "failed")
+                self.totals["files.failed"] += 1
+                return
+            logger.warning("Loading %s files together failed; retrying them one by one", len(paths))
+            totals = None
+        if totals is None:
+            for path in paths:
+                self.process([path])
+            return
+        for path in paths:
+            self.file_away(path, "done")
+        totals["files.done"] += len(paths)
+        self.totals.update(totals)
+        logger.info(
+            "Loaded %s file(s): %s orders in %.3fs since the first landed",
+            len(paths), sum(totals[f"orders.{k}"] for k in OUTCOMES), time.time() - landed,
+        )
+
+    def run(self):
+        if config.INCREMENTAL not in INCREMENTAL_MODES:
+            raise ValueError(f"Unknown INCREMENTAL mode {config.INCREMENTAL!r}; expected one of {INCREMENTAL_MODES}")
+        if config.LOAD_ENGINE == "asyncpg":
+            raise ValueError("Watch mode loads through psycopg2; use LOAD_ENGINE=values or copy")
+        prepare_partitions()
+        started = time.time()
+        wake = waiter(self.inbox, config.WATCH_MODE)
+        logger.info("Watching %s (%s)", self.inbox, type(wake).__name__.lower())
+        self.recover()
+        try:
+            self._connect()
+            while not self.stop.is_set():
+                group = self.claim_group(wake)
+                if group:
+                    self.process(group)
+                    write_reports(self.totals + cache_stats(self.caches), started, "ok")
+        finally:
+            wake.close()
+            self._disconnect()
+            try:
+                os.rmdir(self.claimed)
+            except OSError:
+                pass
+        return self.totals
+
+
+def main():
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    if not os.path.isdir(config.INPUT_PATH):
+        logger.error("INPUT_PATH %s is not a directory", config.INPUT_PATH)
+        return 2
+    totals = Watcher(config.INPUT_PATH, stop).run()
+    logger.info("Watcher stopped: %s files loaded, %s failed", totals["files.done"], totals["files.failed"])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())